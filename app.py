@@ -1,13 +1,44 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, g, abort, send_from_directory, stream_with_context, has_app_context, before_render_template, template_rendered
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.pagination import Pagination
+from markupsafe import Markup, escape
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
+from werkzeug.middleware.proxy_fix import ProxyFix
 import markdown
 import os
-from datetime import datetime
+import time
+import hashlib
+import re
+import tempfile
+import base64
+import binascii
+import gzip
+import hmac
+import io
+import json
+import mimetypes
+import random
+import threading
+from datetime import datetime, timedelta
 import uuid
+from collections import namedtuple
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
 from slugify import slugify
 import google.generativeai as genai
+from page_cache import create_page_cache
+from sitemap import SitemapStore, url_entry
+from images import InvalidImage, WIDTH_VARIANTS, generate_variants, probe, strip_metadata
+from storage import content_key, create_storage, is_content_key
+from assets import AssetManifest
+from compression import COMPRESSIBLE_TYPES, compress, minify_html, negotiate
+from submissions import SubmissionFilter, SubmissionQueue
+from generation import Completion, FakeBackend, GeminiBackend, GenerationError, RecordingBackend, generate_draft, sse, stream_draft
+from instrumentation import PerfRegistry, RequestTiming, profile_report, server_timing, start_profile
+from metrics import Registry
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key-here')
@@ -45,30 +76,234 @@ if 'postgresql' in app.config['SQLALCHEMY_DATABASE_URI']:
     app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
         'pool_pre_ping': True,
         'pool_recycle': 300,
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
         'connect_args': {'connect_timeout': 10}
     }
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+# Threads rendering image variants after an upload; 0 renders them inline once the upload commits
+app.config['IMAGE_WORKERS'] = int(os.environ.get('IMAGE_WORKERS', 2))
+# Where uploads live: 'local' (UPLOAD_FOLDER, served from /static/uploads) or 's3' (any S3-compatible store)
+app.config['UPLOAD_STORAGE'] = os.environ.get('UPLOAD_STORAGE', 'local')
+app.config['UPLOAD_S3_BUCKET'] = os.environ.get('UPLOAD_S3_BUCKET')
+app.config['UPLOAD_S3_PREFIX'] = os.environ.get('UPLOAD_S3_PREFIX', '')
+app.config['UPLOAD_S3_PUBLIC_URL'] = os.environ.get('UPLOAD_S3_PUBLIC_URL')
+app.config['UPLOAD_S3_ENDPOINT_URL'] = os.environ.get('UPLOAD_S3_ENDPOINT_URL')
+# Unreferenced uploads younger than this survive garbage collection (an editor may still be writing the post)
+app.config['UPLOAD_GC_GRACE_HOURS'] = int(os.environ.get('UPLOAD_GC_GRACE_HOURS', 24))
+# Seconds a worker trusts its in-memory caches before re-checking their version stamp
+app.config['CACHE_VERSION_CHECK_INTERVAL'] = int(os.environ.get('CACHE_VERSION_CHECK_INTERVAL', 5))
+# Full-page cache for anonymous visitors: 'memory' (per worker), 'filesystem' (shared by workers) or 'none'
+app.config['PAGE_CACHE_BACKEND'] = os.environ.get('PAGE_CACHE_BACKEND', 'memory')
+app.config['PAGE_CACHE_DIR'] = os.environ.get('PAGE_CACHE_DIR', os.path.join(app.instance_path, 'page_cache'))
+app.config['PAGE_CACHE_MAX_ENTRIES'] = int(os.environ.get('PAGE_CACHE_MAX_ENTRIES', 512))
+app.config['PAGE_CACHE_TTL'] = int(os.environ.get('PAGE_CACHE_TTL', 300))
+# Canonical address of the blog for sitemaps and robots.txt, which never trust the request's Host header
+app.config['SITE_URL'] = os.environ.get('SITE_URL', 'http://localhost:5000').rstrip('/')
+# Pre-generated gzip sitemaps; above SITEMAP_MAX_URLS they are split behind a sitemap index
+app.config['SITEMAP_DIR'] = os.environ.get('SITEMAP_DIR', os.path.join(app.instance_path, 'sitemaps'))
+app.config['SITEMAP_MAX_URLS'] = int(os.environ.get('SITEMAP_MAX_URLS', 50000))
+# Minified HTML and gzip/brotli responses above COMPRESS_MIN_SIZE bytes, for serving clients without nginx
+app.config['HTML_MINIFY'] = os.environ.get('HTML_MINIFY', '1') == '1'
+app.config['COMPRESS_RESPONSES'] = os.environ.get('COMPRESS_RESPONSES', '1') == '1'
+app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+# Comments and contact messages are spooled here and written in batches every
+# SUBMISSION_FLUSH_INTERVAL seconds (0 writes them during the request)
+app.config['SUBMISSION_QUEUE_DIR'] = os.environ.get('SUBMISSION_QUEUE_DIR', os.path.join(app.instance_path, 'submissions'))
+app.config['SUBMISSION_FLUSH_INTERVAL'] = float(os.environ.get('SUBMISSION_FLUSH_INTERVAL', 1))
+app.config['SUBMISSION_BATCH_SIZE'] = int(os.environ.get('SUBMISSION_BATCH_SIZE', 200))
+# Reverse proxies in front of the app whose X-Forwarded-For and X-Forwarded-Proto headers are
+# trusted; the nginx deployments set 1. Left at 0 when clients can reach gunicorn directly,
+# or anyone could pick their own address and scheme.
+app.config['TRUSTED_PROXIES'] = int(os.environ.get('TRUSTED_PROXIES', 0))
+# Submissions allowed per client address and per post (or form) in any minute
+app.config['SUBMISSION_RATE_PER_IP'] = int(os.environ.get('SUBMISSION_RATE_PER_IP', 5))
+app.config['SUBMISSION_RATE_PER_TARGET'] = int(os.environ.get('SUBMISSION_RATE_PER_TARGET', 30))
+# AI drafts are generated by background jobs: GENERATION_WORKERS drafts at a time per process
+# (0 generates during the request), each failing after GENERATION_TIMEOUT seconds.
+# GENERATION_BACKEND 'fake' answers without calling Gemini.
+app.config['GENERATION_BACKEND'] = os.environ.get('GENERATION_BACKEND', 'gemini')
+app.config['GENERATION_MODEL'] = os.environ.get('GENERATION_MODEL', 'gemini-1.5-pro')
+app.config['GENERATION_WORKERS'] = int(os.environ.get('GENERATION_WORKERS', 2))
+app.config['GENERATION_TIMEOUT'] = int(os.environ.get('GENERATION_TIMEOUT', 120))
+# Drafts streamed at once per worker process; each holds a gunicorn thread while the model
+# writes, so further editors are sent to the background job endpoint instead
+app.config['GENERATION_MAX_STREAMS'] = int(os.environ.get('GENERATION_MAX_STREAMS', 2))
+# Model responses are cached in the database for GENERATION_CACHE_TTL hours, keeping at most
+# GENERATION_CACHE_MAX_ENTRIES (least recently used go first)
+app.config['GENERATION_CACHE_TTL'] = int(os.environ.get('GENERATION_CACHE_TTL', 24 * 7))
+app.config['GENERATION_CACHE_MAX_ENTRIES'] = int(os.environ.get('GENERATION_CACHE_MAX_ENTRIES', 1000))
+# Server-Timing headers with query count and SQL/template/Markdown time: 'admin' (admin sessions only), 'all' or 'off'
+app.config['SERVER_TIMING'] = os.environ.get('SERVER_TIMING', 'admin')
+# Percentage of requests run under cProfile; the latest profiles are listed on /admin/perf
+app.config['PROFILE_SAMPLE_PERCENT'] = float(os.environ.get('PROFILE_SAMPLE_PERCENT', 0))
+# Prometheus metrics at /metrics. Every worker writes its samples under METRICS_DIR, which the
+# workers must share. Scrapers send METRICS_TOKEN as a bearer token; without a token the
+# endpoint only answers in debug and testing.
+app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR', os.path.join(app.instance_path, 'metrics'))
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
 
 db = SQLAlchemy(app)
 
+# Behind nginx every request comes from the proxy; take the client's address and scheme from the
+# headers it sets, or rate limits would be shared by every visitor
+if app.config['TRUSTED_PROXIES']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'], x_proto=app.config['TRUSTED_PROXIES'])
+
 # Ensure upload directory exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# Instrumentation. Every request counts its queries and times its SQL, template and Markdown
+# rendering; the figures aggregate per route in this worker for /admin/perf. These hooks are
+# registered first, so the timing starts before the page cache is consulted and ends after
+# compression.
+perf_registry = PerfRegistry()
+
+# Prometheus metrics. Samples go to this worker's memory-mapped file in METRICS_DIR (a float
+# update, no I/O on the request path) and /metrics sums the files of every worker.
+metrics_registry = Registry(app.config['METRICS_DIR'])
+http_requests = metrics_registry.counter('modernblog_http_requests', 'HTTP requests by route and status code',
+                                         ('method', 'route', 'status'))
+http_request_duration = metrics_registry.histogram('modernblog_http_request_duration_seconds',
+                                                   'Time to produce the response', ('method', 'route'))
+http_request_queries = metrics_registry.histogram('modernblog_http_request_queries', 'SQL statements per request',
+                                                  ('method', 'route'), buckets=(0, 1, 2, 5, 10, 20, 50, 100))
+page_cache_lookups = metrics_registry.counter('modernblog_page_cache_lookups', 'Full-page cache lookups', ('result',))
+db_pool_connections = metrics_registry.gauge('modernblog_db_pool_connections',
+                                             'Pooled database connections by state, over all workers', ('state',))
+db_pool_limit = metrics_registry.gauge('modernblog_db_pool_limit',
+                                       'Connections the pools may open (pool_size plus max_overflow), over all workers')
+upload_size = metrics_registry.histogram('modernblog_upload_bytes', 'Size of uploaded images', ('format',),
+                                         buckets=tuple(2 ** power for power in range(14, 25, 2)))
+generation_call_duration = metrics_registry.histogram(
+    'modernblog_generation_call_duration_seconds', 'Gemini calls and cache hits by draft part and outcome',
+    ('part', 'status'), buckets=(0.01, 0.1, 0.5, 1, 2.5, 5, 10, 20, 40, 80, 160))
+generation_tokens = metrics_registry.counter('modernblog_generation_tokens', 'Gemini tokens by draft part and direction',
+                                             ('part', 'direction'))
+
+def current_timing():
+    return g.get('request_timing') if has_app_context() else None
+
+@app.before_request
+def start_request_timing():
+    g.request_timing = RequestTiming()
+    percent = app.config['PROFILE_SAMPLE_PERCENT']
+    if percent and random.random() * 100 < percent:
+        g.request_timing.profiler = start_profile()
+
+@app.after_request
+def finish_request_timing(response):
+    timing = g.pop('request_timing', None)
+    if timing is None:
+        return response
+    duration = timing.elapsed()
+    rule = request.url_rule.rule if request.url_rule else '<unmatched>'
+    route = f'{request.method} {rule}'
+    if timing.profiler is not None:
+        perf_registry.add_profile(f'{request.method} {request.full_path.rstrip("?")}', duration, profile_report(timing.profiler))
+    perf_registry.record(route, timing, duration)
+    http_requests.inc(method=request.method, route=rule, status=response.status_code)
+    http_request_duration.observe(duration, method=request.method, route=rule)
+    http_request_queries.observe(timing.queries, method=request.method, route=rule)
+    mode = app.config['SERVER_TIMING']
+    # Only looks at sessions the request already loaded, so static files do not gain Vary: Cookie
+    if mode == 'all' or (mode == 'admin' and session.accessed and session.get('admin')):
+        response.headers['Server-Timing'] = server_timing(timing, duration)
+    return response
+
+@db.event.listens_for(Engine, 'before_cursor_execute')
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.query_started = time.perf_counter()
+
+@db.event.listens_for(Engine, 'after_cursor_execute')
+def _record_query_time(conn, cursor, statement, parameters, context, executemany):
+    timing = current_timing()
+    if timing is not None and context is not None:
+        timing.add_query(statement, time.perf_counter() - context.query_started)
+
+@before_render_template.connect_via(app)
+def _start_template_timer(sender, template, context, **extra):
+    timing = current_timing()
+    if timing is not None:
+        timing.template_started = time.perf_counter()
+
+@template_rendered.connect_via(app)
+def _record_template_time(sender, template, context, **extra):
+    timing = current_timing()
+    if timing is not None and timing.template_started is not None:
+        timing.template += time.perf_counter() - timing.template_started
+
+def _record_pool_usage(pool):
+    # QueuePool is the only pool with a bound; SQLite in memory and NullPool have none to saturate
+    if not isinstance(pool, QueuePool):
+        return
+    def record(*args):
+        db_pool_connections.set(pool.checkedout(), state='checked_out')
+        db_pool_connections.set(pool.checkedin(), state='idle')
+        db_pool_connections.set(max(pool.overflow(), 0), state='overflow')
+        db_pool_limit.set(pool.size() + max(pool._max_overflow, 0))
+    for name in ('checkout', 'checkin'):
+        db.event.listen(pool, name, record)
+
+with app.app_context():
+    _record_pool_usage(db.engine.pool)
+
+# Static assets. url_for('static', ...) emits content-fingerprinted names from the manifest
+# (built by build_assets.py, or hashed here at startup); those URLs never change meaning, so
+# they are served as immutable for a year.
+static_assets = AssetManifest(app.static_folder)
+STATIC_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+@app.url_defaults
+def fingerprint_static_urls(endpoint, values):
+    if endpoint == 'static' and 'filename' in values:
+        values['filename'] = static_assets.url_path(values['filename'])
+
+def _precompressed(filename):
+    """The .br/.gz sibling written by build_assets.py that this client accepts, if any"""
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[encoding] > 0 and os.path.isfile(os.path.join(app.static_folder, filename + suffix)):
+            return encoding, filename + suffix
+    return None, None
+
+def static_file(filename):
+    original = static_assets.original(filename)
+    if original is None:
+        return app.send_static_file(filename)
+    # A built copy exists on disk after build_assets.py; without one, serve the source file
+    built = os.path.isfile(os.path.join(app.static_folder, filename))
+    encoding, sibling = _precompressed(filename) if built else (None, None)
+    if encoding:
+        response = send_from_directory(app.static_folder, sibling, mimetype=mimetypes.guess_type(filename)[0])
+        response.headers['Content-Encoding'] = encoding
+    else:
+        response = app.send_static_file(filename if built else original)
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.max_age = STATIC_IMMUTABLE_MAX_AGE
+    response.cache_control.immutable = True
+    response.cache_control.no_cache = None
+    return response
+
+app.view_functions['static'] = static_file
+
 # Template context processor
 @app.context_processor
 def inject_template_vars():
-    return {
-        'current_year': datetime.now().year,
-        'site_name': Setting.get('site_name', 'ModernBlog'),
-        'categories': Category.query.all(),
-        'menu_items': MenuItem.query.filter_by(active=True).order_by(MenuItem.order).all(),
-        'tracking_code': Setting.get('tracking_code'),
-        'ads_header': Setting.get('ads_header'),
-        'ads_content': Setting.get('ads_content'),
-        'ads_sidebar': Setting.get('ads_sidebar'),
-        'ads_footer': Setting.get('ads_footer')
-    }
+    return dict(get_site_chrome(), current_year=datetime.now().year)
+
+def render_markdown(text):
+    started = time.perf_counter()
+    html = markdown.markdown(text, extensions=['codehilite', 'fenced_code'])
+    timing = current_timing()
+    if timing is not None:
+        timing.markdown += time.perf_counter() - started
+    return html
+
+def content_digest(text):
+    return hashlib.sha256((text or '').encode('utf-8')).hexdigest()
 
 # Models
 class Category(db.Model):
@@ -84,7 +319,9 @@ class Tag(db.Model):
 
 post_tags = db.Table('post_tags',
     db.Column('post_id', db.Integer, db.ForeignKey('post.id'), primary_key=True),
-    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True)
+    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True),
+    # The primary key leads with post_id; tag pages look posts up by tag
+    db.Index('ix_post_tags_tag_id', 'tag_id', 'post_id')
 )
 
 class Post(db.Model):
@@ -92,22 +329,71 @@ class Post(db.Model):
     title = db.Column(db.String(200), nullable=False)
     slug = db.Column(db.String(200), nullable=False, unique=True)
     content = db.Column(db.Text, nullable=False)
+    content_html = db.Column(db.Text)
+    content_hash = db.Column(db.String(64))
     excerpt = db.Column(db.Text)
     cover_image = db.Column(db.String(200))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     published = db.Column(db.Boolean, default=False)
     category_id = db.Column(db.Integer, db.ForeignKey('category.id'))
-    tags = db.relationship('Tag', secondary=post_tags, lazy='subquery', backref=db.backref('posts', lazy=True))
+    # Kept in step by the Comment events below, so post pages never count their comments
+    approved_comment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    comments_changed_at = db.Column(db.DateTime)
+    tags = db.relationship('Tag', secondary=post_tags, lazy=True, backref=db.backref('posts', lazy=True))
+    cover_asset = db.relationship('ImageAsset', primaryjoin='foreign(Post.cover_image) == ImageAsset.filename',
+                                  viewonly=True, uselist=False)
     comments = db.relationship('Comment', backref='post', lazy=True, cascade='all, delete-orphan')
     
+    __table_args__ = (
+        # Backs keyset pagination of the public listings
+        db.Index('ix_post_published_created_at_id', 'published', 'created_at', 'id'),
+        db.Index('ix_post_category_published_created_at_id', 'category_id', 'published', 'created_at', 'id'),
+        # Unfiltered admin list
+        db.Index('ix_post_created_at_id', 'created_at', 'id'),
+    )
+    
     @property
     def html_content(self):
-        return markdown.markdown(self.content, extensions=['codehilite', 'fenced_code'])
+        if self.content_html is None:
+            return render_markdown(self.content)
+        return self.content_html
     
     @property
-    def approved_comments(self):
-        return Comment.query.filter_by(post_id=self.id, approved=True).order_by(Comment.created_at.desc()).all()
+    def cover(self):
+        """The cover's processed asset when there is one, otherwise the bare upload filename"""
+        return self.cover_asset or self.cover_image
+    
+    @property
+    def last_modified(self):
+        """When the post page last changed: an edit or a change to its approved comments"""
+        return max(filter(None, (self.updated_at, self.comments_changed_at)), default=None)
+
+def with_card_relations(query):
+    """Post cards show the category badge and tag chips, so load both with the page of posts"""
+    return query.options(db.joinedload(Post.category), db.selectinload(Post.tags), db.joinedload(Post.cover_asset))
+
+def category_post_counts(published_only=True):
+    query = db.session.query(Post.category_id, db.func.count(Post.id))
+    if published_only:
+        query = query.filter(Post.published == True)
+    return dict(query.group_by(Post.category_id).all())
+
+def recent_posts_by_category(limit=3):
+    """Newest ``limit`` published posts of every category in a single query"""
+    rank = db.func.row_number().over(
+        partition_by=Post.category_id,
+        order_by=(Post.created_at.desc(), Post.id.desc())
+    ).label('rank')
+    ranked = db.session.query(Post.id, rank).filter(Post.published == True, Post.category_id.isnot(None)).subquery()
+    posts = Post.query.options(db.load_only(Post.id, Post.title, Post.slug, Post.category_id)) \
+        .join(ranked, Post.id == ranked.c.id) \
+        .filter(ranked.c.rank <= limit) \
+        .order_by(Post.category_id, ranked.c.rank).all()
+    grouped = {}
+    for post in posts:
+        grouped.setdefault(post.category_id, []).append(post)
+    return grouped
 
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -117,6 +403,15 @@ class Comment(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     approved = db.Column(db.Boolean, default=False)
     post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False)
+    
+    __table_args__ = (
+        # Approved comments of a post, newest first
+        db.Index('ix_comment_post_approved_created_at', 'post_id', 'approved', 'created_at'),
+        # Moderation queue and the pending badge
+        db.Index('ix_comment_approved_created_at', 'approved', 'created_at'),
+        # Unfiltered admin list
+        db.Index('ix_comment_created_at_id', 'created_at', 'id'),
+    )
 
 class Setting(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -125,17 +420,22 @@ class Setting(db.Model):
     
     @staticmethod
     def get(key, default=''):
-        setting = Setting.query.filter_by(key=key).first()
-        return setting.value if setting else default
+        values = settings_cache.get()
+        return values[key] if key in values else default
     
     @staticmethod
     def set(key, value):
-        setting = Setting.query.filter_by(key=key).first()
-        if setting:
-            setting.value = value
-        else:
-            setting = Setting(key=key, value=value)
-            db.session.add(setting)
+        Setting.set_many({key: value})
+    
+    @staticmethod
+    def set_many(values):
+        existing = {s.key: s for s in Setting.query.filter(Setting.key.in_(list(values))).all()}
+        for key, value in values.items():
+            if key in existing:
+                existing[key].value = value
+            else:
+                db.session.add(Setting(key=key, value=value))
+        settings_cache.invalidate()
         db.session.commit()
 
 class Page(db.Model):
@@ -143,13 +443,33 @@ class Page(db.Model):
     title = db.Column(db.String(200), nullable=False)
     slug = db.Column(db.String(200), nullable=False, unique=True)
     content = db.Column(db.Text, nullable=False)
+    content_html = db.Column(db.Text)
+    content_hash = db.Column(db.String(64))
     published = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     @property
     def html_content(self):
-        return markdown.markdown(self.content, extensions=['codehilite', 'fenced_code'])
+        if self.content_html is None:
+            return render_markdown(self.content)
+        return self.content_html
+
+def refresh_rendered_content(target):
+    """Re-render Markdown only when the source actually changed; returns True if it did."""
+    digest = content_digest(target.content)
+    if target.content_html is not None and target.content_hash == digest:
+        return False
+    target.content_html = render_markdown(target.content)
+    target.content_hash = digest
+    return True
+
+@db.event.listens_for(Post, 'before_insert')
+@db.event.listens_for(Post, 'before_update')
+@db.event.listens_for(Page, 'before_insert')
+@db.event.listens_for(Page, 'before_update')
+def _render_content_before_flush(mapper, connection, target):
+    refresh_rendered_content(target)
 
 class Contact(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -159,6 +479,11 @@ class Contact(db.Model):
     message = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     read = db.Column(db.Boolean, default=False)
+    
+    __table_args__ = (
+        db.Index('ix_contact_read_created_at', 'read', 'created_at'),
+        db.Index('ix_contact_created_at_id', 'created_at', 'id'),
+    )
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -174,6 +499,96 @@ class User(db.Model):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+class ImageAsset(db.Model):
+    """An uploaded image with its dimensions and the variants rendered from it"""
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(200), nullable=False, unique=True)
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, ready or failed
+    variants = db.Column(db.Text)  # JSON: name -> {width, height, files: {format: storage key}}
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped when identical bytes are uploaded again, so garbage collection gives the new upload its grace period
+    uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    @property
+    def variant_map(self):
+        if self.status != 'ready' or not self.variants:
+            return {}
+        return json.loads(self.variants)
+    
+    def storage_keys(self):
+        keys = {self.filename}
+        for variant in self.variant_map.values():
+            keys.update(variant['files'].values())
+        return keys
+
+class UploadReference(db.Model):
+    """One row per upload a post, page or setting points at; uploads without any are garbage"""
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(200), nullable=False, index=True)
+    owner = db.Column(db.String(50), nullable=False, index=True)  # post:<id>, page:<id> or setting:<key>
+    
+    __table_args__ = (db.UniqueConstraint('owner', 'filename'),)
+
+class GenerationJob(db.Model):
+    """An AI draft being generated in the background; any worker can report its status"""
+    id = db.Column(db.String(32), primary_key=True, default=lambda: uuid.uuid4().hex)
+    topic = db.Column(db.String(500), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, done or failed
+    title = db.Column(db.String(500))
+    excerpt = db.Column(db.Text)
+    content = db.Column(db.Text)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    finished_at = db.Column(db.DateTime)
+    
+    def to_dict(self):
+        data = {'id': self.id, 'status': self.status}
+        if self.status == 'done':
+            data.update(title=self.title, excerpt=self.excerpt, content=self.content)
+        elif self.status == 'failed':
+            data['error'] = self.error
+        return data
+
+class GenerationCacheEntry(db.Model):
+    """A cached model response, keyed by prompt version, model and normalized prompt"""
+    key = db.Column(db.String(64), primary_key=True)
+    model = db.Column(db.String(100), nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    prompt_tokens = db.Column(db.Integer, nullable=False, default=0)
+    response_tokens = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class GenerationCall(db.Model):
+    """One model call (or cache hit) with its latency and token usage"""
+    id = db.Column(db.Integer, primary_key=True)
+    part = db.Column(db.String(20))  # title, excerpt or content
+    model = db.Column(db.String(100), nullable=False)
+    status = db.Column(db.String(20), nullable=False)  # ok, cached, failed or cancelled
+    latency_ms = db.Column(db.Integer, nullable=False)
+    prompt_tokens = db.Column(db.Integer, nullable=False, default=0)
+    response_tokens = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class GenerationUsage(db.Model):
+    """Daily totals of GenerationCall per part and status, maintained as calls are recorded"""
+    day = db.Column(db.Date, primary_key=True)
+    part = db.Column(db.String(20), primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    calls = db.Column(db.Integer, nullable=False, default=0)
+    latency_ms = db.Column(db.BigInteger, nullable=False, default=0)
+    prompt_tokens = db.Column(db.BigInteger, nullable=False, default=0)
+    response_tokens = db.Column(db.BigInteger, nullable=False, default=0)
+
+class ImportCheckpoint(db.Model):
+    """How far a bulk import of ``source`` has got, written in the same transaction as each batch"""
+    source = db.Column(db.String(500), primary_key=True)  # format:absolute path
+    position = db.Column(db.Integer, nullable=False, default=0)  # records consumed
+    first_post_id = db.Column(db.Integer, nullable=False)  # comments only attach to posts this import created
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class MenuItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
@@ -181,97 +596,1140 @@ class MenuItem(db.Model):
     order = db.Column(db.Integer, default=0)
     active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_menu_item_active_order', 'active', 'order'),
+    )
+
+class CacheVersion(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    stamp = db.Column(db.String(32), nullable=False)
+    
+    @staticmethod
+    def current(name):
+        return db.session.query(CacheVersion.stamp).filter_by(name=name).scalar()
+    
+    @staticmethod
+    def bump(name):
+        # Joins the caller's transaction so other workers only see the new stamp once the write commits
+        version = db.session.get(CacheVersion, name)
+        if not version:
+            version = CacheVersion(name=name)
+            db.session.add(version)
+        version.stamp = uuid.uuid4().hex
+        return version.stamp
+
+# Full-text search: FTS5 on SQLite, a generated tsvector column with a GIN index on PostgreSQL.
+# The FTS5 table only holds published posts so queries never need to join back to filter drafts.
+SEARCH_SNIPPET_START = '\x02'
+SEARCH_SNIPPET_END = '\x03'
+
+_sqlite_search_ddl = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS post_fts USING fts5(title, excerpt, content, tokenize='porter unicode61')",
+    # Title matches outweigh excerpt matches, which outweigh body matches
+    "INSERT INTO post_fts (post_fts, rank) VALUES ('rank', 'bm25(10.0, 5.0, 1.0)')",
+]
+_postgres_search_ddl = [
+    "ALTER TABLE post ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(excerpt, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(content, '')), 'C')) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_post_search_vector ON post USING GIN (search_vector)",
+]
+
+for _statement in _sqlite_search_ddl:
+    db.event.listen(Post.__table__, 'after_create', db.DDL(_statement).execute_if(dialect='sqlite'))
+for _statement in _postgres_search_ddl:
+    db.event.listen(Post.__table__, 'after_create', db.DDL(_statement).execute_if(dialect='postgresql'))
+db.event.listen(Post.__table__, 'before_drop', db.DDL('DROP TABLE IF EXISTS post_fts').execute_if(dialect='sqlite'))
+
+_search_index_ready = {}
+
+def search_index_ready(connection):
+    dialect = connection.dialect.name
+    if dialect not in _search_index_ready:
+        if dialect == 'sqlite':
+            found = connection.execute(db.text("SELECT 1 FROM sqlite_master WHERE name = 'post_fts'")).first()
+        elif dialect == 'postgresql':
+            found = connection.execute(db.text(
+                "SELECT 1 FROM information_schema.columns WHERE table_name = 'post' AND column_name = 'search_vector'")).first()
+        else:
+            found = None
+        _search_index_ready[dialect] = found is not None
+    return _search_index_ready[dialect]
+
+def ensure_search_index(connection):
+    """Create the search index on databases that predate it and populate it from existing posts"""
+    dialect = connection.dialect.name
+    _search_index_ready.pop(dialect, None)
+    if search_index_ready(connection):
+        return
+    if dialect == 'sqlite':
+        for statement in _sqlite_search_ddl:
+            connection.execute(db.text(statement))
+        connection.execute(db.text(
+            "INSERT INTO post_fts (rowid, title, excerpt, content) SELECT id, title, coalesce(excerpt, ''), content FROM post WHERE published"))
+    elif dialect == 'postgresql':
+        for statement in _postgres_search_ddl:
+            connection.execute(db.text(statement))
+    _search_index_ready[dialect] = dialect in ('sqlite', 'postgresql')
+
+def drop_search_index(connection):
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        connection.execute(db.text('DROP TABLE IF EXISTS post_fts'))
+    elif dialect == 'postgresql':
+        connection.execute(db.text('DROP INDEX IF EXISTS ix_post_search_vector'))
+        connection.execute(db.text('ALTER TABLE post DROP COLUMN IF EXISTS search_vector'))
+    _search_index_ready.pop(dialect, None)
+
+@db.event.listens_for(Post, 'after_insert')
+@db.event.listens_for(Post, 'after_update')
+def _index_post_for_search(mapper, connection, target):
+    # PostgreSQL maintains its generated column itself; FTS5 rows are kept in step here
+    if connection.dialect.name != 'sqlite' or not search_index_ready(connection):
+        return
+    state = db.inspect(target)
+    if state.has_identity and not any(state.attrs[name].history.has_changes() for name in ('title', 'excerpt', 'content', 'published')):
+        return
+    connection.execute(db.text('DELETE FROM post_fts WHERE rowid = :id'), {'id': target.id})
+    if not target.published:
+        return
+    connection.execute(db.text('INSERT INTO post_fts (rowid, title, excerpt, content) VALUES (:id, :title, :excerpt, :content)'),
+                       {'id': target.id, 'title': target.title, 'excerpt': target.excerpt or '', 'content': target.content})
+
+@db.event.listens_for(Post, 'after_delete')
+def _unindex_post_for_search(mapper, connection, target):
+    if connection.dialect.name == 'sqlite' and search_index_ready(connection):
+        connection.execute(db.text('DELETE FROM post_fts WHERE rowid = :id'), {'id': target.id})
+
+def fts5_match_expression(query):
+    # Quote every term so user input can never be parsed as FTS5 syntax; a trailing bare word
+    # matches as a prefix so results keep up while the reader is still typing
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\w+)', query):
+        if word:
+            terms.append('"%s"' % word)
+        else:
+            words = re.findall(r'\w+', phrase)
+            if words:
+                terms.append('"%s"' % ' '.join(words))
+    if terms and re.search(r'\w$', query):
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+def format_search_snippet(snippet):
+    if not snippet:
+        return None
+    html = str(escape(snippet)).replace(SEARCH_SNIPPET_START, '<mark>').replace(SEARCH_SNIPPET_END, '</mark>')
+    return Markup(html)
+
+class SearchPagination(Pagination):
+    """Relevance-ranked search results; ``snippets`` maps post id to highlighted HTML."""
+    
+    def _query_items(self):
+        query = self._query_args['query']
+        connection = db.session.connection()
+        dialect = connection.dialect.name
+        self.snippets = {}
+        if not search_index_ready(connection):
+            return self._like_query().order_by(Post.created_at.desc()).limit(self.per_page).offset(self._query_offset).all()
+        if dialect == 'sqlite':
+            match = fts5_match_expression(query)
+            if not match:
+                return []
+            rows = db.session.execute(db.text(
+                "SELECT rowid, snippet(post_fts, -1, :start, :end, '…', 24) FROM post_fts "
+                "WHERE post_fts MATCH :match ORDER BY rank LIMIT :limit OFFSET :offset"),
+                {'match': match, 'start': SEARCH_SNIPPET_START, 'end': SEARCH_SNIPPET_END,
+                 'limit': self.per_page, 'offset': self._query_offset}).all()
+        else:
+            options = f'StartSel={SEARCH_SNIPPET_START}, StopSel={SEARCH_SNIPPET_END}, MaxWords=35, MinWords=15'
+            # Rank and page in the subquery so ts_headline only runs on the rows being shown
+            rows = db.session.execute(db.text(
+                "SELECT hit.id, ts_headline('english', post.content, hit.query, :options) "
+                "FROM (SELECT post.id, post.created_at, ts_rank(post.search_vector, q) AS rank, q AS query "
+                "      FROM post, websearch_to_tsquery('english', :q) AS q "
+                "      WHERE post.published AND post.search_vector @@ q "
+                "      ORDER BY rank DESC, post.created_at DESC LIMIT :limit OFFSET :offset) AS hit "
+                "JOIN post ON post.id = hit.id "
+                "ORDER BY hit.rank DESC, hit.created_at DESC"),
+                {'q': query, 'options': options, 'limit': self.per_page, 'offset': self._query_offset}).all()
+        if not rows:
+            return []
+        posts = {post.id: post for post in with_card_relations(Post.query).filter(Post.id.in_([row[0] for row in rows])).all()}
+        self.snippets = {row[0]: format_search_snippet(row[1]) for row in rows}
+        return [posts[row[0]] for row in rows if row[0] in posts]
+    
+    def _query_count(self):
+        query = self._query_args['query']
+        connection = db.session.connection()
+        if not search_index_ready(connection):
+            return self._like_query().order_by(None).count()
+        if connection.dialect.name == 'sqlite':
+            match = fts5_match_expression(query)
+            if not match:
+                return 0
+            return db.session.execute(db.text(
+                "SELECT count(*) FROM post_fts WHERE post_fts MATCH :match"), {'match': match}).scalar()
+        return db.session.execute(db.text(
+            "SELECT count(*) FROM post, websearch_to_tsquery('english', :q) AS q "
+            "WHERE post.published AND post.search_vector @@ q"), {'q': query}).scalar()
+    
+    def _like_query(self):
+        query = self._query_args['query']
+        return with_card_relations(Post.query).filter(
+            Post.published == True,
+            db.or_(
+                Post.title.contains(query),
+                Post.content.contains(query),
+                Post.excerpt.contains(query)
+            )
+        )
+
+def search_posts(query, page, per_page=6):
+    return SearchPagination(page=page, per_page=per_page, error_out=False, query=query)
+
+class CachePurge(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    tag = db.Column(db.String(100), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+# Caching
+class VersionedCache:
+    """Per-process cache of a loader's result, invalidated across workers via CacheVersion.
+    
+    Warm reads return from memory; the stamp is re-checked at most once per
+    CACHE_VERSION_CHECK_INTERVAL seconds.
+    """
+    registry = []
+    
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+        self._entry = None  # (stamp, value)
+        self._checked_at = 0.0
+        VersionedCache.registry.append(self)
+    
+    def get(self):
+        return self._current()[1]
+    
+    def stamp(self):
+        return self._current()[0]
+    
+    def _current(self):
+        now = time.monotonic()
+        entry = self._entry
+        if entry is not None and now - self._checked_at < app.config['CACHE_VERSION_CHECK_INTERVAL']:
+            return entry
+        stamp = CacheVersion.current(self.name)
+        if entry is None or entry[0] != stamp:
+            entry = (stamp, self.loader())
+            self._entry = entry
+        self._checked_at = now
+        return entry
+    
+    def invalidate(self):
+        CacheVersion.bump(self.name)
+        # Settings and chrome are rendered into every public page
+        purge_page_cache('site')
+        self.clear()
+    
+    def clear(self):
+        self._entry = None
+
+settings_cache = VersionedCache('settings', lambda: dict(db.session.query(Setting.key, Setting.value).all()))
+
+# Site chrome (navigation, footer and ad slots shared by every public template)
+NavCategory = namedtuple('NavCategory', 'id name slug')
+NavPage = namedtuple('NavPage', 'id title slug')
+NavMenuItem = namedtuple('NavMenuItem', 'id title url')
+
+def load_site_chrome():
+    # Plain tuples rather than ORM objects so the cached copy never lazy-loads on a closed session
+    return {
+        'categories': [NavCategory(*row) for row in db.session.query(Category.id, Category.name, Category.slug).order_by(Category.id)],
+        'pages': [NavPage(*row) for row in db.session.query(Page.id, Page.title, Page.slug).filter_by(published=True).order_by(Page.id)],
+        'menu_items': [NavMenuItem(*row) for row in db.session.query(MenuItem.id, MenuItem.title, MenuItem.url).filter_by(active=True).order_by(MenuItem.order)]
+    }
+
+chrome_cache = VersionedCache('chrome', load_site_chrome)
+
+def get_site_chrome():
+    if 'site_chrome' not in g:
+        chrome = dict(chrome_cache.get())
+        chrome.update({
+            'site_name': Setting.get('site_name', 'ModernBlog'),
+            'logo': Setting.get('logo'),
+            'tracking_code': Setting.get('tracking_code'),
+            'ads_header': Setting.get('ads_header'),
+            'ads_content': Setting.get('ads_content'),
+            'ads_sidebar': Setting.get('ads_sidebar'),
+            'ads_footer': Setting.get('ads_footer')
+        })
+        g.site_chrome = chrome
+    return g.site_chrome
+
+# Full-page cache. Entries are tagged with what they render ('site' for chrome and settings,
+# 'posts' for listings, 'post:<id>', 'page:<id>'); committed writes purge their tags locally
+# and through the cache_purge log, which other workers replay on their next version check.
+PAGE_CACHE_ENDPOINTS = {'index', 'post_detail', 'post_comments', 'category_posts', 'tag_posts', 'categories', 'page_detail'}
+PAGE_CACHE_PURGE_RETENTION = 3600
+PAGE_CACHE_QUERY_ARGS = ('cursor', 'page', 'q')
+PAGE_CACHE_STORED_HEADERS = ('Content-Type', 'Content-Encoding', 'Vary', 'ETag', 'Last-Modified', 'Cache-Control')
+
+page_cache = create_page_cache(app.config['PAGE_CACHE_BACKEND'], directory=app.config['PAGE_CACHE_DIR'],
+                               max_entries=app.config['PAGE_CACHE_MAX_ENTRIES'], ttl=app.config['PAGE_CACHE_TTL'])
+_page_cache_sync = {'last_id': None, 'checked_at': None}
+
+def _record_page_purges(executor, session, tags):
+    pending = session.info.setdefault('page_cache_purges', set())
+    new_tags = set(tags) - pending
+    if not new_tags:
+        return
+    pending.update(new_tags)
+    now = datetime.utcnow()
+    executor.execute(CachePurge.__table__.insert(), [{'tag': tag, 'created_at': now} for tag in sorted(new_tags)])
+    if not session.info.get('page_cache_pruned'):
+        session.info['page_cache_pruned'] = True
+        executor.execute(CachePurge.__table__.delete().where(
+            CachePurge.created_at < datetime.utcfromtimestamp(time.time() - PAGE_CACHE_PURGE_RETENTION)))
+
+def purge_page_cache(*tags):
+    """Purge cached pages carrying any of these tags once the current transaction commits"""
+    _record_page_purges(db.session, db.session(), tags)
+
+def _purge_from_flush(connection, target, tags):
+    session = db.object_session(target)
+    if session is not None:
+        _record_page_purges(connection, session, tags)
+
+@db.event.listens_for(db.Session, 'after_commit')
+def _apply_page_purges(session):
+    tags = session.info.pop('page_cache_purges', None)
+    session.info.pop('page_cache_pruned', None)
+    if tags and page_cache is not None:
+        page_cache.purge(tags)
+
+@db.event.listens_for(db.Session, 'after_rollback')
+def _discard_page_purges(session):
+    session.info.pop('page_cache_purges', None)
+    session.info.pop('page_cache_pruned', None)
+
+@db.event.listens_for(Post, 'after_insert')
+@db.event.listens_for(Post, 'after_update')
+@db.event.listens_for(Post, 'after_delete')
+def _purge_post_pages(mapper, connection, target):
+    _purge_from_flush(connection, target, ['posts', 'post:%d' % target.id])
+
+@db.event.listens_for(Comment, 'after_insert')
+def _purge_new_comment_pages(mapper, connection, target):
+    # A new comment normally waits for moderation and does not change the page yet
+    if target.approved:
+        _purge_from_flush(connection, target, ['post:%d' % target.post_id])
+
+@db.event.listens_for(Comment, 'after_update')
+@db.event.listens_for(Comment, 'after_delete')
+def _purge_comment_pages(mapper, connection, target):
+    _purge_from_flush(connection, target, ['post:%d' % target.post_id])
+
+@db.event.listens_for(Page, 'after_insert')
+@db.event.listens_for(Page, 'after_update')
+@db.event.listens_for(Page, 'after_delete')
+def _purge_page_pages(mapper, connection, target):
+    _purge_from_flush(connection, target, ['page:%d' % target.id])
+
+def sync_page_cache():
+    """Replay purges committed by other workers; a no-op for shared backends, which writers purge directly"""
+    if page_cache.shared:
+        return
+    now = time.monotonic()
+    checked_at = _page_cache_sync['checked_at']
+    if checked_at is not None and now - checked_at < app.config['CACHE_VERSION_CHECK_INTERVAL']:
+        return
+    last_id = _page_cache_sync['last_id']
+    if last_id is None or now - checked_at > PAGE_CACHE_PURGE_RETENTION:
+        # First check, or the log may have been pruned past what this worker has seen
+        page_cache.clear()
+        last_id = db.session.query(db.func.max(CachePurge.id)).scalar() or 0
+    else:
+        rows = db.session.query(CachePurge.id, CachePurge.tag).filter(CachePurge.id > last_id).order_by(CachePurge.id).all()
+        if rows:
+            page_cache.purge({tag for _, tag in rows})
+            last_id = rows[-1][0]
+    _page_cache_sync['last_id'] = last_id
+    _page_cache_sync['checked_at'] = now
+
+def tag_page_cache(*tags):
+    if 'page_cache_tags' in g:
+        g.page_cache_tags.update(tags)
+
+def page_cache_key():
+    # Only the parameters views read vary the key, so made-up ones cannot fill the cache
+    query = urlencode(sorted((name, value) for name, value in request.args.items(multi=True) if name in PAGE_CACHE_QUERY_ARGS))
+    # One entry per encoding, each compressed once when it is stored
+    return f'{request.scheme}://{request.host}{request.path}?{query}#{response_encoding() or "identity"}'
+
+@app.before_request
+def serve_cached_page():
+    if page_cache is None or request.method not in ('GET', 'HEAD') or request.endpoint not in PAGE_CACHE_ENDPOINTS:
+        return None
+    # Admins and visitors with pending flash messages always get a fresh render
+    if session.get('admin') or '_flashes' in session:
+        return None
+    sync_page_cache()
+    key = page_cache_key()
+    entry = page_cache.get(key)
+    page_cache_lookups.inc(result='miss' if entry is None else 'hit')
+    if entry is not None:
+        response = app.response_class(entry.body, headers=entry.headers)
+        response.headers['X-Page-Cache'] = 'HIT'
+        return response.make_conditional(request)
+    g.page_cache_key = key
+    g.page_cache_tags = {'site'}
+    return None
+
+@app.after_request
+def store_cached_page(response):
+    key = g.pop('page_cache_key', None)
+    if key is None or response.status_code != 200 or response.direct_passthrough or session.modified:
+        return response
+    headers = {name: response.headers[name] for name in PAGE_CACHE_STORED_HEADERS if name in response.headers}
+    page_cache.set(key, response.get_data(), headers, g.page_cache_tags)
+    response.headers['X-Page-Cache'] = 'MISS'
+    return response
+
+# Conditional GET. Views compute a cheap validator before rendering; the ETag also folds in
+# the settings and chrome stamps because every page renders them.
+def check_not_modified(last_modified, *parts):
+    """Record validators for this response and return a 304 if the client's copy is still current"""
+    site = (settings_cache.stamp(), chrome_cache.stamp())
+    # Each content coding is a different representation and needs its own strong ETag
+    etag = hashlib.sha1(repr((parts, site, response_encoding())).encode('utf-8')).hexdigest()
+    g.validators = (etag, last_modified)
+    # A pending flash message has to be rendered, so the client's copy is never current
+    if '_flashes' in session:
+        fresh = False
+    elif request.if_none_match:
+        fresh = request.if_none_match.contains(etag)
+    elif request.if_modified_since and last_modified:
+        fresh = last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+    else:
+        fresh = False
+    if not fresh:
+        return None
+    response = app.response_class(status=304)
+    _apply_validators(response)
+    return response
+
+def _apply_validators(response):
+    etag, last_modified = g.validators
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    # Let browsers and nginx keep the page but revalidate it on every use
+    response.cache_control.no_cache = True
+
+@app.after_request
+def add_validators(response):
+    if 'validators' in g and response.status_code == 200:
+        _apply_validators(response)
+    return response
+
+# The public listings share one validator: a CacheVersion row holding the time any published post
+# last changed, written in the same transaction as the change, so a check is a primary-key read
+LISTINGS_VERSION = 'listings'
+
+def touch_listings(connection, changed_at=None):
+    """Move the listings' validator on; bulk writes that bypass the Post events call this themselves"""
+    table = CacheVersion.__table__
+    stamp = (changed_at or datetime.utcnow()).isoformat(timespec='microseconds')
+    if connection.execute(table.update().where(table.c.name == LISTINGS_VERSION).values(stamp=stamp)).rowcount == 0:
+        try:
+            with connection.begin_nested():
+                connection.execute(table.insert().values(name=LISTINGS_VERSION, stamp=stamp))
+        except db.exc.IntegrityError:
+            # Another worker created the row first
+            connection.execute(table.update().where(table.c.name == LISTINGS_VERSION).values(stamp=stamp))
+
+def listing_validator():
+    """(last modified, stamp) of the public listings; changes whenever a published post is added,
+    edited, unpublished or deleted"""
+    stamp = CacheVersion.current(LISTINGS_VERSION)
+    if stamp is None:
+        # Migration 0014 seeds the stamp; until it has run, derive it from the posts without writing
+        latest = db.session.query(db.func.max(Post.updated_at)).filter(Post.published == True).scalar()
+        return latest, latest and latest.isoformat(timespec='microseconds')
+    return datetime.fromisoformat(stamp), stamp
+
+@db.event.listens_for(Post, 'after_insert')
+@db.event.listens_for(Post, 'after_update')
+@db.event.listens_for(Post, 'after_delete')
+def _touch_listings_for_post(mapper, connection, target):
+    # Drafts never show in listings, unless this write is what unpublished them
+    if target.published or db.inspect(target).attrs['published'].history.deleted:
+        touch_listings(connection)
+
+
+# Response compression. HTML is minified and bodies of at least COMPRESS_MIN_SIZE bytes are
+# gzip- or brotli-encoded for clients that accept it. This runs before the page cache stores a
+# response, so cached pages keep their encoded body and hits skip both steps.
+def response_encoding():
+    if not app.config['COMPRESS_RESPONSES']:
+        return None
+    return negotiate(request.accept_encodings)
+
+@app.after_request
+def compress_response(response):
+    if response.headers.get('X-Page-Cache') == 'HIT' or response.direct_passthrough or response.is_streamed:
+        return response
+    if response.status_code != 200 or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_TYPES:
+        return response
+    if response.mimetype == 'text/html' and app.config['HTML_MINIFY']:
+        response.set_data(minify_html(response.get_data(as_text=True)))
+    response.vary.add('Accept-Encoding')
+    encoding = response_encoding()
+    if encoding and not response.cache_control.no_transform and len(response.get_data()) >= app.config['COMPRESS_MIN_SIZE']:
+        response.set_data(compress(response.get_data(), encoding))
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+# Keyset pagination for public listings: newest first on (created_at, id) with opaque cursors,
+# so deep pages cost the same as the first one
+LISTING_COUNT_TTL = 60
+_listing_counts = {}
+
+class KeysetPage:
+    def __init__(self, items, has_prev, has_next, total):
+        self.items = items
+        self.has_prev = has_prev
+        self.has_next = has_next
+        self.total = total
+    
+    def __iter__(self):
+        return iter(self.items)
+    
+    @property
+    def prev_cursor(self):
+        return encode_cursor(self.items[0], 'b') if self.has_prev and self.items else None
+    
+    @property
+    def next_cursor(self):
+        return encode_cursor(self.items[-1], 'a') if self.has_next and self.items else None
+
+def encode_cursor(row, direction):
+    raw = f'{direction}|{row.created_at.isoformat()}|{row.id}'
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode('utf-8')
+        direction, created_at, row_id = raw.split('|')
+        if direction not in ('a', 'b'):
+            raise ValueError(direction)
+        return direction, datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        abort(404)
+
+def cached_listing_count(key, query):
+    """Listing totals are only shown as a headline figure, so a short-lived per-worker count is enough"""
+    now = time.monotonic()
+    cached = _listing_counts.get(key)
+    if cached and now - cached[1] < LISTING_COUNT_TTL:
+        return cached[0]
+    total = query.order_by(None).count()
+    _listing_counts[key] = (total, now)
+    return total
+
+def keyset_paginate(query, count_key, per_page=6, model=Post):
+    position = db.tuple_(model.created_at, model.id)
+    newest_first = (model.created_at.desc(), model.id.desc())
+    token = request.args.get('cursor')
+    if token:
+        direction, created_at, row_id = decode_cursor(token)
+        if direction == 'a':
+            rows = query.filter(position < db.tuple_(created_at, row_id)).order_by(*newest_first).limit(per_page + 1).all()
+            items, has_prev, has_next = rows[:per_page], True, len(rows) > per_page
+        else:
+            rows = query.filter(position > db.tuple_(created_at, row_id)).order_by(model.created_at, model.id).limit(per_page + 1).all()
+            items, has_prev, has_next = rows[:per_page][::-1], len(rows) > per_page, True
+    else:
+        # Legacy ?page=N links are served once by offset; navigation from there uses cursors
+        offset = (max(request.args.get('page', 1, type=int), 1) - 1) * per_page
+        rows = query.order_by(*newest_first).offset(offset).limit(per_page + 1).all()
+        items, has_prev, has_next = rows[:per_page], offset > 0, len(rows) > per_page
+    total = cached_listing_count(count_key, query) if count_key else None
+    return KeysetPage(items, has_prev, has_next, total)
+
+# Admin counters. Dashboard totals and sidebar badges are kept in the counter table and
+# adjusted in the same flush as the rows they count, so admin pages never run COUNT(*).
+class Counter(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+ADMIN_COUNTERS = {
+    'posts': db.select(db.func.count(Post.id)),
+    'published_posts': db.select(db.func.count(Post.id)).where(Post.published == True),
+    'categories': db.select(db.func.count(Category.id)),
+    'tags': db.select(db.func.count(Tag.id)),
+    'pending_comments': db.select(db.func.count(Comment.id)).where(Comment.approved == False),
+    'unread_contacts': db.select(db.func.count(Contact.id)).where(Contact.read == False),
+}
+
+def rebuild_counters(connection):
+    """Recount everything from scratch; used to seed the table and to heal a dropped counter"""
+    values = [{'name': name, 'value': connection.execute(query).scalar()} for name, query in ADMIN_COUNTERS.items()]
+    connection.execute(Counter.__table__.delete())
+    connection.execute(Counter.__table__.insert(), values)
+
+def get_admin_counters():
+    if 'admin_counters' not in g:
+        counters = dict(db.session.query(Counter.name, Counter.value).all())
+        if counters.keys() != ADMIN_COUNTERS.keys():
+            rebuild_counters(db.session.connection())
+            db.session.commit()
+            counters = dict(db.session.query(Counter.name, Counter.value).all())
+        g.admin_counters = counters
+    return g.admin_counters
+
+def _adjust_counter(connection, name, delta):
+    if delta:
+        connection.execute(Counter.__table__.update().where(Counter.name == name).values(value=Counter.value + delta))
+
+def _flag_change(connection, target, attribute, counter, counted_value):
+    """Adjust ``counter`` when ``attribute`` moves into or out of ``counted_value``"""
+    history = db.inspect(target).attrs[attribute].history
+    if not history.has_changes():
+        return
+    if not history.deleted:
+        # The old value was never loaded, so the direction is unknown; let the next read recount
+        connection.execute(Counter.__table__.delete().where(Counter.name == counter))
+        return
+    before = bool(history.deleted[0]) == counted_value
+    after = bool(history.added[0]) == counted_value if history.added else False
+    _adjust_counter(connection, counter, int(after) - int(before))
+
+@db.event.listens_for(Post, 'after_insert')
+def _count_new_post(mapper, connection, target):
+    _adjust_counter(connection, 'posts', 1)
+    _adjust_counter(connection, 'published_posts', int(bool(target.published)))
+
+@db.event.listens_for(Post, 'after_update')
+def _count_updated_post(mapper, connection, target):
+    _flag_change(connection, target, 'published', 'published_posts', True)
+
+@db.event.listens_for(Post, 'after_delete')
+def _count_deleted_post(mapper, connection, target):
+    _adjust_counter(connection, 'posts', -1)
+    _adjust_counter(connection, 'published_posts', -int(bool(target.published)))
+
+@db.event.listens_for(Category, 'after_insert')
+def _count_new_category(mapper, connection, target):
+    _adjust_counter(connection, 'categories', 1)
+
+@db.event.listens_for(Category, 'after_delete')
+def _count_deleted_category(mapper, connection, target):
+    _adjust_counter(connection, 'categories', -1)
+
+@db.event.listens_for(Tag, 'after_insert')
+def _count_new_tag(mapper, connection, target):
+    _adjust_counter(connection, 'tags', 1)
+
+@db.event.listens_for(Tag, 'after_delete')
+def _count_deleted_tag(mapper, connection, target):
+    _adjust_counter(connection, 'tags', -1)
+
+@db.event.listens_for(Comment, 'after_insert')
+def _count_new_comment(mapper, connection, target):
+    _adjust_counter(connection, 'pending_comments', int(target.approved is False))
+
+@db.event.listens_for(Comment, 'after_update')
+def _count_updated_comment(mapper, connection, target):
+    _flag_change(connection, target, 'approved', 'pending_comments', False)
+
+@db.event.listens_for(Comment, 'after_delete')
+def _count_deleted_comment(mapper, connection, target):
+    _adjust_counter(connection, 'pending_comments', -int(target.approved is False))
+
+# Approved comments per post, denormalized onto the post row. The update leaves updated_at
+# alone: a new comment is not an edit and must not reorder or re-date the listings.
+def rebuild_comment_counts(connection):
+    post, comment = Post.__table__, Comment.__table__
+    approved = db.and_(comment.c.post_id == post.c.id, comment.c.approved == True)
+    connection.execute(post.update().values(
+        approved_comment_count=db.select(db.func.count(comment.c.id)).where(approved).scalar_subquery(),
+        comments_changed_at=db.select(db.func.max(comment.c.created_at)).where(approved).scalar_subquery(),
+        updated_at=post.c.updated_at))
+
+def recount_comments(connection, post_ids):
+    post, comment = Post.__table__, Comment.__table__
+    count = db.select(db.func.count(comment.c.id)).where(comment.c.post_id == post.c.id, comment.c.approved == True).scalar_subquery()
+    connection.execute(post.update().where(post.c.id.in_(post_ids)).values(
+        approved_comment_count=count, comments_changed_at=datetime.utcnow(), updated_at=post.c.updated_at))
+
+def _change_comment_count(connection, post_id, delta):
+    """Apply ``delta`` to a post's approved comment count; None recounts it"""
+    post = Post.__table__
+    if delta is None:
+        recount_comments(connection, [post_id])
+    elif delta:
+        connection.execute(post.update().where(post.c.id == post_id).values(
+            approved_comment_count=post.c.approved_comment_count + delta, comments_changed_at=datetime.utcnow(),
+            updated_at=post.c.updated_at))
+
+@db.event.listens_for(Comment, 'after_insert')
+def _count_new_approved_comment(mapper, connection, target):
+    _change_comment_count(connection, target.post_id, int(bool(target.approved)))
+
+@db.event.listens_for(Comment, 'after_update')
+def _count_moderated_comment(mapper, connection, target):
+    history = db.inspect(target).attrs.approved.history
+    if not history.has_changes():
+        return
+    if not history.deleted:
+        _change_comment_count(connection, target.post_id, None)
+        return
+    _change_comment_count(connection, target.post_id, int(bool(target.approved)) - int(bool(history.deleted[0])))
+
+@db.event.listens_for(Comment, 'after_delete')
+def _count_deleted_approved_comment(mapper, connection, target):
+    _change_comment_count(connection, target.post_id, -int(bool(target.approved)))
+
+COMMENTS_PER_PAGE = 20
+
+def approved_comments_page(post_id, cursor=None, per_page=COMMENTS_PER_PAGE):
+    """Newest approved comments of a post after ``cursor``; returns (comments, next cursor or None)"""
+    query = Comment.query.filter_by(post_id=post_id, approved=True)
+    if cursor:
+        _, created_at, comment_id = decode_cursor(cursor)
+        query = query.filter(db.tuple_(Comment.created_at, Comment.id) < db.tuple_(created_at, comment_id))
+    rows = query.order_by(Comment.created_at.desc(), Comment.id.desc()).limit(per_page + 1).all()
+    comments = rows[:per_page]
+    return comments, encode_cursor(comments[-1], 'a') if len(rows) > per_page else None
+
+@db.event.listens_for(Contact, 'after_insert')
+def _count_new_contact(mapper, connection, target):
+    _adjust_counter(connection, 'unread_contacts', int(target.read is False))
+
+@db.event.listens_for(Contact, 'after_update')
+def _count_updated_contact(mapper, connection, target):
+    _flag_change(connection, target, 'read', 'unread_contacts', False)
+
+@db.event.listens_for(Contact, 'after_delete')
+def _count_deleted_contact(mapper, connection, target):
+    _adjust_counter(connection, 'unread_contacts', -int(target.read is False))
+
+@app.context_processor
+def inject_admin_counters():
+    # Sidebar badges on every admin page
+    if not session.get('admin') or not (request.endpoint or '').startswith('admin'):
+        return {}
+    counters = get_admin_counters()
+    return dict(pending_comments=counters['pending_comments'], unread_contacts=counters['unread_contacts'])
+
+# Image uploads. Files are stored under the SHA-256 of their bytes, so re-uploading an image
+# reuses the stored copy. The request only validates and stores the original; variants are
+# rendered by a worker pool once the transaction that recorded the upload commits.
+upload_storage = create_storage(app.config['UPLOAD_STORAGE'], root=app.config['UPLOAD_FOLDER'],
+                                bucket=app.config['UPLOAD_S3_BUCKET'], prefix=app.config['UPLOAD_S3_PREFIX'],
+                                public_url=app.config['UPLOAD_S3_PUBLIC_URL'],
+                                endpoint_url=app.config['UPLOAD_S3_ENDPOINT_URL'])
+image_executor = ThreadPoolExecutor(max_workers=app.config['IMAGE_WORKERS'], thread_name_prefix='images') \
+    if app.config['IMAGE_WORKERS'] > 0 else None
+
+IMAGE_EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+IMAGE_CONTENT_TYPES = {'jpg': 'image/jpeg', 'png': 'image/png', 'gif': 'image/gif', 'webp': 'image/webp', 'avif': 'image/avif'}
+
+def upload_url(key, external=False):
+    url = upload_storage.url(key)
+    if url is None:
+        return url_for('static', filename='uploads/' + key, _external=external)
+    return url
+
+def save_image_upload(file):
+    """Validate and store an uploaded image and queue its variants; returns its storage key or raises InvalidImage"""
+    # The extension follows the decoded format, not whatever the client named the file
+    image_format = probe(file.stream)[0]
+    data = file.stream.read()
+    extension = IMAGE_EXTENSIONS[image_format]
+    upload_size.observe(len(data), format=extension)
+    # Hashed after stripping, so the stored object always matches its key
+    data = strip_metadata(data)
+    key = content_key(data, extension)
+    asset = ImageAsset.query.filter_by(filename=key).first()
+    if asset is not None and asset.status != 'failed' and upload_storage.exists(key):
+        asset.uploaded_at = datetime.utcnow()
+        return key
+    upload_storage.save(key, io.BytesIO(data), IMAGE_CONTENT_TYPES[extension])
+    if asset is None:
+        asset = ImageAsset(filename=key)
+        db.session.add(asset)
+    asset.status = 'pending'
+    asset.variants = None
+    asset.uploaded_at = datetime.utcnow()
+    db.session.info.setdefault('image_jobs', []).append(key)
+    return key
+
+def render_image_variants(key):
+    """Render variants in a scratch directory and store them next to the original; returns the variant map"""
+    directory, name = os.path.split(key)
+    with tempfile.TemporaryDirectory() as scratch:
+        source = os.path.join(scratch, name)
+        with upload_storage.open(key) as stream:
+            data = stream.read()
+        if not is_content_key(key):
+            # Uploads from before content addressing carry no hash in their name and are stripped in place
+            stripped = strip_metadata(data)
+            if stripped != data:
+                upload_storage.save(key, io.BytesIO(stripped), IMAGE_CONTENT_TYPES.get(name.rsplit('.', 1)[-1]))
+                data = stripped
+        with open(source, 'wb') as f:
+            f.write(data)
+        result = generate_variants(source, os.path.join(scratch, 'variants'), os.path.splitext(name)[0])
+        keys = {}
+        for filename in os.listdir(os.path.join(scratch, 'variants')):
+            keys[filename] = f'{directory}/{filename}' if directory else filename
+            with open(os.path.join(scratch, 'variants', filename), 'rb') as f:
+                upload_storage.save(keys[filename], f, IMAGE_CONTENT_TYPES.get(filename.rsplit('.', 1)[-1]))
+    result['variants'] = {name: dict(variant, files={fmt: keys[filename] for fmt, filename in variant['files'].items()})
+                          for name, variant in result['variants'].items()}
+    return result
+
+def process_image_asset(key):
+    with app.app_context():
+        asset = ImageAsset.query.filter_by(filename=key).first()
+        if asset is None:
+            return
+        try:
+            result = render_image_variants(key)
+        except Exception:
+            app.logger.exception('Rendering variants of %s failed', key)
+            asset.status = 'failed'
+        else:
+            asset.width = result['width']
+            asset.height = result['height']
+            asset.variants = json.dumps(result['variants'])
+            asset.status = 'ready'
+        # Pages showing the image can now use its variants
+        post_ids = [post_id for (post_id,) in db.session.query(Post.id).filter(Post.cover_image == key)]
+        if post_ids:
+            purge_page_cache('posts', *['post:%d' % post_id for post_id in post_ids])
+            touch_listings(db.session.connection())
+        if Setting.get('logo') == key:
+            settings_cache.invalidate()
+        db.session.commit()
+
+@db.event.listens_for(db.Session, 'after_commit')
+def _start_image_jobs(session):
+    for key in session.info.pop('image_jobs', []):
+        if image_executor is None:
+            process_image_asset(key)
+        else:
+            image_executor.submit(process_image_asset, key)
+
+@db.event.listens_for(db.Session, 'after_rollback')
+def _discard_image_jobs(session):
+    session.info.pop('image_jobs', None)
+
+# Upload references: rewritten whenever a post's cover or Markdown, a page's Markdown or the
+# logo setting changes, so an upload with no rows left is unused
+UPLOAD_REFERENCE = re.compile(r'(?:[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}|(?<=uploads/)[\w-]+)\.(?:jpe?g|png|gif|webp|svg)')
+
+def referenced_uploads(*texts):
+    return {match.group(0) for text in texts if text for match in UPLOAD_REFERENCE.finditer(text)}
+
+def _sync_upload_references(connection, owner, filenames):
+    table = UploadReference.__table__
+    connection.execute(table.delete().where(table.c.owner == owner))
+    if filenames:
+        connection.execute(table.insert(), [{'owner': owner, 'filename': filename} for filename in sorted(filenames)])
+
+def rebuild_upload_references(connection):
+    """Recompute every reference from the stored posts, pages and logo setting"""
+    connection.execute(UploadReference.__table__.delete())
+    for post_id, cover_image, content in connection.execute(db.select(Post.id, Post.cover_image, Post.content)):
+        _sync_upload_references(connection, 'post:%d' % post_id, ({cover_image} if cover_image else set()) | referenced_uploads(content))
+    for page_id, content in connection.execute(db.select(Page.id, Page.content)):
+        _sync_upload_references(connection, 'page:%d' % page_id, referenced_uploads(content))
+    logo = connection.execute(db.select(Setting.value).where(Setting.key == 'logo')).scalar()
+    _sync_upload_references(connection, 'setting:logo', {logo} if logo else set())
+
+def _changed(target, *attributes):
+    state = db.inspect(target)
+    return any(state.attrs[attribute].history.has_changes() for attribute in attributes)
+
+@db.event.listens_for(Post, 'after_insert')
+@db.event.listens_for(Post, 'after_update')
+def _reference_post_uploads(mapper, connection, target):
+    if _changed(target, 'cover_image', 'content'):
+        covers = {target.cover_image} if target.cover_image else set()
+        _sync_upload_references(connection, 'post:%d' % target.id, covers | referenced_uploads(target.content))
+
+@db.event.listens_for(Page, 'after_insert')
+@db.event.listens_for(Page, 'after_update')
+def _reference_page_uploads(mapper, connection, target):
+    if _changed(target, 'content'):
+        _sync_upload_references(connection, 'page:%d' % target.id, referenced_uploads(target.content))
+
+@db.event.listens_for(Post, 'after_delete')
+def _release_post_uploads(mapper, connection, target):
+    _sync_upload_references(connection, 'post:%d' % target.id, set())
+
+@db.event.listens_for(Page, 'after_delete')
+def _release_page_uploads(mapper, connection, target):
+    _sync_upload_references(connection, 'page:%d' % target.id, set())
+
+@db.event.listens_for(Setting, 'after_insert')
+@db.event.listens_for(Setting, 'after_update')
+def _reference_logo_upload(mapper, connection, target):
+    if target.key == 'logo' and _changed(target, 'value'):
+        _sync_upload_references(connection, 'setting:logo', {target.value} if target.value else set())
+
+def _image_attributes(attrs):
+    return Markup(''.join(Markup(' {}="{}"').format(name.replace('_', '-'), value)
+                          for name, value in attrs.items() if value is not None))
+
+@app.template_global()
+def image_url(image, variant='hero', external=False):
+    """URL of one rendition in a universally supported format, for backgrounds and social cards"""
+    if isinstance(image, ImageAsset):
+        chosen = image.variant_map.get(variant)
+        if chosen:
+            return upload_url(chosen['files']['fallback'], external)
+        image = image.filename
+    return upload_url(image, external)
+
+@app.template_global()
+def picture(image, variant='card', sizes='100vw', **attrs):
+    """<picture> offering AVIF/WebP srcsets over the width buckets; a plain <img> until variants exist"""
+    attrs.setdefault('loading', 'lazy')
+    attrs.setdefault('decoding', 'async')
+    variants = image.variant_map if isinstance(image, ImageAsset) else {}
+    chosen = variants.get(variant)
+    if not chosen:
+        return Markup('<img src="{}"{}>').format(image_url(image), _image_attributes(attrs))
+
+    buckets = []
+    for name, _ in WIDTH_VARIANTS:
+        if name in variants and variants[name] not in buckets:
+            buckets.append(variants[name])
+
+    def srcset(fmt):
+        return ', '.join('%s %dw' % (upload_url(bucket['files'][fmt]), bucket['width'])
+                         for bucket in buckets if fmt in bucket['files'])
+
+    sources = [Markup('<source type="image/{}" srcset="{}" sizes="{}">').format(fmt, srcset(fmt), sizes)
+               for fmt in ('avif', 'webp') if fmt in chosen['files']]
+    img = Markup('<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}"{}>').format(
+        image_url(image, variant), srcset('fallback'), sizes, chosen['width'], chosen['height'], _image_attributes(attrs))
+    return Markup('<picture>{}{}</picture>').format(Markup('').join(sources), img)
+
+# Comment and contact submissions. Requests only filter and spool them; a writer thread in
+# each worker drains the shared spool in batches, so the database sees one short transaction
+# per batch however many visitors post at once.
+# Table, admin counter and moderation defaults for each kind of submission
+SUBMISSION_TABLES = {
+    'comment': (Comment.__table__, 'pending_comments', {'approved': False}),
+    'contact': (Contact.__table__, 'unread_contacts', {'read': False}),
+}
+submission_queue = SubmissionQueue(app.config['SUBMISSION_QUEUE_DIR'])
+submission_filter = SubmissionFilter(per_ip=app.config['SUBMISSION_RATE_PER_IP'],
+                                     per_target=app.config['SUBMISSION_RATE_PER_TARGET'])
+_submission_writer = {'thread': None, 'lock': threading.Lock(), 'resumed': False}
+
+def queue_submission(kind, target, text, data):
+    """Filter and queue a submission; returns None once queued, otherwise why it was refused"""
+    reason = submission_filter.check(request.remote_addr, target, text, request.form.get('website', ''))
+    if reason is not None:
+        return reason
+    # Cut fields to their columns, so no queued record can fail its batch for being too long
+    table = SUBMISSION_TABLES[kind][0]
+    for column, value in data.items():
+        length = getattr(table.c[column].type, 'length', None)
+        if length and isinstance(value, str):
+            data[column] = value[:length]
+    data['created_at'] = datetime.utcnow().isoformat()
+    submission_queue.put(kind, data)
+    if app.config['SUBMISSION_FLUSH_INTERVAL'] > 0:
+        start_submission_writer()
+    else:
+        flush_submissions()
+    return None
+
+def flush_submissions():
+    """Insert one batch of queued submissions in a single transaction; returns how many were claimed"""
+    claimed = submission_queue.claim(app.config['SUBMISSION_BATCH_SIZE'])
+    if not claimed:
+        return 0
+    post_ids = {record['data']['post_id'] for _, record in claimed if record['kind'] == 'comment'}
+    live_posts = {post_id for (post_id,) in db.session.query(Post.id).filter(Post.id.in_(post_ids))} if post_ids else set()
+    entries, dropped = [], []
+    for name, record in claimed:
+        data = dict(record['data'], created_at=datetime.fromisoformat(record['data']['created_at']))
+        # Comments on posts deleted while they waited are dropped
+        if record['kind'] == 'comment' and data['post_id'] not in live_posts:
+            dropped.append(name)
+            continue
+        entries.append((name, record['kind'], data))
+    submission_queue.ack(dropped)
+    try:
+        _insert_submissions(entries)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        app.logger.warning('Writing a batch of %d submissions failed; writing them one at a time', len(entries))
+        _insert_submissions_singly(entries)
+    else:
+        submission_queue.ack([name for name, _, _ in entries])
+    return len(claimed)
+
+def _insert_submissions(entries):
+    # One executemany per table and one counter update each; queued submissions are always
+    # unmoderated, so they change no public page and need no purge
+    connection = db.session.connection()
+    for kind, (table, counter, defaults) in SUBMISSION_TABLES.items():
+        rows = [dict(data, **defaults) for _, entry_kind, data in entries if entry_kind == kind]
+        if rows:
+            connection.execute(table.insert(), rows)
+            _adjust_counter(connection, counter, len(rows))
+
+def _insert_submissions_singly(entries):
+    """Write each submission of a failed batch in its own transaction; the ones the database
+    refuses go to the spool's failed/ directory instead of holding up everything queued after them"""
+    for index, entry in enumerate(entries):
+        try:
+            _insert_submissions([entry])
+            db.session.commit()
+        except (db.exc.DataError, db.exc.IntegrityError):
+            db.session.rollback()
+            app.logger.exception('Queued %s %s was refused and moved to %s', entry[1], entry[0], submission_queue.failed_dir)
+            submission_queue.reject([entry[0]])
+        except Exception:
+            db.session.rollback()
+            # The database itself is failing: leave the rest for the next flush
+            submission_queue.release([name for name, _, _ in entries[index:]])
+            raise
+        else:
+            submission_queue.ack([entry[0]])
+
+def _run_submission_writer():
+    interval = app.config['SUBMISSION_FLUSH_INTERVAL']
+    while True:
+        time.sleep(interval)
+        with app.app_context():
+            try:
+                submission_queue.recover()
+                while flush_submissions() == app.config['SUBMISSION_BATCH_SIZE']:
+                    pass
+            except Exception:
+                app.logger.exception('Writing queued submissions failed')
+            finally:
+                db.session.remove()
+
+def start_submission_writer():
+    if _submission_writer['thread'] is not None:
+        return
+    with _submission_writer['lock']:
+        if _submission_writer['thread'] is None:
+            thread = threading.Thread(target=_run_submission_writer, name='submissions', daemon=True)
+            thread.start()
+            _submission_writer['thread'] = thread
+
+@app.before_request
+def resume_submission_writer():
+    # Submissions left in the spool by a restart are written without waiting for a new one
+    if _submission_writer['resumed'] or app.config['SUBMISSION_FLUSH_INTERVAL'] <= 0:
+        return
+    _submission_writer['resumed'] = True
+    if submission_queue.pending() or os.listdir(submission_queue.processing_dir):
+        start_submission_writer()
 
 # Routes
 @app.route('/')
 def index():
-    page = request.args.get('page', 1, type=int)
-    posts = Post.query.filter_by(published=True).order_by(Post.created_at.desc()).paginate(
-        page=page, per_page=6, error_out=False)
-    categories = Category.query.all()
-    pages = Page.query.filter_by(published=True).all()
-    menu_items = MenuItem.query.filter_by(active=True).order_by(MenuItem.order).all()
-    site_name = Setting.get('site_name', 'ModernBlog')
-    logo = Setting.get('logo')
-    tracking_code = Setting.get('tracking_code')
-    ads_header = Setting.get('ads_header')
-    ads_footer = Setting.get('ads_footer')
-    return render_template('index.html', posts=posts, categories=categories, pages=pages, menu_items=menu_items, site_name=site_name, logo=logo, tracking_code=tracking_code, ads_header=ads_header, ads_footer=ads_footer)
+    latest, stamp = listing_validator()
+    not_modified = check_not_modified(latest, 'index', stamp)
+    if not_modified:
+        return not_modified
+    posts = keyset_paginate(with_card_relations(Post.query).filter_by(published=True), 'index')
+    tag_page_cache('posts')
+    return render_template('index.html', posts=posts)
 
 @app.route('/post/<slug>', methods=['GET', 'POST'])
 def post_detail(slug):
-    post = Post.query.filter_by(slug=slug, published=True).first_or_404()
-    categories = Category.query.all()
+    post = with_card_relations(Post.query).filter_by(slug=slug, published=True).first_or_404()
     
     if request.method == 'POST':
         name = request.form['name']
         email = request.form['email']
         content = request.form['content']
         
-        comment = Comment(name=name, email=email, content=content, post_id=post.id)
-        db.session.add(comment)
-        db.session.commit()
-        flash('Comment submitted! It will appear after admin approval.')
+        refused = queue_submission('comment', 'post:%d' % post.id, content,
+                                   {'name': name, 'email': email, 'content': content, 'post_id': post.id})
+        if refused == 'rate_limited':
+            flash('You are commenting too quickly. Please wait a minute and try again.')
+        else:
+            # Spam and repeats get the usual answer so there is nothing to probe
+            flash('Comment submitted! It will appear after admin approval.')
         return redirect(url_for('post_detail', slug=slug))
     
-    pages = Page.query.filter_by(published=True).all()
-    menu_items = MenuItem.query.filter_by(active=True).order_by(MenuItem.order).all()
-    site_name = Setting.get('site_name', 'ModernBlog')
-    logo = Setting.get('logo')
-    tracking_code = Setting.get('tracking_code')
-    ads_header = Setting.get('ads_header')
-    ads_footer = Setting.get('ads_footer')
-    return render_template('post_detail.html', post=post, categories=categories, pages=pages, menu_items=menu_items, site_name=site_name, logo=logo, tracking_code=tracking_code, ads_header=ads_header, ads_footer=ads_footer)
+    not_modified = check_not_modified(post.last_modified, 'post', post.id, post.updated_at,
+                                      post.approved_comment_count, post.comments_changed_at)
+    if not_modified:
+        return not_modified
+    comments, next_cursor = approved_comments_page(post.id)
+    tag_page_cache('post:%d' % post.id)
+    return render_template('post_detail.html', post=post, comments=comments, next_comments_cursor=next_cursor)
+
+@app.route('/post/<slug>/comments')
+def post_comments(slug):
+    """Further pages of a post's approved comments, for the "Load more" button"""
+    post = Post.query.options(db.load_only(Post.id, Post.updated_at, Post.approved_comment_count, Post.comments_changed_at)) \
+        .filter_by(slug=slug, published=True).first_or_404()
+    cursor = request.args.get('cursor')
+    not_modified = check_not_modified(post.comments_changed_at, 'comments', post.id,
+                                      post.approved_comment_count, post.comments_changed_at, cursor)
+    if not_modified:
+        return not_modified
+    comments, next_cursor = approved_comments_page(post.id, cursor)
+    tag_page_cache('post:%d' % post.id)
+    return jsonify({
+        'comments': [{'name': comment.name, 'content': comment.content,
+                      'created_at': comment.created_at.isoformat(),
+                      'display_date': comment.created_at.strftime('%B %d, %Y at %I:%M %p')} for comment in comments],
+        'next_cursor': next_cursor,
+    })
 
 @app.route('/category/<slug>')
 def category_posts(slug):
     category = Category.query.filter_by(slug=slug).first_or_404()
-    page = request.args.get('page', 1, type=int)
-    posts = Post.query.filter_by(category=category, published=True).order_by(Post.created_at.desc()).paginate(
-        page=page, per_page=6, error_out=False)
-    categories = Category.query.all()
-    pages = Page.query.filter_by(published=True).all()
-    menu_items = MenuItem.query.filter_by(active=True).order_by(MenuItem.order).all()
-    site_name = Setting.get('site_name', 'ModernBlog')
-    logo = Setting.get('logo')
-    tracking_code = Setting.get('tracking_code')
-    ads_header = Setting.get('ads_header')
-    ads_footer = Setting.get('ads_footer')
-    return render_template('category.html', posts=posts, category=category, categories=categories, pages=pages, menu_items=menu_items, site_name=site_name, logo=logo, tracking_code=tracking_code, ads_header=ads_header, ads_footer=ads_footer)
+    latest, stamp = listing_validator()
+    not_modified = check_not_modified(latest, 'category', category.id, stamp)
+    if not_modified:
+        return not_modified
+    posts = keyset_paginate(with_card_relations(Post.query).filter_by(category=category, published=True), 'category:%d' % category.id)
+    tag_page_cache('posts')
+    return render_template('category.html', posts=posts, category=category)
 
 @app.route('/search')
 def search():
     query = request.args.get('q', '')
     page = request.args.get('page', 1, type=int)
+    latest, stamp = listing_validator()
+    not_modified = check_not_modified(latest, 'search', stamp)
+    if not_modified:
+        return not_modified
     
     if query:
-        posts = Post.query.filter(
-            Post.published == True,
-            db.or_(
-                Post.title.contains(query),
-                Post.content.contains(query),
-                Post.excerpt.contains(query)
-            )
-        ).order_by(Post.created_at.desc()).paginate(
-            page=page, per_page=6, error_out=False)
+        posts = search_posts(query, page)
     else:
         posts = Post.query.filter_by(published=False).paginate(page=1, per_page=1, error_out=False)
     
-    categories = Category.query.all()
-    pages = Page.query.filter_by(published=True).all()
-    menu_items = MenuItem.query.filter_by(active=True).order_by(MenuItem.order).all()
-    site_name = Setting.get('site_name', 'ModernBlog')
-    logo = Setting.get('logo')
-    tracking_code = Setting.get('tracking_code')
-    ads_header = Setting.get('ads_header')
-    ads_footer = Setting.get('ads_footer')
-    return render_template('search.html', posts=posts, query=query, categories=categories, pages=pages, menu_items=menu_items, site_name=site_name, logo=logo, tracking_code=tracking_code, ads_header=ads_header, ads_footer=ads_footer)
+    return render_template('search.html', posts=posts, query=query, snippets=getattr(posts, 'snippets', {}))
 
 @app.route('/page/<slug>', methods=['GET', 'POST'])
 def page_detail(slug):
     page = Page.query.filter_by(slug=slug, published=True).first_or_404()
-    categories = Category.query.all()
-    pages = Page.query.filter_by(published=True).all()
     
     # Handle contact form submission
     if request.method == 'POST' and slug == 'contact':
@@ -280,47 +1738,133 @@ def page_detail(slug):
         subject = request.form['subject']
         message = request.form['message']
         
-        contact = Contact(name=name, email=email, subject=subject, message=message)
-        db.session.add(contact)
-        db.session.commit()
-        flash('Message sent successfully! We will get back to you soon.')
+        refused = queue_submission('contact', 'contact', message,
+                                   {'name': name, 'email': email, 'subject': subject, 'message': message})
+        if refused == 'rate_limited':
+            flash('You are sending messages too quickly. Please wait a minute and try again.')
+        else:
+            flash('Message sent successfully! We will get back to you soon.')
         return redirect(url_for('page_detail', slug=slug))
     
-    menu_items = MenuItem.query.filter_by(active=True).order_by(MenuItem.order).all()
-    site_name = Setting.get('site_name', 'ModernBlog')
-    logo = Setting.get('logo')
-    tracking_code = Setting.get('tracking_code')
-    ads_header = Setting.get('ads_header')
-    ads_footer = Setting.get('ads_footer')
-    return render_template('page_detail.html', page=page, categories=categories, pages=pages, menu_items=menu_items, site_name=site_name, logo=logo, tracking_code=tracking_code, ads_header=ads_header, ads_footer=ads_footer)
+    not_modified = check_not_modified(page.updated_at, 'page', page.id, page.updated_at)
+    if not_modified:
+        return not_modified
+    tag_page_cache('page:%d' % page.id)
+    return render_template('page_detail.html', page=page)
 
 @app.route('/categories')
 def categories():
+    latest, stamp = listing_validator()
+    not_modified = check_not_modified(latest, 'categories', stamp)
+    if not_modified:
+        return not_modified
     categories = Category.query.all()
-    pages = Page.query.filter_by(published=True).all()
-    menu_items = MenuItem.query.filter_by(active=True).order_by(MenuItem.order).all()
-    site_name = Setting.get('site_name', 'ModernBlog')
-    logo = Setting.get('logo')
-    tracking_code = Setting.get('tracking_code')
-    ads_header = Setting.get('ads_header')
-    ads_footer = Setting.get('ads_footer')
-    return render_template('categories.html', categories=categories, pages=pages, menu_items=menu_items, site_name=site_name, logo=logo, tracking_code=tracking_code, ads_header=ads_header, ads_footer=ads_footer)
+    tag_page_cache('posts')
+    return render_template('categories.html', categories=categories,
+                         post_counts=category_post_counts(), recent_posts=recent_posts_by_category(3))
 
 @app.route('/tag/<slug>')
 def tag_posts(slug):
     tag = Tag.query.filter_by(slug=slug).first_or_404()
-    page = request.args.get('page', 1, type=int)
-    posts = tag.posts.filter_by(published=True).order_by(Post.created_at.desc()).paginate(
-        page=page, per_page=6, error_out=False)
-    categories = Category.query.all()
-    pages = Page.query.filter_by(published=True).all()
-    menu_items = MenuItem.query.filter_by(active=True).order_by(MenuItem.order).all()
-    site_name = Setting.get('site_name', 'ModernBlog')
-    logo = Setting.get('logo')
-    tracking_code = Setting.get('tracking_code')
-    ads_header = Setting.get('ads_header')
-    ads_footer = Setting.get('ads_footer')
-    return render_template('tag.html', posts=posts, tag=tag, categories=categories, pages=pages, menu_items=menu_items, site_name=site_name, logo=logo, tracking_code=tracking_code, ads_header=ads_header, ads_footer=ads_footer)
+    latest, stamp = listing_validator()
+    not_modified = check_not_modified(latest, 'tag', tag.id, stamp)
+    if not_modified:
+        return not_modified
+    posts = keyset_paginate(with_card_relations(Post.query).join(post_tags).filter(post_tags.c.tag_id == tag.id, Post.published == True), 'tag:%d' % tag.id)
+    tag_page_cache('posts')
+    return render_template('tag.html', posts=posts, tag=tag)
+
+# Admin listings: keyset-paginated newest first like the public listings, loading only the
+# columns each list shows, with filters that line up with the (flag, created_at) indexes.
+# They show no totals, so admin pages still never run COUNT(*) (the counters cover the
+# badges). Bulk actions are single set-based statements that adjust the counters, post
+# comment counts and page cache themselves, since they bypass the ORM events.
+ADMIN_PER_PAGE = 25
+ADMIN_BULK_LIMIT = 1000
+ADMIN_STATUS_FILTERS = {
+    'posts': ('published', {'published': True, 'draft': False}),
+    'pages': ('published', {'published': True, 'draft': False}),
+    'comments': ('approved', {'approved': True, 'pending': False}),
+    'contacts': ('read', {'read': True, 'unread': False}),
+}
+
+def admin_filters():
+    """Filters from the query string; empty and malformed values are dropped"""
+    filters = {}
+    status = request.args.get('status', '')
+    if status:
+        filters['status'] = status
+    for name in ('post', 'category'):
+        value = request.args.get(name, type=int)
+        if value:
+            filters[name] = value
+    for name in ('date_from', 'date_to'):
+        try:
+            filters[name] = datetime.strptime(request.args.get(name, ''), '%Y-%m-%d').strftime('%Y-%m-%d')
+        except ValueError:
+            pass
+    return filters
+
+def admin_listing(listing, model, query, filters, options=()):
+    """One page of an admin list; ``listing`` names the count cache and status filter"""
+    if listing in ADMIN_STATUS_FILTERS:
+        column, values = ADMIN_STATUS_FILTERS[listing]
+        if filters.get('status') in values:
+            query = query.filter(getattr(model, column) == values[filters['status']])
+    if 'date_from' in filters:
+        query = query.filter(model.created_at >= datetime.strptime(filters['date_from'], '%Y-%m-%d'))
+    if 'date_to' in filters:
+        query = query.filter(model.created_at < datetime.strptime(filters['date_to'], '%Y-%m-%d') + timedelta(days=1))
+    return keyset_paginate(query.options(*options), None, per_page=ADMIN_PER_PAGE, model=model)
+
+def selected_ids():
+    return sorted({int(value) for value in request.form.getlist('ids') if value.isdigit()})[:ADMIN_BULK_LIMIT]
+
+def redirect_back(endpoint):
+    # Bulk forms post the list URL they came from, filters and cursor included
+    target = request.form.get('next', '')
+    if target.startswith('/admin/') and not target.startswith('//'):
+        return redirect(target)
+    return redirect(url_for(endpoint))
+
+def bulk_moderate_comments(ids, action):
+    """Approve or delete comments in one statement; returns how many changed"""
+    comment = Comment.__table__
+    connection = db.session.connection()
+    selected = comment.c.id.in_(ids)
+    if action == 'approve':
+        selected = db.and_(selected, comment.c.approved == False)
+    groups = connection.execute(db.select(comment.c.post_id, comment.c.approved, db.func.count())
+                                .where(selected).group_by(comment.c.post_id, comment.c.approved)).all()
+    if not groups:
+        return 0
+    if action == 'approve':
+        connection.execute(comment.update().where(selected).values(approved=True))
+    else:
+        connection.execute(comment.delete().where(selected))
+    _adjust_counter(connection, 'pending_comments', -sum(count for _, approved, count in groups if not approved))
+    # Only posts whose set of approved comments changed need a recount and a purge
+    post_ids = sorted({post_id for post_id, approved, _ in groups if action == 'approve' or approved})
+    if post_ids:
+        recount_comments(connection, post_ids)
+        purge_page_cache(*['post:%d' % post_id for post_id in post_ids])
+    db.session.commit()
+    return sum(count for _, _, count in groups)
+
+def bulk_update_contacts(ids, action):
+    """Mark contact messages read or delete them in one statement; returns how many changed"""
+    contact = Contact.__table__
+    connection = db.session.connection()
+    selected = contact.c.id.in_(ids)
+    unread = connection.execute(db.select(db.func.count()).select_from(contact).where(selected, contact.c.read == False)).scalar()
+    if action == 'mark_read':
+        changed = unread
+        connection.execute(contact.update().where(selected, contact.c.read == False).values(read=True))
+    else:
+        changed = connection.execute(contact.delete().where(selected)).rowcount
+    _adjust_counter(connection, 'unread_contacts', -unread)
+    db.session.commit()
+    return changed
 
 # Admin routes
 @app.route('/admin/login', methods=['GET', 'POST'])
@@ -361,30 +1905,43 @@ def admin_required(f):
 @app.route('/admin')
 @admin_required
 def admin_dashboard():
-    posts_count = Post.query.count()
-    published_count = Post.query.filter_by(published=True).count()
-    categories_count = Category.query.count()
-    tags_count = Tag.query.count()
-    pending_comments = Comment.query.filter_by(approved=False).count()
-    unread_contacts = Contact.query.filter_by(read=False).count()
+    counters = get_admin_counters()
     recent_posts = Post.query.order_by(Post.created_at.desc()).limit(5).all()
     
     return render_template('admin/dashboard.html', 
-                         posts_count=posts_count,
-                         published_count=published_count,
-                         categories_count=categories_count,
-                         tags_count=tags_count,
-                         pending_comments=pending_comments,
-                         unread_contacts=unread_contacts,
-                         recent_posts=recent_posts)
+                         posts_count=counters['posts'],
+                         published_count=counters['published_posts'],
+                         categories_count=counters['categories'],
+                         tags_count=counters['tags'],
+                         recent_posts=recent_posts,
+                         generation_usage=generation_usage(),
+                         generation_usage_days=GENERATION_USAGE_DAYS)
+
+@app.route('/admin/perf', methods=['GET', 'POST'])
+@admin_required
+def admin_perf():
+    if request.method == 'POST':
+        perf_registry.reset()
+        flash('Performance figures reset for this worker.')
+        return redirect(url_for('admin_perf'))
+    perf = perf_registry.snapshot()
+    return render_template('admin/perf.html', perf=perf, pid=os.getpid(), since=datetime.fromtimestamp(perf['since']),
+                           profile_percent=app.config['PROFILE_SAMPLE_PERCENT'])
 
 @app.route('/admin/posts')
 @admin_required
 def admin_posts():
-    posts = Post.query.order_by(Post.created_at.desc()).all()
-    pending_comments = Comment.query.filter_by(approved=False).count()
-    unread_contacts = Contact.query.filter_by(read=False).count()
-    return render_template('admin/posts.html', posts=posts, pending_comments=pending_comments, unread_contacts=unread_contacts)
+    filters = admin_filters()
+    query = Post.query
+    if 'category' in filters:
+        query = query.filter(Post.category_id == filters['category'])
+    # The list shows titles and excerpts; bodies and rendered HTML stay in the database
+    posts = admin_listing('posts', Post, query, filters, (
+        db.load_only(Post.id, Post.title, Post.slug, Post.excerpt, Post.cover_image, Post.published,
+                     Post.created_at, Post.category_id),
+        db.joinedload(Post.category).load_only(Category.name)))
+    categories = Category.query.options(db.load_only(Category.id, Category.name)).order_by(Category.name).all()
+    return render_template('admin/posts.html', posts=posts, filters=filters, categories=categories)
 
 @app.route('/admin/posts/new', methods=['GET', 'POST'])
 @admin_required
@@ -401,9 +1958,10 @@ def admin_new_post():
         if 'cover_image' in request.files:
             file = request.files['cover_image']
             if file and file.filename:
-                filename = str(uuid.uuid4()) + '.' + file.filename.rsplit('.', 1)[1].lower()
-                file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-                cover_image = filename
+                try:
+                    cover_image = save_image_upload(file)
+                except InvalidImage:
+                    flash('Cover image was not saved: the file is not a supported image.')
         
         # Create slug with custom option
         custom_slug = request.form.get('slug', '').strip()
@@ -434,9 +1992,7 @@ def admin_new_post():
         return redirect(url_for('admin_posts'))
     
     categories = Category.query.all()
-    pending_comments = Comment.query.filter_by(approved=False).count()
-    unread_contacts = Contact.query.filter_by(read=False).count()
-    return render_template('admin/post_form.html', categories=categories, pending_comments=pending_comments, unread_contacts=unread_contacts)
+    return render_template('admin/post_form.html', categories=categories)
 
 @app.route('/admin/posts/<int:id>/edit', methods=['GET', 'POST'])
 @admin_required
@@ -467,9 +2023,10 @@ def admin_edit_post(id):
         if 'cover_image' in request.files:
             file = request.files['cover_image']
             if file and file.filename:
-                filename = str(uuid.uuid4()) + '.' + file.filename.rsplit('.', 1)[1].lower()
-                file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-                post.cover_image = filename
+                try:
+                    post.cover_image = save_image_upload(file)
+                except InvalidImage:
+                    flash('Cover image was not saved: the file is not a supported image.')
         
         # Handle tags
         post.tags.clear()
@@ -487,9 +2044,7 @@ def admin_edit_post(id):
     
     categories = Category.query.all()
     tag_names = ', '.join([tag.name for tag in post.tags])
-    pending_comments = Comment.query.filter_by(approved=False).count()
-    unread_contacts = Contact.query.filter_by(read=False).count()
-    return render_template('admin/post_form.html', post=post, categories=categories, tag_names=tag_names, pending_comments=pending_comments, unread_contacts=unread_contacts)
+    return render_template('admin/post_form.html', post=post, categories=categories, tag_names=tag_names)
 
 @app.route('/admin/posts/<int:id>/delete', methods=['POST'])
 @admin_required
@@ -504,9 +2059,8 @@ def admin_delete_post(id):
 @admin_required
 def admin_categories():
     categories = Category.query.all()
-    pending_comments = Comment.query.filter_by(approved=False).count()
-    unread_contacts = Contact.query.filter_by(read=False).count()
-    return render_template('admin/categories.html', categories=categories, pending_comments=pending_comments, unread_contacts=unread_contacts)
+    post_counts = category_post_counts(published_only=False)
+    return render_template('admin/categories.html', categories=categories, post_counts=post_counts)
 
 @app.route('/admin/categories/new', methods=['POST'])
 @admin_required
@@ -515,6 +2069,7 @@ def admin_new_category():
     slug = slugify(name)
     category = Category(name=name, slug=slug)
     db.session.add(category)
+    chrome_cache.invalidate()
     db.session.commit()
     flash('Category created successfully!')
     return redirect(url_for('admin_categories'))
@@ -525,6 +2080,7 @@ def admin_edit_category(id):
     category = Category.query.get_or_404(id)
     category.name = request.form['name']
     category.slug = slugify(category.name)
+    chrome_cache.invalidate()
     db.session.commit()
     flash('Category updated successfully!')
     return redirect(url_for('admin_categories'))
@@ -534,6 +2090,7 @@ def admin_edit_category(id):
 def admin_delete_category(id):
     category = Category.query.get_or_404(id)
     db.session.delete(category)
+    chrome_cache.invalidate()
     db.session.commit()
     flash('Category deleted successfully!')
     return redirect(url_for('admin_categories'))
@@ -541,10 +2098,25 @@ def admin_delete_category(id):
 @app.route('/admin/comments')
 @admin_required
 def admin_comments():
-    comments = Comment.query.order_by(Comment.created_at.desc()).all()
-    pending_comments = Comment.query.filter_by(approved=False).count()
-    unread_contacts = Contact.query.filter_by(read=False).count()
-    return render_template('admin/comments.html', comments=comments, pending_comments=pending_comments, unread_contacts=unread_contacts)
+    filters = admin_filters()
+    query = Comment.query
+    if 'post' in filters:
+        query = query.filter(Comment.post_id == filters['post'])
+    comments = admin_listing('comments', Comment, query, filters, (
+        db.joinedload(Comment.post).load_only(Post.title, Post.slug),))
+    return render_template('admin/comments.html', comments=comments, filters=filters)
+
+@app.route('/admin/comments/bulk', methods=['POST'])
+@admin_required
+def admin_bulk_comments():
+    ids = selected_ids()
+    action = request.form.get('action')
+    if not ids or action not in ('approve', 'delete'):
+        flash('Select some comments and an action first.')
+    else:
+        changed = bulk_moderate_comments(ids, action)
+        flash('%d comment%s %s.' % (changed, '' if changed == 1 else 's', 'approved' if action == 'approve' else 'deleted'))
+    return redirect_back('admin_comments')
 
 @app.route('/admin/comments/<int:id>/approve', methods=['POST'])
 @admin_required
@@ -567,10 +2139,10 @@ def admin_delete_comment(id):
 @app.route('/admin/pages')
 @admin_required
 def admin_pages():
-    pages = Page.query.order_by(Page.created_at.desc()).all()
-    pending_comments = Comment.query.filter_by(approved=False).count()
-    unread_contacts = Contact.query.filter_by(read=False).count()
-    return render_template('admin/pages.html', pages=pages, pending_comments=pending_comments, unread_contacts=unread_contacts)
+    filters = admin_filters()
+    pages = admin_listing('pages', Page, Page.query, filters, (
+        db.load_only(Page.id, Page.title, Page.slug, Page.published, Page.created_at),))
+    return render_template('admin/pages.html', pages=pages, filters=filters)
 
 @app.route('/admin/pages/new', methods=['GET', 'POST'])
 @admin_required
@@ -584,13 +2156,12 @@ def admin_new_page():
         
         page = Page(title=title, slug=slug, content=content, published=published)
         db.session.add(page)
+        chrome_cache.invalidate()
         db.session.commit()
         flash('Page created successfully!')
         return redirect(url_for('admin_pages'))
     
-    pending_comments = Comment.query.filter_by(approved=False).count()
-    unread_contacts = Contact.query.filter_by(read=False).count()
-    return render_template('admin/page_form.html', pending_comments=pending_comments, unread_contacts=unread_contacts)
+    return render_template('admin/page_form.html')
 
 @app.route('/admin/pages/<int:id>/edit', methods=['GET', 'POST'])
 @admin_required
@@ -603,19 +2174,19 @@ def admin_edit_page(id):
         page.published = 'published' in request.form
         custom_slug = request.form.get('slug', '').strip()
         page.slug = slugify(custom_slug) if custom_slug else slugify(page.title)
+        chrome_cache.invalidate()
         db.session.commit()
         flash('Page updated successfully!')
         return redirect(url_for('admin_pages'))
     
-    pending_comments = Comment.query.filter_by(approved=False).count()
-    unread_contacts = Contact.query.filter_by(read=False).count()
-    return render_template('admin/page_form.html', page=page, pending_comments=pending_comments, unread_contacts=unread_contacts)
+    return render_template('admin/page_form.html', page=page)
 
 @app.route('/admin/pages/<int:id>/delete', methods=['POST'])
 @admin_required
 def admin_delete_page(id):
     page = Page.query.get_or_404(id)
     db.session.delete(page)
+    chrome_cache.invalidate()
     db.session.commit()
     flash('Page deleted successfully!')
     return redirect(url_for('admin_pages'))
@@ -623,10 +2194,21 @@ def admin_delete_page(id):
 @app.route('/admin/contacts')
 @admin_required
 def admin_contacts():
-    contacts = Contact.query.order_by(Contact.created_at.desc()).all()
-    pending_comments = Comment.query.filter_by(approved=False).count()
-    unread_contacts = Contact.query.filter_by(read=False).count()
-    return render_template('admin/contacts.html', contacts=contacts, pending_comments=pending_comments, unread_contacts=unread_contacts)
+    filters = admin_filters()
+    contacts = admin_listing('contacts', Contact, Contact.query, filters)
+    return render_template('admin/contacts.html', contacts=contacts, filters=filters)
+
+@app.route('/admin/contacts/bulk', methods=['POST'])
+@admin_required
+def admin_bulk_contacts():
+    ids = selected_ids()
+    action = request.form.get('action')
+    if not ids or action not in ('mark_read', 'delete'):
+        flash('Select some messages and an action first.')
+    else:
+        changed = bulk_update_contacts(ids, action)
+        flash('%d message%s %s.' % (changed, '' if changed == 1 else 's', 'marked as read' if action == 'mark_read' else 'deleted'))
+    return redirect_back('admin_contacts')
 
 @app.route('/admin/contacts/<int:id>/read', methods=['POST'])
 @admin_required
@@ -649,10 +2231,10 @@ def admin_delete_contact(id):
 @app.route('/admin/users')
 @admin_required
 def admin_users():
-    users = User.query.order_by(User.created_at.desc()).all()
-    pending_comments = Comment.query.filter_by(approved=False).count()
-    unread_contacts = Contact.query.filter_by(read=False).count()
-    return render_template('admin/users.html', users=users, pending_comments=pending_comments, unread_contacts=unread_contacts)
+    filters = admin_filters()
+    users = admin_listing('users', User, User.query, filters, (
+        db.load_only(User.id, User.username, User.email, User.is_admin, User.created_at),))
+    return render_template('admin/users.html', users=users, filters=filters)
 
 @app.route('/admin/users/new', methods=['GET', 'POST'])
 @admin_required
@@ -670,9 +2252,7 @@ def admin_new_user():
         flash('User created successfully!')
         return redirect(url_for('admin_users'))
     
-    pending_comments = Comment.query.filter_by(approved=False).count()
-    unread_contacts = Contact.query.filter_by(read=False).count()
-    return render_template('admin/user_form.html', pending_comments=pending_comments, unread_contacts=unread_contacts)
+    return render_template('admin/user_form.html')
 
 @app.route('/admin/users/<int:id>/edit', methods=['GET', 'POST'])
 @admin_required
@@ -689,9 +2269,7 @@ def admin_edit_user(id):
         flash('User updated successfully!')
         return redirect(url_for('admin_users'))
     
-    pending_comments = Comment.query.filter_by(approved=False).count()
-    unread_contacts = Contact.query.filter_by(read=False).count()
-    return render_template('admin/user_form.html', user=user, pending_comments=pending_comments, unread_contacts=unread_contacts)
+    return render_template('admin/user_form.html', user=user)
 
 @app.route('/admin/users/<int:id>/delete', methods=['POST'])
 @admin_required
@@ -732,17 +2310,13 @@ def admin_profile():
         
         return redirect(url_for('admin_profile'))
     
-    pending_comments = Comment.query.filter_by(approved=False).count()
-    unread_contacts = Contact.query.filter_by(read=False).count()
-    return render_template('admin/profile.html', pending_comments=pending_comments, unread_contacts=unread_contacts)
+    return render_template('admin/profile.html')
 
 @app.route('/admin/menu')
 @admin_required
 def admin_menu():
     menu_items = MenuItem.query.filter_by(active=True).order_by(MenuItem.order).all()
-    pending_comments = Comment.query.filter_by(approved=False).count()
-    unread_contacts = Contact.query.filter_by(read=False).count()
-    return render_template('admin/menu.html', menu_items=menu_items, pending_comments=pending_comments, unread_contacts=unread_contacts)
+    return render_template('admin/menu.html', menu_items=menu_items)
 
 @app.route('/admin/menu/new', methods=['GET', 'POST'])
 @admin_required
@@ -754,13 +2328,12 @@ def admin_new_menu_item():
         
         menu_item = MenuItem(title=title, url=url, order=order)
         db.session.add(menu_item)
+        chrome_cache.invalidate()
         db.session.commit()
         flash('Menu item created successfully!')
         return redirect(url_for('admin_menu'))
     
-    pending_comments = Comment.query.filter_by(approved=False).count()
-    unread_contacts = Contact.query.filter_by(read=False).count()
-    return render_template('admin/menu_form.html', pending_comments=pending_comments, unread_contacts=unread_contacts)
+    return render_template('admin/menu_form.html')
 
 @app.route('/admin/menu/<int:id>/edit', methods=['GET', 'POST'])
 @admin_required
@@ -771,19 +2344,19 @@ def admin_edit_menu_item(id):
         menu_item.title = request.form['title']
         menu_item.url = request.form['url']
         menu_item.order = int(request.form.get('order', 0))
+        chrome_cache.invalidate()
         db.session.commit()
         flash('Menu item updated successfully!')
         return redirect(url_for('admin_menu'))
     
-    pending_comments = Comment.query.filter_by(approved=False).count()
-    unread_contacts = Contact.query.filter_by(read=False).count()
-    return render_template('admin/menu_form.html', menu_item=menu_item, pending_comments=pending_comments, unread_contacts=unread_contacts)
+    return render_template('admin/menu_form.html', menu_item=menu_item)
 
 @app.route('/admin/menu/<int:id>/delete', methods=['POST'])
 @admin_required
 def admin_delete_menu_item(id):
     menu_item = MenuItem.query.get_or_404(id)
     db.session.delete(menu_item)
+    chrome_cache.invalidate()
     db.session.commit()
     flash('Menu item deleted successfully!')
     return redirect(url_for('admin_menu'))
@@ -792,29 +2365,44 @@ def admin_delete_menu_item(id):
 @admin_required
 def admin_settings():
     if request.method == 'POST':
-        Setting.set('site_name', request.form.get('site_name', 'ModernBlog'))
-        Setting.set('gemini_api_key', request.form.get('gemini_api_key', ''))
-        Setting.set('tracking_code', request.form.get('tracking_code', ''))
-        Setting.set('ads_header', request.form.get('ads_header', ''))
-        Setting.set('ads_content', request.form.get('ads_content', ''))
-        Setting.set('ads_sidebar', request.form.get('ads_sidebar', ''))
-        Setting.set('ads_footer', request.form.get('ads_footer', ''))
+        values = {
+            'site_name': request.form.get('site_name', 'ModernBlog'),
+            'gemini_api_key': request.form.get('gemini_api_key', ''),
+            'tracking_code': request.form.get('tracking_code', ''),
+            'ads_header': request.form.get('ads_header', ''),
+            'ads_content': request.form.get('ads_content', ''),
+            'ads_sidebar': request.form.get('ads_sidebar', ''),
+            'ads_footer': request.form.get('ads_footer', '')
+        }
         
         # Handle logo upload
         if 'logo' in request.files:
             file = request.files['logo']
             if file and file.filename:
                 allowed_extensions = {'png', 'jpg', 'jpeg', 'gif', 'svg'}
-                if '.' in file.filename and file.filename.rsplit('.', 1)[1].lower() in allowed_extensions:
-                    filename = 'logo.' + file.filename.rsplit('.', 1)[1].lower()
-                    file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-                    Setting.set('logo', filename)
+                extension = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else ''
+                if extension == 'svg':
+                    data = file.read()
+                    values['logo'] = content_key(data, 'svg')
+                    upload_storage.save(values['logo'], io.BytesIO(data), 'image/svg+xml')
+                    # No variants to render, but the row lets gc_uploads.py collect it once replaced
+                    asset = ImageAsset.query.filter_by(filename=values['logo']).first()
+                    if asset is None:
+                        asset = ImageAsset(filename=values['logo'], status='ready')
+                        db.session.add(asset)
+                    asset.uploaded_at = datetime.utcnow()
+                elif extension in allowed_extensions:
+                    try:
+                        values['logo'] = save_image_upload(file)
+                    except InvalidImage:
+                        flash('Logo was not saved: the file is not a supported image.')
+        
+        # One transaction and one cache invalidation for the whole form
+        Setting.set_many(values)
         
         flash('Settings saved successfully!')
         return redirect(url_for('admin_settings'))
     
-    pending_comments = Comment.query.filter_by(approved=False).count()
-    unread_contacts = Contact.query.filter_by(read=False).count()
     return render_template('admin/settings.html', 
                          site_name=Setting.get('site_name', 'ModernBlog'),
                          logo=Setting.get('logo'),
@@ -823,9 +2411,7 @@ def admin_settings():
                          ads_header=Setting.get('ads_header'),
                          ads_content=Setting.get('ads_content'),
                          ads_sidebar=Setting.get('ads_sidebar'),
-                         ads_footer=Setting.get('ads_footer'),
-                         pending_comments=pending_comments,
-                         unread_contacts=unread_contacts)
+                         ads_footer=Setting.get('ads_footer'))
 
 @app.route('/admin/upload', methods=['POST'])
 @admin_required
@@ -843,145 +2429,332 @@ def admin_upload():
         return jsonify({'error': 'Invalid file type'}), 400
     
     if file:
-        filename = str(uuid.uuid4()) + '.' + file.filename.rsplit('.', 1)[1].lower()
-        file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-        return jsonify({'url': url_for('static', filename=f'uploads/{filename}')})
+        try:
+            filename = save_image_upload(file)
+        except InvalidImage:
+            return jsonify({'error': 'Invalid image'}), 400
+        db.session.commit()
+        return jsonify({'url': upload_url(filename)})
+
+# AI drafts. The request only records a job; the model calls run on background threads in
+# this worker, and the editor polls the job row, so a slow model never holds a worker that
+# could be serving readers. Jobs left running by a worker that died are reported as failed.
+generation_executor = ThreadPoolExecutor(max_workers=app.config['GENERATION_WORKERS'], thread_name_prefix='generation') \
+    if app.config['GENERATION_WORKERS'] > 0 else None
+# Title, excerpt and body of each draft are requested concurrently
+generation_call_executor = ThreadPoolExecutor(max_workers=3 * app.config['GENERATION_WORKERS'], thread_name_prefix='generation-call') \
+    if app.config['GENERATION_WORKERS'] > 0 else None
+# Free stream slots in this worker, taken for the life of a streamed response
+generation_streams = threading.BoundedSemaphore(max(1, app.config['GENERATION_MAX_STREAMS']))
+GENERATION_JOB_RETENTION = timedelta(days=1)
+GENERATION_CALL_RETENTION = timedelta(days=90)
+GENERATION_USAGE_DAYS = 30
+_generation_backends = {}
+
+class GenerationStore:
+    """Database side of RecordingBackend for one model. Calls run on generation threads, so
+    each operation uses its own app context and session."""
+    
+    def __init__(self, model_name):
+        self.model_name = model_name
+    
+    def get(self, key):
+        with app.app_context():
+            entry = db.session.get(GenerationCacheEntry, key)
+            now = datetime.utcnow()
+            if entry is None or entry.created_at < now - timedelta(hours=app.config['GENERATION_CACHE_TTL']):
+                return None
+            completion = Completion(entry.text, entry.prompt_tokens, entry.response_tokens)
+            entry.last_used_at = now
+            db.session.commit()
+            return completion
+    
+    def put(self, key, completion):
+        with app.app_context():
+            table = GenerationCacheEntry.__table__
+            db.session.merge(GenerationCacheEntry(key=key, model=self.model_name, text=completion.text,
+                                                  prompt_tokens=completion.prompt_tokens,
+                                                  response_tokens=completion.response_tokens,
+                                                  created_at=datetime.utcnow(), last_used_at=datetime.utcnow()))
+            db.session.flush()
+            # Keep the newest entries; the rest, and anything past its TTL, is evicted
+            keep = db.select(table.c.key).order_by(table.c.last_used_at.desc()) \
+                .limit(app.config['GENERATION_CACHE_MAX_ENTRIES']).scalar_subquery()
+            expired = datetime.utcnow() - timedelta(hours=app.config['GENERATION_CACHE_TTL'])
+            db.session.execute(table.delete().where(db.or_(table.c.key.not_in(keep), table.c.created_at < expired)))
+            db.session.commit()
+    
+    def record(self, part, status, latency, completion):
+        generation_call_duration.observe(latency, part=part or 'other', status=status)
+        if status != 'cached':
+            generation_tokens.inc(completion.prompt_tokens, part=part or 'other', direction='prompt')
+            generation_tokens.inc(completion.response_tokens, part=part or 'other', direction='response')
+        with app.app_context():
+            values = {'calls': 1, 'latency_ms': int(latency * 1000), 'prompt_tokens': completion.prompt_tokens,
+                      'response_tokens': completion.response_tokens}
+            now = datetime.utcnow()
+            db.session.add(GenerationCall(part=part, model=self.model_name, status=status, created_at=now, **{
+                name: value for name, value in values.items() if name != 'calls'}))
+            db.session.execute(GenerationCall.__table__.delete().where(
+                GenerationCall.created_at < now - GENERATION_CALL_RETENTION))
+            _add_generation_usage(db.session.connection(), now.date(), part or 'other', status, values)
+            db.session.commit()
+
+def _add_generation_usage(connection, day, part, status, values):
+    table = GenerationUsage.__table__
+    where = (table.c.day == day, table.c.part == part, table.c.status == status)
+    increments = {name: table.c[name] + value for name, value in values.items()}
+    if connection.execute(table.update().where(*where).values(**increments)).rowcount == 0:
+        try:
+            with connection.begin_nested():
+                connection.execute(table.insert().values(day=day, part=part, status=status, **values))
+        except db.exc.IntegrityError:
+            # Another worker created the day's row first
+            connection.execute(table.update().where(*where).values(**increments))
+
+def generation_usage(days=GENERATION_USAGE_DAYS):
+    """Per-part totals over the last ``days`` days, from the maintained daily rollups"""
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    usage = {}
+    for row in GenerationUsage.query.filter(GenerationUsage.day >= since):
+        part = usage.setdefault(row.part, {'calls': 0, 'cached': 0, 'failed': 0, 'model_calls': 0,
+                                           'model_ms': 0, 'prompt_tokens': 0, 'response_tokens': 0})
+        part['calls'] += row.calls
+        if row.status == 'cached':
+            part['cached'] += row.calls
+            continue
+        part['failed'] += row.calls if row.status == 'failed' else 0
+        part['model_calls'] += row.calls
+        part['model_ms'] += row.latency_ms
+        part['prompt_tokens'] += row.prompt_tokens
+        part['response_tokens'] += row.response_tokens
+    for part in usage.values():
+        part['avg_ms'] = part['model_ms'] // part['model_calls'] if part['model_calls'] else 0
+        part['hit_rate'] = round(100 * part['cached'] / part['calls']) if part['calls'] else 0
+    return dict(sorted(usage.items()))
+
+def generation_backend():
+    """The configured backend, built once per API key and model and reused by every job"""
+    if app.config['GENERATION_BACKEND'] == 'fake':
+        key = ('fake',)
+    else:
+        api_key = Setting.get('gemini_api_key')
+        if not api_key:
+            return None
+        key = ('gemini', api_key, app.config['GENERATION_MODEL'])
+    backend = _generation_backends.get(key)
+    if backend is None:
+        model = FakeBackend() if key[0] == 'fake' else GeminiBackend(genai, key[1], key[2])
+        backend = RecordingBackend(model, GenerationStore(model.model_name))
+        _generation_backends.clear()
+        _generation_backends[key] = backend
+    return backend
+
+def run_generation_job(job_id, backend):
+    with app.app_context():
+        job = db.session.get(GenerationJob, job_id)
+        if job is None:
+            return
+        job.status = 'running'
+        topic = job.topic
+        db.session.commit()
+        try:
+            draft = generate_draft(backend, topic, generation_call_executor, app.config['GENERATION_TIMEOUT'])
+        except Exception as e:
+            if not isinstance(e, GenerationError):
+                app.logger.exception('Generating a draft about %r failed', topic)
+            job.status, job.error = 'failed', f'Failed to generate blog: {e}'
+        else:
+            job.status = 'done'
+            job.title, job.excerpt, job.content = draft['title'], draft['excerpt'], draft['content']
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+
+def queue_generation_job(topic, backend):
+    # Finished drafts are only needed until the editor picks them up
+    GenerationJob.query.filter(GenerationJob.created_at < datetime.utcnow() - GENERATION_JOB_RETENTION) \
+        .delete(synchronize_session=False)
+    job = GenerationJob(topic=topic)
+    db.session.add(job)
+    db.session.flush()
+    db.session.info.setdefault('generation_jobs', []).append((job.id, backend))
+    return job
+
+@db.event.listens_for(db.Session, 'after_commit')
+def _start_generation_jobs(session):
+    for job_id, backend in session.info.pop('generation_jobs', []):
+        if generation_executor is None:
+            run_generation_job(job_id, backend)
+        else:
+            generation_executor.submit(run_generation_job, job_id, backend)
+
+@db.event.listens_for(db.Session, 'after_rollback')
+def _discard_generation_jobs(session):
+    session.info.pop('generation_jobs', None)
 
 @app.route('/admin/generate-blog', methods=['POST'])
 @admin_required
 def admin_generate_blog():
-    try:
-        api_key = Setting.get('gemini_api_key')
-        if not api_key:
-            return jsonify({'error': 'Gemini API key not configured'}), 400
-        
-        topic = request.json.get('topic', '').strip()
-        if not topic:
-            return jsonify({'error': 'Topic is required'}), 400
-        
-        # Configure Gemini
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-1.5-pro')
-        
-        # Generate title
-        title_prompt = f"Create an engaging, SEO-friendly blog post title about: {topic}. Return only the title, nothing else."
-        title_response = model.generate_content(title_prompt)
-        title = title_response.text.strip().replace('"', '')
-        
-        # Generate excerpt
-        excerpt_prompt = f"Write a compelling 2-3 sentence excerpt/summary for a blog post about: {topic}. Make it engaging and informative. Return only the excerpt, nothing else."
-        excerpt_response = model.generate_content(excerpt_prompt)
-        excerpt = excerpt_response.text.strip().replace('"', '')
-        
-        # Generate content
-        content_prompt = f"""
-Write a comprehensive, well-structured blog post about: {topic}
-
-Requirements:
-- Use proper markdown formatting with headings (##, ###)
-- Include practical examples and actionable tips
-- Make it informative and engaging
-- Aim for 800-1500 words
-- Use bullet points and numbered lists where appropriate
-- Include a conclusion section
-- Write in a professional but accessible tone
-
-Return only the markdown content, no additional text or formatting.
-"""
-        
-        content_response = model.generate_content(content_prompt)
-        content = content_response.text.strip()
-        
-        return jsonify({
-            'title': title,
-            'excerpt': excerpt,
-            'content': content
-        })
-            
-    except Exception as e:
-        return jsonify({'error': f'Failed to generate blog: {str(e)}'}), 500
+    topic = (request.get_json(silent=True) or {}).get('topic', '').strip()
+    if not topic:
+        return jsonify({'error': 'Topic is required'}), 400
+    backend = generation_backend()
+    if backend is None:
+        return jsonify({'error': 'Gemini API key not configured'}), 400
+    job = queue_generation_job(topic[:500], backend)
+    job_id = job.id
+    db.session.commit()
+    return jsonify({'id': job_id, 'status_url': url_for('admin_generation_job', job_id=job_id)}), 202
+
+@app.route('/admin/generate-blog/stream')
+@admin_required
+def admin_generate_blog_stream():
+    """Stream a draft as server-sent events: the body chunk by chunk, a rendered preview after
+    each finished block, the title and excerpt as they arrive, then 'done' or 'error'.
+
+    Holds a worker thread while the model writes, but stops as soon as the author disconnects.
+    Past GENERATION_MAX_STREAMS streams the only event is 'busy', and the editor polls a job.
+    """
+    topic = request.args.get('topic', '').strip()
+    if not topic:
+        return jsonify({'error': 'Topic is required'}), 400
+    backend = generation_backend()
+    if backend is None:
+        return jsonify({'error': 'Gemini API key not configured'}), 400
+    if not generation_streams.acquire(blocking=False):
+        response = app.response_class(sse('busy', {}), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    
+    def events():
+        # Sent at once so the editor knows the draft has started before the model answers
+        yield sse('start', {'topic': topic})
+        # Nothing else in the request needs the database; do not hold a connection while streaming
+        db.session.close()
+        draft = stream_draft(backend, topic[:500], generation_call_executor, app.config['GENERATION_TIMEOUT'])
+        content = ''
+        try:
+            for event, data in draft:
+                yield sse(event, data)
+                if event == 'content':
+                    previous, content = content, content + data
+                    # Blank lines end Markdown blocks; re-render the preview when one completes
+                    if content.count('\n\n') > previous.count('\n\n'):
+                        yield sse('preview', render_markdown(content))
+            yield sse('preview', render_markdown(content.strip()))
+            yield sse('done', {})
+        except Exception as e:
+            if not isinstance(e, GenerationError):
+                app.logger.exception('Streaming a draft about %r failed', topic)
+            yield sse('error', {'error': f'Failed to generate blog: {e}'})
+        finally:
+            # Also reached when the client goes away and the server closes the response
+            draft.close()
+    
+    response = app.response_class(stream_with_context(events()), mimetype='text/event-stream')
+    # The server closes every response, even one whose body was never read
+    response.call_on_close(generation_streams.release)
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stops nginx buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/admin/generate-blog/<job_id>')
+@admin_required
+def admin_generation_job(job_id):
+    job = db.get_or_404(GenerationJob, job_id)
+    stale_before = datetime.utcnow() - timedelta(seconds=2 * app.config['GENERATION_TIMEOUT'])
+    if job.status in ('pending', 'running') and job.created_at < stale_before:
+        job.status, job.error = 'failed', 'Generation was interrupted; please try again'
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+    return jsonify(job.to_dict())
+
+@app.route('/metrics')
+def prometheus_metrics():
+    token = app.config['METRICS_TOKEN']
+    if not token:
+        if not (app.debug or app.testing):
+            abort(404)
+    elif not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        abort(401)
+    return metrics_registry.exposition(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
 
 @app.route('/robots.txt')
 def robots_txt():
-    base_url = request.url_root.rstrip('/')
+    base_url = app.config['SITE_URL']
     return '''User-agent: *
 Allow: /
 Disallow: /admin/
 Sitemap: {}/sitemap.xml'''.format(base_url), 200, {'Content-Type': 'text/plain'}
 
-@app.route('/sitemap.xml')
-def sitemap_xml():
-    base_url = request.url_root.rstrip('/')
+def sitemap_urls(base_url):
+    """Every public URL as a <url> fragment, streamed with only the columns the sitemap needs"""
+    yield url_entry(base_url, changefreq='daily', priority='1.0')
+    posts = db.session.query(Post.slug, Post.updated_at).filter(Post.published == True) \
+        .order_by(Post.id).execution_options(yield_per=1000)
+    for slug, updated_at in posts:
+        yield url_entry(f'{base_url}/post/{slug}', updated_at, 'weekly', '0.8')
+    pages = db.session.query(Page.slug, Page.updated_at).filter(Page.published == True).order_by(Page.id)
+    for slug, updated_at in pages:
+        yield url_entry(f'{base_url}/page/{slug}', updated_at, 'monthly', '0.6')
+    for (slug,) in db.session.query(Category.slug).order_by(Category.id):
+        yield url_entry(f'{base_url}/category/{slug}', changefreq='weekly', priority='0.7')
+    yield url_entry(f'{base_url}/categories', changefreq='weekly', priority='0.5')
+
+# Keyed by SITE_URL, so there is one store per configured address rather than per Host header
+_sitemap_stores = {}
+
+def sitemap_store(base_url):
+    store = _sitemap_stores.get(base_url)
+    if store is None:
+        directory = os.path.join(app.config['SITEMAP_DIR'], hashlib.sha1(base_url.encode('utf-8')).hexdigest()[:12])
+        store = _sitemap_stores[base_url] = SitemapStore(directory, app.config['SITEMAP_MAX_URLS'])
+    return store
+
+def serve_sitemap(number=None):
+    base_url = app.config['SITE_URL']
+    latest, stamp = listing_validator()
+    pages_latest, pages_count = db.session.query(db.func.max(Page.updated_at), db.func.count(Page.id)).filter(Page.published == True).one()
+    last_modified = max(filter(None, [latest, pages_latest]), default=None)
+    # Category renames bump the chrome stamp, which the validator parts do not cover
+    parts = (base_url, stamp, pages_latest, pages_count, chrome_cache.stamp())
+    gzipped = request.accept_encodings['gzip'] > 0
+    not_modified = check_not_modified(last_modified, 'sitemap', number, gzipped, *parts)
+    if not_modified:
+        return not_modified
     
-    posts = Post.query.filter_by(published=True).all()
-    pages = Page.query.filter_by(published=True).all()
-    categories = Category.query.all()
-    
-    sitemap = '''<?xml version="1.0" encoding="UTF-8"?>
-<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
-'''
-    
-    # Homepage
-    sitemap += f'''  <url>
-    <loc>{base_url}</loc>
-    <changefreq>daily</changefreq>
-    <priority>1.0</priority>
-  </url>
-'''
+    store = sitemap_store(base_url)
+    fingerprint = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+    manifest = store.current(fingerprint) or store.build(fingerprint, sitemap_urls(base_url), base_url)
+    if number is None:
+        filename = manifest['root']
+    elif 1 <= number <= len(manifest['shards']):
+        filename = manifest['shards'][number - 1]['file']
+    else:
+        abort(404)
     
-    # Posts
-    for post in posts:
-        sitemap += f'''  <url>
-    <loc>{base_url}/post/{post.slug}</loc>
-    <lastmod>{post.updated_at.strftime('%Y-%m-%d')}</lastmod>
-    <changefreq>weekly</changefreq>
-    <priority>0.8</priority>
-  </url>
-'''
-    
-    # Pages
-    for page in pages:
-        sitemap += f'''  <url>
-    <loc>{base_url}/page/{page.slug}</loc>
-    <lastmod>{page.updated_at.strftime('%Y-%m-%d')}</lastmod>
-    <changefreq>monthly</changefreq>
-    <priority>0.6</priority>
-  </url>
-'''
-    
-    # Categories
-    for category in categories:
-        sitemap += f'''  <url>
-    <loc>{base_url}/category/{category.slug}</loc>
-    <changefreq>weekly</changefreq>
-    <priority>0.7</priority>
-  </url>
-'''
-    
-    # Categories page
-    sitemap += f'''  <url>
-    <loc>{base_url}/categories</loc>
-    <changefreq>weekly</changefreq>
-    <priority>0.5</priority>
-  </url>
-'''
-    
-    sitemap += '</urlset>'
-    
-    response = app.response_class(sitemap, mimetype='application/xml')
+    if gzipped:
+        with open(store.path(filename), 'rb') as f:
+            response = app.response_class(f.read(), mimetype='application/xml')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        with gzip.open(store.path(filename), 'rb') as f:
+            response = app.response_class(f.read(), mimetype='application/xml')
+    response.vary.add('Accept-Encoding')
     return response
 
+@app.route('/sitemap.xml')
+def sitemap_xml():
+    return serve_sitemap()
+
+@app.route('/sitemap-<int:number>.xml')
+def sitemap_shard(number):
+    return serve_sitemap(number)
+
 @app.errorhandler(404)
 def not_found_error(error):
-    categories = Category.query.all()
-    pages = Page.query.filter_by(published=True).all()
-    menu_items = MenuItem.query.filter_by(active=True).order_by(MenuItem.order).all()
-    site_name = Setting.get('site_name', 'ModernBlog')
-    logo = Setting.get('logo')
-    tracking_code = Setting.get('tracking_code')
-    ads_header = Setting.get('ads_header')
-    ads_footer = Setting.get('ads_footer')
-    return render_template('404.html', categories=categories, pages=pages, menu_items=menu_items, site_name=site_name, logo=logo, tracking_code=tracking_code, ads_header=ads_header, ads_footer=ads_footer), 404
+    return render_template('404.html'), 404
 
 if __name__ == '__main__':
     with app.app_context():
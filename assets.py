@@ -0,0 +1,110 @@
+"""
+Fingerprinted static assets for ModernBlog
+Static files are addressed by a hash of their content (css/style.3f2a1b9c04de.css), so their
+URLs change whenever they do and can be cached forever
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+try:
+    import brotli
+except ImportError:  # .br siblings are optional
+    brotli = None
+
+HASH_LENGTH = 12
+MANIFEST_NAME = 'manifest.json'
+# Uploads are content-addressed already and managed by the upload storage
+SKIP_DIRECTORIES = {'uploads'}
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.map', '.txt', '.xml', '.ico'}
+FINGERPRINTED = re.compile(r'\.[0-9a-f]{%d}\.[^./]+$' % HASH_LENGTH)
+
+
+def fingerprint(path, data):
+    """``css/style.css`` -> ``css/style.<hash>.css``"""
+    stem, extension = os.path.splitext(path)
+    return f'{stem}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{extension}'
+
+
+def source_files(static_folder):
+    """Paths, relative to ``static_folder``, of the files that get fingerprinted"""
+    for directory, subdirectories, filenames in os.walk(static_folder):
+        if directory == static_folder:
+            subdirectories[:] = [name for name in subdirectories if name not in SKIP_DIRECTORIES]
+        for filename in filenames:
+            path = os.path.relpath(os.path.join(directory, filename), static_folder).replace(os.sep, '/')
+            if path == MANIFEST_NAME or filename.endswith(('.gz', '.br', '.tmp')) or FINGERPRINTED.search(filename):
+                continue
+            yield path
+
+
+def scan(static_folder):
+    """Map each static file to its fingerprinted name"""
+    assets = {}
+    for path in sorted(source_files(static_folder)):
+        with open(os.path.join(static_folder, path), 'rb') as f:
+            assets[path] = fingerprint(path, f.read())
+    return assets
+
+
+def _write(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def build(static_folder, compress=True):
+    """Write fingerprinted copies, optional .gz/.br siblings and the manifest; returns the manifest.
+
+    Copies from earlier builds are left in place so pages rendered before a deploy keep working.
+    """
+    assets = scan(static_folder)
+    for path, hashed in assets.items():
+        target = os.path.join(static_folder, hashed)
+        with open(os.path.join(static_folder, path), 'rb') as f:
+            data = f.read()
+        if not os.path.exists(target):
+            _write(target, data)
+        if not compress or os.path.splitext(path)[1] not in COMPRESSIBLE:
+            continue
+        compressed = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            compressed['.br'] = brotli.compress(data)
+        for suffix, body in compressed.items():
+            # Only worth serving when it is smaller
+            if len(body) < len(data) and not os.path.exists(target + suffix):
+                _write(target + suffix, body)
+    _write(os.path.join(static_folder, MANIFEST_NAME), json.dumps(assets, indent=2, sort_keys=True).encode('utf-8'))
+    return assets
+
+
+class AssetManifest:
+    """Fingerprinted names for the files in a static folder.
+
+    Uses the manifest written by ``build`` when there is one, otherwise hashes the files once
+    at startup; the app serves fingerprinted names either way.
+    """
+
+    def __init__(self, static_folder):
+        self.static_folder = static_folder
+        self.assets = self._load() or scan(static_folder)
+        self.originals = {hashed: path for path, hashed in self.assets.items()}
+
+    def _load(self):
+        try:
+            with open(os.path.join(self.static_folder, MANIFEST_NAME)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def url_path(self, path):
+        return self.assets.get(path, path)
+
+    def original(self, path):
+        """The source file behind a fingerprinted path, or None for anything else"""
+        return self.originals.get(path)
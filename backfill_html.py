@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Backfill rendered Markdown for ModernBlog
+Migrates the schema if needed and renders stale rows
+"""
+
+import sys
+from app import app, db, Post, Page, render_markdown, content_digest
+from migrations import upgrade
+
+BATCH_SIZE = 200
+
+def backfill(model, force=False):
+    """Render every row whose cached HTML is missing or out of date, committing in batches"""
+    rendered = 0
+    last_id = 0
+    while True:
+        rows = db.session.query(model.id, model.content, model.content_hash, model.content_html.is_(None), model.updated_at) \
+            .filter(model.id > last_id).order_by(model.id).limit(BATCH_SIZE).all()
+        if not rows:
+            break
+        for row_id, content, content_hash, missing_html, updated_at in rows:
+            digest = content_digest(content)
+            if force or missing_html or content_hash != digest:
+                # Keep updated_at as-is: re-rendering is not an edit
+                model.query.filter_by(id=row_id).update({
+                    'content_html': render_markdown(content),
+                    'content_hash': digest,
+                    'updated_at': updated_at
+                }, synchronize_session=False)
+                rendered += 1
+        last_id = rows[-1][0]
+        db.session.commit()
+    return rendered
+
+def main():
+    force = '--force' in sys.argv
+    with app.app_context():
+        upgrade()
+        print("✓ Database schema up to date")
+        for model in (Post, Page):
+            count = backfill(model, force=force)
+            print(f"✓ {model.__name__}: rendered {count} rows")
+
+if __name__ == '__main__':
+    main()
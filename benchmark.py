@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Load test for ModernBlog
+Replays a weighted mix of public and admin routes against the WSGI app in-process, on the
+database configured by DATABASE_URL (fill one with generate_data.py first), and reports
+throughput, latency percentiles and queries per request for every route. A run can be saved
+as the baseline; later runs fail when a route is slower, issues more queries or the overall
+throughput drops beyond the tolerance.
+
+Usage: python benchmark.py [--requests N] [--threads N] [--warmup N] [--seed N] [--page-cache BACKEND]
+                           [--baseline FILE] [--save-baseline] [--tolerance PERCENT]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlencode
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000, help='measured requests (default: 2000)')
+    parser.add_argument('--threads', type=int, default=1, help='concurrent clients (default: 1)')
+    parser.add_argument('--warmup', type=int, default=100, help='unmeasured requests first (default: 100)')
+    parser.add_argument('--seed', type=int, default=42, help='seed for the request sequence (default: 42)')
+    parser.add_argument('--page-cache', default='none', choices=('none', 'memory', 'filesystem'),
+                        help='full-page cache backend to measure with (default: none, every request renders)')
+    parser.add_argument('--baseline', default='benchmark_baseline.json', help='baseline file (default: benchmark_baseline.json)')
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the baseline instead of comparing')
+    parser.add_argument('--tolerance', type=float, default=25, help='allowed slowdown in percent (default: 25)')
+    return parser.parse_args()
+
+args = parse_args()
+# Configured before the app is imported, as the app reads them at import time
+os.environ['PAGE_CACHE_BACKEND'] = args.page_cache
+os.environ.setdefault('SUBMISSION_FLUSH_INTERVAL', '0')
+
+from sqlalchemy.engine import Engine
+from app import app, db, Counter, Post, Tag
+from generate_data import WORDS
+
+# Route name, weight (share of requests) and the function picking a URL for it
+ROUTE_MIX = (
+    ('index', 25, lambda rng, sample: '/'),
+    ('post_detail', 35, lambda rng, sample: '/post/' + rng.choice(sample['posts'])),
+    ('search', 10, lambda rng, sample: '/search?' + urlencode({'q': ' '.join(rng.sample(WORDS, rng.randint(1, 2)))})),
+    ('tag_posts', 12, lambda rng, sample: '/tag/' + rng.choice(sample['tags'])),
+    ('sitemap', 3, lambda rng, sample: '/sitemap.xml'),
+    ('admin_posts', 5, lambda rng, sample: rng.choice(('/admin/posts', '/admin/posts?status=draft'))),
+    ('admin_comments', 6, lambda rng, sample: rng.choice(('/admin/comments', '/admin/comments?status=pending'))),
+    ('admin_contacts', 4, lambda rng, sample: rng.choice(('/admin/contacts', '/admin/contacts?status=unread'))),
+)
+SAMPLE_SIZE = 500
+# Latency differences below this are noise rather than regressions
+MIN_REGRESSION_MS = 1.0
+# Time-based cache checks add the odd query; a regression adds at least one to every request
+QUERY_SLACK = 0.5
+PERCENTILES = (50, 95, 99)
+
+_queries = threading.local()
+
+@db.event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    _queries.count = getattr(_queries, 'count', 0) + 1
+
+def sample_urls(rng):
+    """Slugs of random published posts and of random tags, found through the primary key"""
+    sample = {}
+    queries = (('posts', Post, db.session.query(Post.slug).filter(Post.published == True)),
+               ('tags', Tag, db.session.query(Tag.slug)))
+    for name, model, query in queries:
+        highest = db.session.query(db.func.max(model.id)).scalar() or 1
+        slugs = set()
+        for _ in range(SAMPLE_SIZE):
+            slug = query.filter(model.id >= rng.randint(1, highest)).order_by(model.id).limit(1).scalar()
+            if slug is not None:
+                slugs.add(slug)
+        if not slugs:
+            sys.exit(f"No {name} to request; fill the database with generate_data.py first")
+        sample[name] = sorted(slugs)
+    return sample
+
+def plan_requests(rng, sample, count):
+    names = [name for name, weight, url in ROUTE_MIX]
+    weights = [weight for name, weight, url in ROUTE_MIX]
+    urls = {name: url for name, weight, url in ROUTE_MIX}
+    return [(name, urls[name](rng, sample)) for name in rng.choices(names, weights=weights, k=count)]
+
+def make_clients():
+    public, admin = app.test_client(), app.test_client()
+    with admin.session_transaction() as sess:
+        sess['admin'] = True
+        sess['admin_user'] = 'benchmark'
+    return public, admin
+
+def run(plan):
+    """(route, seconds, queries, status) for every request in ``plan``, in order"""
+    public, admin = make_clients()
+    results = []
+    for name, url in plan:
+        client = admin if name.startswith('admin_') else public
+        _queries.count = 0
+        started = time.perf_counter()
+        response = client.get(url)
+        response.get_data()
+        elapsed = time.perf_counter() - started
+        results.append((name, elapsed, _queries.count, response.status_code))
+    return results
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))]
+
+def summarize(results, elapsed):
+    routes = {}
+    for name, seconds, queries, status in results:
+        routes.setdefault(name, []).append((seconds * 1000, queries, status))
+    report = {'requests': len(results), 'seconds': round(elapsed, 3), 'throughput': round(len(results) / elapsed, 2), 'routes': {}}
+    for name, weight, url in ROUTE_MIX:
+        samples = routes.get(name)
+        if not samples:
+            continue
+        latencies = [latency for latency, queries, status in samples]
+        report['routes'][name] = dict(
+            requests=len(samples),
+            errors=sum(1 for latency, queries, status in samples if status >= 400),
+            queries=round(sum(queries for latency, queries, status in samples) / len(samples), 2),
+            mean=round(sum(latencies) / len(latencies), 3),
+            **{f'p{p}': round(percentile(latencies, p), 3) for p in PERCENTILES})
+    return report
+
+def print_report(report):
+    print(f"\n{report['requests']} requests in {report['seconds']:.1f}s: {report['throughput']:.1f} requests/s")
+    print(f"\n{'route':<16} {'requests':>8} {'errors':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'queries':>8}")
+    for name, route in report['routes'].items():
+        print(f"{name:<16} {route['requests']:>8} {route['errors']:>6} {route['p50']:>7.2f}ms {route['p95']:>7.2f}ms "
+              f"{route['p99']:>7.2f}ms {route['queries']:>8.2f}")
+
+def compare(report, baseline, tolerance):
+    """Descriptions of every way ``report`` is worse than ``baseline``"""
+    factor = 1 + tolerance / 100
+    regressions = []
+    if report['throughput'] < baseline['throughput'] / factor:
+        regressions.append(f"throughput {report['throughput']:.1f}/s, baseline {baseline['throughput']:.1f}/s")
+    for name, route in report['routes'].items():
+        base = baseline['routes'].get(name)
+        if base is None:
+            continue
+        if route['p95'] > base['p95'] * factor and route['p95'] - base['p95'] > MIN_REGRESSION_MS:
+            regressions.append(f"{name} p95 {route['p95']:.2f}ms, baseline {base['p95']:.2f}ms")
+        if route['queries'] > base['queries'] + QUERY_SLACK:
+            regressions.append(f"{name} {route['queries']:.2f} queries per request, baseline {base['queries']:.2f}")
+        if route['errors'] > base['errors']:
+            regressions.append(f"{name} {route['errors']} errors, baseline {base['errors']}")
+    return regressions
+
+def main():
+    rng = random.Random(args.seed)
+    with app.app_context():
+        dataset = dict(db.session.query(Counter.name, Counter.value).all())
+        sample = sample_urls(rng)
+        db.session.remove()
+    print(f"Dataset: {dataset.get('posts', '?')} posts, {dataset.get('tags', '?')} tags, "
+          f"{dataset.get('pending_comments', '?')} pending comments; page cache: {args.page_cache}")
+
+    # Every route once, so one-off work such as building the sitemap is not measured
+    warmup = [(name, url(rng, sample)) for name, weight, url in ROUTE_MIX] + plan_requests(rng, sample, args.warmup)
+    run(warmup)
+    plan = plan_requests(rng, sample, args.requests)
+    shares = [plan[index::args.threads] for index in range(args.threads)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as executor:
+        results = [result for part in executor.map(run, shares) for result in part]
+    report = summarize(results, time.perf_counter() - started)
+    report.update(dataset=dataset, threads=args.threads, page_cache=args.page_cache, seed=args.seed,
+                  recorded_at=datetime.utcnow().isoformat(timespec='seconds'))
+    print_report(report)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"\n✓ Baseline saved to {args.baseline}")
+        return
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to record one")
+        return
+    for setting in ('dataset', 'threads', 'page_cache', 'seed'):
+        if baseline.get(setting) != report[setting]:
+            print(f"⚠ The baseline was recorded with a different {setting.replace('_', ' ')}: {baseline.get(setting)}")
+    regressions = compare(report, baseline, args.tolerance)
+    if regressions:
+        print(f"\n✗ {len(regressions)} regression(s) against {args.baseline} (tolerance {args.tolerance:g}%):")
+        for regression in regressions:
+            print(f"  ✗ {regression}")
+        sys.exit(1)
+    print(f"\n✓ No regressions against {args.baseline}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Index benchmark for ModernBlog
+Seeds a throwaway SQLite database and prints query plans and timings for the hot
+query paths with the 0005 indexes reverted and then applied
+
+Usage: python benchmark_indexes.py [--comments N] [--posts N] [--contacts N] [--db PATH]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--comments', type=int, default=1000000)
+    parser.add_argument('--posts', type=int, default=20000)
+    parser.add_argument('--contacts', type=int, default=100000)
+    parser.add_argument('--categories', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--db', help='SQLite file to create (default: a temporary file)')
+    return parser.parse_args()
+
+args = parse_args()
+temp_dir = None if args.db else tempfile.mkdtemp(prefix='modernblog-bench-')
+db_path = args.db or os.path.join(temp_dir, 'bench.db')
+if os.path.exists(db_path):
+    sys.exit(f"Refusing to overwrite existing database {db_path}")
+os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+os.environ['PAGE_CACHE_BACKEND'] = 'none'
+
+from sqlalchemy import text
+from app import app, db, Post, Comment, Contact, MenuItem, post_tags
+from migrations import upgrade, downgrade
+
+CHUNK = 50000
+
+def insert_rows(connection, sql, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == CHUNK:
+            connection.execute(text(sql), batch)
+            batch = []
+    if batch:
+        connection.execute(text(sql), batch)
+
+def seed():
+    rng = random.Random(42)
+    start = datetime(2020, 1, 1)
+    with db.engine.begin() as connection:
+        insert_rows(connection, "INSERT INTO category (id, name, slug) VALUES (:id, :name, :slug)",
+                    ({'id': i, 'name': f'Category {i}', 'slug': f'category-{i}'} for i in range(1, args.categories + 1)))
+        insert_rows(connection, "INSERT INTO tag (id, name, slug) VALUES (:id, :name, :slug)",
+                    ({'id': i, 'name': f'tag{i}', 'slug': f'tag{i}'} for i in range(1, 51)))
+        insert_rows(connection,
+                    "INSERT INTO post (id, title, slug, content, content_html, published, category_id, created_at, updated_at) "
+                    "VALUES (:id, :title, :slug, 'Body', '<p>Body</p>', :published, :category_id, :created_at, :created_at)",
+                    ({'id': i, 'title': f'Post {i}', 'slug': f'post-{i}', 'published': rng.random() < 0.9,
+                      'category_id': rng.randint(1, args.categories), 'created_at': start + timedelta(minutes=i)}
+                     for i in range(1, args.posts + 1)))
+        insert_rows(connection, "INSERT INTO post_tags (post_id, tag_id) VALUES (:post_id, :tag_id)",
+                    ({'post_id': i, 'tag_id': tag} for i in range(1, args.posts + 1) for tag in rng.sample(range(1, 51), 3)))
+        insert_rows(connection,
+                    "INSERT INTO comment (name, email, content, approved, post_id, created_at) "
+                    "VALUES ('Reader', 'reader@example.com', 'Comment body', :approved, :post_id, :created_at)",
+                    ({'approved': rng.random() < 0.95, 'post_id': rng.randint(1, args.posts),
+                      'created_at': start + timedelta(seconds=i * 30)} for i in range(args.comments)))
+        insert_rows(connection,
+                    "INSERT INTO contact (name, email, subject, message, read, created_at) "
+                    "VALUES ('Visitor', 'visitor@example.com', 'Hello', 'Message', :read, :created_at)",
+                    ({'read': rng.random() < 0.9, 'created_at': start + timedelta(minutes=i)} for i in range(args.contacts)))
+        insert_rows(connection, 'INSERT INTO menu_item (title, url, "order", active) VALUES (:title, :url, :order, :active)',
+                    ({'title': f'Link {i}', 'url': f'/link-{i}', 'order': i, 'active': i % 4 != 0} for i in range(40)))
+        connection.execute(text('ANALYZE'))
+
+def hot_queries():
+    """The statements the app issues on its busiest paths"""
+    post_id = args.posts // 2
+    newest_first = (Post.created_at.desc(), Post.id.desc())
+    return [
+        ('index listing', Post.query.filter_by(published=True).order_by(*newest_first).limit(7)),
+        ('category listing', Post.query.filter_by(category_id=3, published=True).order_by(*newest_first).limit(7)),
+        ('tag listing', Post.query.join(post_tags).filter(post_tags.c.tag_id == 7, Post.published == True).order_by(*newest_first).limit(7)),
+        ('approved comments', Comment.query.filter_by(post_id=post_id, approved=True).order_by(Comment.created_at.desc())),
+        ('pending comments badge', db.session.query(db.func.count(Comment.id)).filter(Comment.approved == False)),
+        ('unread contacts badge', db.session.query(db.func.count(Contact.id)).filter(Contact.read == False)),
+        ('menu', MenuItem.query.filter_by(active=True).order_by(MenuItem.order)),
+    ]
+
+def measure(label):
+    print(f"\n=== {label} ===")
+    results = {}
+    with db.engine.connect() as connection:
+        for name, query in hot_queries():
+            sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+            plan = [row[-1] for row in connection.execute(text('EXPLAIN QUERY PLAN ' + sql))]
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                connection.execute(text(sql)).all()
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = statistics.median(timings)
+            print(f"{name:<24} {results[name]:>9.2f} ms   " + ' | '.join(plan))
+    return results
+
+def main():
+    with app.app_context():
+        upgrade()
+        print(f"Seeding {db_path}: {args.posts} posts, {args.comments} comments, {args.contacts} contacts...")
+        started = time.perf_counter()
+        seed()
+        print(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+        downgrade('0004')
+        with db.engine.begin() as connection:
+            connection.execute(text('ANALYZE'))
+        before = measure('without 0005 indexes')
+        upgrade()
+        with db.engine.begin() as connection:
+            connection.execute(text('ANALYZE'))
+        after = measure('with 0005 indexes')
+
+        print(f"\n{'query':<24} {'before':>10} {'after':>10} {'speedup':>8}")
+        for name in before:
+            speedup = before[name] / after[name] if after[name] else float('inf')
+            print(f"{name:<24} {before[name]:>8.2f}ms {after[name]:>8.2f}ms {speedup:>7.1f}x")
+
+if __name__ == '__main__':
+    try:
+        main()
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""
+Static asset build for ModernBlog
+Writes content-fingerprinted copies of the files in static/, pre-compressed .gz (and .br when
+the brotli package is installed) siblings for nginx, and the manifest the app reads at startup
+
+Usage:
+    python build_assets.py [--no-compress]
+"""
+
+import os
+import sys
+from assets import MANIFEST_NAME, brotli, build
+
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+
+def main():
+    compress = '--no-compress' not in sys.argv
+    assets = build(STATIC_FOLDER, compress=compress)
+    for path, hashed in assets.items():
+        print(f"  {path} -> {hashed}")
+    print(f"✓ Fingerprinted {len(assets)} static files into {MANIFEST_NAME}")
+    if compress and brotli is None:
+        print("  (install the brotli package to also write .br files)")
+
+if __name__ == '__main__':
+    main()
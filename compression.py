@@ -0,0 +1,81 @@
+"""
+Response compression and HTML minification for ModernBlog
+Used when the app answers clients directly (no nginx in front); cached pages are stored
+already minified and compressed so hits are served as-is
+"""
+
+import gzip
+import re
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+COMPRESSIBLE_TYPES = {'text/html', 'text/css', 'text/plain', 'text/xml', 'application/json',
+                      'application/javascript', 'application/xml', 'application/rss+xml', 'image/svg+xml'}
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Whitespace inside these elements is significant (or, for scripts, possibly so)
+_PRESERVED = re.compile(r'(<(pre|textarea|script|style|code)\b[^>]*>.*?</\2\s*>)', re.S | re.I)
+_COMMENT = re.compile(r'<!--(?!\[if).*?-->', re.S)
+# A tag, with quoted attribute values that may contain '>' and whitespace runs of their own
+_TAG = re.compile(r'(<(?:[^>"\']|"[^"]*"|\'[^\']*\')*>)')
+_LINE_BREAKS = re.compile(r'\s*\n\s*')
+_SPACES = re.compile(r'[ \t\r\f\v]{2,}')
+_INDENT = re.compile(r'^[ \t]+', re.M)
+_BLANK_LINES = re.compile(r'\n\s*\n')
+_CSS_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+
+
+def _minify_preserved(block, tag):
+    tag = tag.lower()
+    if tag == 'style':
+        block = _CSS_COMMENT.sub('', block)
+    elif tag != 'script' or '`' in block:
+        # Template literals might depend on their whitespace, so leave those scripts alone
+        return block
+    return _BLANK_LINES.sub('\n', _INDENT.sub('', block))
+
+
+def minify_html(html):
+    """Strip comments and collapse whitespace in the text between tags, outside <pre>, <code>,
+    <textarea>, <script> and <style>.
+
+    Whitespace runs shrink to a single character rather than disappearing, so the rendered
+    spacing between inline elements is unchanged. Tags are left as written: attribute values
+    such as ``title`` or ``data-*`` keep their whitespace.
+    """
+    parts = []
+    position = 0
+    for match in _PRESERVED.finditer(html):
+        parts.append(_collapse(html[position:match.start()]))
+        parts.append(_minify_preserved(match.group(1), match.group(2)))
+        position = match.end()
+    parts.append(_collapse(html[position:]))
+    return ''.join(parts)
+
+
+def _collapse(html):
+    # Odd positions of the split are the tags themselves
+    parts = _TAG.split(_COMMENT.sub('', html))
+    for index in range(0, len(parts), 2):
+        parts[index] = _SPACES.sub(' ', _LINE_BREAKS.sub('\n', parts[index]))
+    return ''.join(parts)
+
+
+def negotiate(accept_encodings):
+    """Best supported encoding from a werkzeug Accept-Encoding header, or None for identity"""
+    if brotli is not None and accept_encodings['br'] > 0:
+        return 'br'
+    if accept_encodings['gzip'] > 0:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    # mtime=0 keeps identical pages byte-identical
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
@@ -0,0 +1,117 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+# Point the app at a throwaway SQLite file before anything imports it
+_db_fd, _db_path = tempfile.mkstemp(suffix='.db')
+os.close(_db_fd)
+os.environ['DATABASE_URL'] = 'sqlite:///' + _db_path
+# Route tests measure the render pipeline; page-cache tests install a cache explicitly
+os.environ['PAGE_CACHE_BACKEND'] = 'none'
+os.environ['SITEMAP_DIR'] = tempfile.mkdtemp(prefix='sitemaps-')
+# Render image variants inline so tests can assert on them right after the upload commits
+os.environ['IMAGE_WORKERS'] = '0'
+# Write queued comments and contact messages during the request that submits them
+os.environ['SUBMISSION_FLUSH_INTERVAL'] = '0'
+os.environ['SUBMISSION_QUEUE_DIR'] = tempfile.mkdtemp(prefix='submissions-')
+# Generate AI drafts with the fake model, during the request that asks for them
+os.environ['GENERATION_BACKEND'] = 'fake'
+os.environ['GENERATION_WORKERS'] = '0'
+os.environ['METRICS_DIR'] = tempfile.mkdtemp(prefix='metrics-')
+os.environ['SITE_URL'] = 'http://localhost'
+# Requests arrive as they do through nginx in the deployments
+os.environ['TRUSTED_PROXIES'] = '1'
+
+import pytest
+from flask import g, request_tearing_down
+from sqlalchemy import event
+
+from app import app as flask_app, db, VersionedCache, _generation_backends, _listing_counts, _sitemap_stores, metrics_registry, perf_registry, submission_filter
+
+with flask_app.app_context():
+    db.create_all()
+
+
+def _reset_request_globals(sender, **extra):
+    # Test requests reuse the fixture's app context, so drop per-request state by hand
+    g.__dict__.clear()
+    db.session.remove()
+
+
+request_tearing_down.connect(_reset_request_globals, flask_app)
+
+
+@pytest.fixture
+def app():
+    flask_app.config['TESTING'] = True
+    with flask_app.app_context():
+        db.drop_all()
+        db.create_all()
+        for cache in VersionedCache.registry:
+            cache.clear()
+        _listing_counts.clear()
+        _sitemap_stores.clear()
+        submission_filter.clear()
+        _generation_backends.clear()
+        perf_registry.reset()
+        metrics_registry.store.clear()
+        shutil.rmtree(flask_app.config['SITEMAP_DIR'], ignore_errors=True)
+        yield flask_app
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def admin_client(client):
+    with client.session_transaction() as sess:
+        sess['admin'] = True
+        sess['admin_user'] = 'mehedims'
+    return client
+
+
+class QueryCounter:
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+
+@pytest.fixture
+def count_queries(app):
+    @contextmanager
+    def counting():
+        counter = QueryCounter()
+        event.listen(db.engine, 'before_cursor_execute', counter._record)
+        try:
+            yield counter
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', counter._record)
+    return counting
+
+
+@pytest.fixture
+def seeded(app):
+    from app import Category, Tag, Post, Page, MenuItem, Setting
+    categories = [Category(name=f'Category {i}', slug=f'category-{i}') for i in range(3)]
+    tags = [Tag(name=f'tag{i}', slug=f'tag{i}') for i in range(4)]
+    db.session.add_all(categories + tags)
+    for i in range(10):
+        post = Post(title=f'Post {i}', slug=f'post-{i}', content=f'# Post {i}\n\nBody of post {i}.\n\n```python\nprint({i})\n```',
+                    excerpt=f'Excerpt {i}', published=True, category=categories[i % 3])
+        post.tags.extend(tags[:2])
+        db.session.add(post)
+    db.session.add(Page(title='About', slug='about', content='About us', published=True))
+    db.session.add(MenuItem(title='About', url='/page/about', order=1))
+    db.session.commit()
+    Setting.set_many({'site_name': 'Test Blog', 'ads_header': '<ad-header>'})
+    return {'categories': categories, 'tags': tags}
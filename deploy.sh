@@ -47,6 +47,9 @@ pip install gunicorn
 # Initialize database
 echo "🗄️ Initializing database..."
 python init_db.py
+python backfill_html.py
+python process_images.py
+python build_assets.py
 
 # Create systemd service
 echo "⚙️ Creating systemd service..."
@@ -61,6 +64,9 @@ Group=www-data
 WorkingDirectory=$APP_DIR
 Environment="PATH=$APP_DIR/venv/bin"
 Environment="SECRET_KEY=$(openssl rand -hex 32)"
+Environment="SITE_URL=https://$DOMAIN"
+Environment="METRICS_TOKEN=$(openssl rand -hex 32)"
+Environment="TRUSTED_PROXIES=1"
 ExecStart=$APP_DIR/venv/bin/gunicorn --workers 3 --bind unix:$APP_DIR/modernblog.sock -m 007 app:app
 Restart=always
 
@@ -80,10 +86,30 @@ server {
         proxy_pass http://unix:$APP_DIR/modernblog.sock;
     }
     
+    location = /metrics {
+        allow 127.0.0.1;
+        deny all;
+        include proxy_params;
+        proxy_pass http://unix:$APP_DIR/modernblog.sock;
+    }
+    
+    location ~ "^/static/(.+\\.[0-9a-f]{12}\\.[A-Za-z0-9]+)\$" {
+        alias $APP_DIR/static/\$1;
+        gzip_static on;
+        gzip_vary on;
+        add_header Cache-Control "public, max-age=31536000, immutable";
+    }
+    
+    location /static/uploads/ {
+        alias $APP_DIR/static/uploads/;
+        add_header Cache-Control "public, max-age=31536000, immutable";
+    }
+    
     location /static {
         alias $APP_DIR/static;
-        expires 30d;
-        add_header Cache-Control "public, immutable";
+        gzip_static on;
+        gzip_vary on;
+        expires 1h;
     }
 }
 EOF
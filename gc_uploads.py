@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Upload garbage collection for ModernBlog
+Deletes uploaded images, and their variants, that no post, page or setting references
+
+Usage:
+    python gc_uploads.py [--dry-run]
+"""
+
+import sys
+from datetime import datetime, timedelta
+from app import app, db, ImageAsset, UploadReference, upload_storage
+
+def unreferenced_assets(grace_hours=None):
+    """Assets without references whose last upload is older than the grace period"""
+    if grace_hours is None:
+        grace_hours = app.config['UPLOAD_GC_GRACE_HOURS']
+    # The grace period covers uploads whose post has not been saved yet
+    cutoff = datetime.utcnow() - timedelta(hours=grace_hours)
+    referenced = db.session.query(UploadReference.id).filter(UploadReference.filename == ImageAsset.filename)
+    return ImageAsset.query.filter(ImageAsset.uploaded_at < cutoff, ~referenced.exists()) \
+        .order_by(ImageAsset.id).all()
+
+def collect(dry_run=False, grace_hours=None):
+    """Delete unreferenced assets; returns the number of assets and stored files removed"""
+    assets = unreferenced_assets(grace_hours)
+    files = 0
+    for asset in assets:
+        keys = asset.storage_keys()
+        files += len(keys)
+        if dry_run:
+            print(f"  would delete {asset.filename} ({len(keys)} files)")
+            continue
+        # Drop the row first: a crash between the two steps leaves stray files, never a broken image
+        db.session.delete(asset)
+        db.session.commit()
+        for key in keys:
+            upload_storage.delete(key)
+    return len(assets), files
+
+def main():
+    dry_run = '--dry-run' in sys.argv
+    with app.app_context():
+        assets, files = collect(dry_run=dry_run)
+        verb = 'Would delete' if dry_run else 'Deleted'
+        print(f"✓ {verb} {assets} unreferenced uploads ({files} files)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Synthetic data generator for ModernBlog
+Fills the configured database (DATABASE_URL) with posts carrying realistic Markdown and code
+blocks, comments, tags, categories and contact messages for load testing. Rows are written
+with batched multi-row inserts in one transaction per batch of posts; the derived state the
+app normally maintains row by row (rendered HTML, comment counts, the search index and the
+admin counters) is filled in alongside or rebuilt at the end. Runs append to existing data.
+
+Usage: python generate_data.py [--posts N] [--comments N] [--tags N] [--categories N] [--contacts N] [--seed N]
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from slugify import slugify
+from app import (app, db, Category, Comment, Contact, Post, Tag, post_tags, chrome_cache, content_digest,
+                 drop_search_index, ensure_search_index, purge_page_cache, rebuild_counters, render_markdown, touch_listings)
+from migrations import upgrade
+
+BATCH_SIZE = 5000
+INSERT_CHUNK = 1000
+# Distinct Markdown bodies rendered per run; every post adds an introduction of its own
+BODY_VARIANTS = 200
+TAGS_PER_POST = (2, 6)
+
+WORDS = (
+    'cache query index python flask database server request response latency worker thread async '
+    'template render markdown deploy docker nginx gunicorn postgres sqlite migration schema session '
+    'cookie header token secure upload image resize queue batch stream event search ranking feed '
+    'sitemap crawler profile benchmark memory cpu network socket proxy scale shard replica backup '
+    'logging metrics alert dashboard release review refactor pattern testing fixture coverage debug '
+    'design layout mobile browser script style component state router api client json yaml config'
+).split()
+
+CODE_SAMPLES = (
+    ('python', 'def {name}(items):\n    """Return the {word} of every item"""\n    return [item.{word} for item in items if item]\n'),
+    ('javascript', 'async function {name}(url) {{\n  const response = await fetch(url);\n  return response.json().then((data) => data.{word});\n}}\n'),
+    ('sql', 'SELECT id, {word}\nFROM post\nWHERE published = 1\nORDER BY created_at DESC\nLIMIT 10;\n'),
+    ('bash', 'pip install {word}\nexport {upper}_ENABLED=1\npython -m {name} --verbose\n'),
+)
+
+def sentence(rng, low=6, high=16):
+    words = rng.choices(WORDS, k=rng.randint(low, high))
+    return ' '.join(words).capitalize() + '.'
+
+def paragraph(rng, sentences=(2, 5)):
+    return ' '.join(sentence(rng) for _ in range(rng.randint(*sentences)))
+
+def markdown_body(rng):
+    """A post body with headings, paragraphs, lists and fenced code, about 500-1500 words"""
+    blocks = []
+    for _ in range(rng.randint(3, 6)):
+        blocks.append('## ' + sentence(rng, 2, 5).rstrip('.'))
+        blocks.extend(paragraph(rng) for _ in range(rng.randint(1, 3)))
+        choice = rng.random()
+        if choice < 0.5:
+            language, template = rng.choice(CODE_SAMPLES)
+            word = rng.choice(WORDS)
+            code = template.format(name=f'{word}_{rng.choice(WORDS)}', word=word, upper=word.upper())
+            blocks.append(f'```{language}\n{code}```')
+        elif choice < 0.8:
+            blocks.append('\n'.join(f'- {sentence(rng, 3, 8)}' for _ in range(rng.randint(3, 6))))
+        else:
+            blocks.append('\n'.join(f'{i}. {sentence(rng, 3, 8)}' for i in range(1, rng.randint(3, 6))))
+    blocks.append('## Conclusion')
+    blocks.append(paragraph(rng))
+    return '\n\n'.join(blocks)
+
+def insert(connection, table, rows):
+    for start in range(0, len(rows), INSERT_CHUNK):
+        connection.execute(table.insert(), rows[start:start + INSERT_CHUNK])
+
+def next_id(connection, model):
+    return (connection.execute(db.select(db.func.max(model.id))).scalar() or 0) + 1
+
+def zipf_weights(count, exponent=1.1):
+    # A few popular tags and categories, a long tail of rare ones
+    return list(accumulate(1 / (rank ** exponent) for rank in range(1, count + 1)))
+
+def add_taxonomy(connection, model, count, label, rng):
+    """Insert ``count`` categories or tags; returns the ids of all of them"""
+    first = next_id(connection, model)
+    rows = []
+    for row_id in range(first, first + count):
+        name = f'{rng.choice(WORDS).capitalize()} {label} {row_id}'
+        rows.append({'id': row_id, 'name': name, 'slug': slugify(name)})
+    insert(connection, model.__table__, rows)
+    return [row_id for (row_id,) in connection.execute(db.select(model.id).order_by(model.id))]
+
+def generate(posts, comments, tags, categories, contacts, seed=42, progress=print):
+    rng = random.Random(seed)
+    with db.engine.begin() as connection:
+        if connection.dialect.name == 'sqlite':
+            connection.exec_driver_sql('PRAGMA synchronous = OFF')
+        category_ids = add_taxonomy(connection, Category, categories, 'Category', rng)
+        tag_ids = add_taxonomy(connection, Tag, tags, 'Tag', rng)
+        first_post = next_id(connection, Post)
+    progress(f"✓ {categories} categories and {tags} tags")
+
+    bodies = []
+    for _ in range(BODY_VARIANTS):
+        body = markdown_body(rng)
+        bodies.append((body, render_markdown(body)))
+    category_weights, tag_weights = zipf_weights(len(category_ids)), zipf_weights(len(tag_ids))
+    now = datetime.utcnow()
+    # Newest posts last, spread over the past five years
+    step = timedelta(days=5 * 365) / max(posts, 1)
+    start = now - step * posts
+
+    started = time.perf_counter()
+    written_comments = 0
+    for batch_start in range(0, posts, BATCH_SIZE):
+        batch = range(batch_start, min(batch_start + BATCH_SIZE, posts))
+        # Comments are spread over the batch with a heavy tail: most posts get a few, some get hundreds or more
+        batch_comments = comments * batch.stop // posts - written_comments
+        weights = list(accumulate(rng.paretovariate(1.5) for _ in batch))
+        owners = rng.choices(batch, cum_weights=weights, k=batch_comments)
+        post_rows, tag_rows, comment_rows = [], [], []
+        approved, last_approved = dict.fromkeys(batch, 0), {}
+        for index in owners:
+            post_id = first_post + index
+            created_at = min(start + step * index + timedelta(minutes=rng.randint(1, 60 * 24 * 30)), now)
+            is_approved = rng.random() < 0.95
+            if is_approved:
+                approved[index] += 1
+                last_approved[index] = max(created_at, last_approved.get(index, created_at))
+            comment_rows.append({'post_id': post_id, 'name': rng.choice(WORDS).capitalize(), 'email': f'reader{rng.randint(1, 10 ** 6)}@example.com',
+                                 'content': paragraph(rng, (1, 3)), 'approved': is_approved, 'created_at': created_at})
+        for index in batch:
+            post_id = first_post + index
+            title = sentence(rng, 4, 9).rstrip('.')
+            intro = paragraph(rng, (1, 2))
+            body, body_html = rng.choice(bodies)
+            content = f'{intro}\n\n{body}'
+            created_at = start + step * index
+            post_rows.append({'id': post_id, 'title': title, 'slug': f'{slugify(title)[:180]}-{post_id}', 'content': content,
+                              'content_html': f'<p>{intro}</p>\n{body_html}', 'content_hash': content_digest(content),
+                              'excerpt': sentence(rng, 12, 24), 'published': rng.random() < 0.9,
+                              'category_id': rng.choices(category_ids, cum_weights=category_weights)[0] if category_ids else None,
+                              'created_at': created_at, 'updated_at': created_at, 'approved_comment_count': approved[index],
+                              'comments_changed_at': last_approved.get(index)})
+            if tag_ids:
+                chosen = set(rng.choices(tag_ids, cum_weights=tag_weights, k=rng.randint(*TAGS_PER_POST)))
+                tag_rows.extend({'post_id': post_id, 'tag_id': tag_id} for tag_id in chosen)
+        with db.engine.begin() as connection:
+            insert(connection, Post.__table__, post_rows)
+            insert(connection, post_tags, tag_rows)
+            insert(connection, Comment.__table__, comment_rows)
+        written_comments += batch_comments
+        elapsed = time.perf_counter() - started
+        progress(f"  {batch.stop}/{posts} posts, {written_comments} comments ({batch.stop / elapsed:.0f} posts/s)")
+
+    with db.engine.begin() as connection:
+        rows = []
+        for number in range(contacts):
+            rows.append({'name': rng.choice(WORDS).capitalize(), 'email': f'visitor{number}@example.com',
+                         'subject': sentence(rng, 3, 6), 'message': paragraph(rng), 'read': rng.random() < 0.9,
+                         'created_at': now - timedelta(minutes=contacts - number)})
+            if len(rows) == INSERT_CHUNK:
+                insert(connection, Contact.__table__, rows)
+                rows = []
+        insert(connection, Contact.__table__, rows)
+    progress(f"✓ {contacts} contact messages")
+
+    with db.engine.begin() as connection:
+        if connection.dialect.name == 'postgresql':
+            # Rows were inserted with explicit ids
+            for table in ('category', 'tag', 'post'):
+                connection.exec_driver_sql(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT max(id) FROM {table}))")
+        if connection.dialect.name == 'sqlite':
+            # Recreating the FTS5 table populates it from the posts in one statement; PostgreSQL
+            # computed the search column as the rows went in
+            drop_search_index(connection)
+            ensure_search_index(connection)
+        rebuild_counters(connection)
+        touch_listings(connection)
+        if connection.dialect.name in ('sqlite', 'postgresql'):
+            connection.exec_driver_sql('ANALYZE')
+    progress("✓ Search index, counters and statistics rebuilt")
+    # Running workers drop their cached navigation and pages
+    chrome_cache.invalidate()
+    purge_page_cache('posts')
+    db.session.commit()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--posts', type=int, default=1000000)
+    parser.add_argument('--comments', type=int, default=10000000)
+    parser.add_argument('--tags', type=int, default=5000)
+    parser.add_argument('--categories', type=int, default=1000)
+    parser.add_argument('--contacts', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=42)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    with app.app_context():
+        upgrade()
+        print("✓ Database schema up to date")
+        print(f"Generating {args.posts} posts, {args.comments} comments, {args.tags} tags, {args.categories} categories...")
+        started = time.perf_counter()
+        generate(args.posts, args.comments, args.tags, args.categories, args.contacts, args.seed)
+        print(f"✓ Done in {time.perf_counter() - started:.0f}s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,294 @@
+"""
+AI draft generation for ModernBlog
+A draft is three model calls (title, excerpt and body) that run concurrently in background
+threads; requests either queue a job and read its status back, or stream the body as it is
+written. Backends expose ``generate(prompt)`` and ``stream(prompt)``, so tests and local
+development can use the fake one; ``RecordingBackend`` wraps either with a response cache
+and per-call accounting.
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import TimeoutError as FutureTimeout
+
+PARTS = ('title', 'excerpt', 'content')
+# Bump whenever PROMPTS change so cached responses to the old wording stop matching
+PROMPT_VERSION = 1
+
+PROMPTS = {
+    'title': "Create an engaging, SEO-friendly blog post title about: {topic}. Return only the title, nothing else.",
+    'excerpt': "Write a compelling 2-3 sentence excerpt/summary for a blog post about: {topic}. Make it engaging and informative. Return only the excerpt, nothing else.",
+    'content': """
+Write a comprehensive, well-structured blog post about: {topic}
+
+Requirements:
+- Use proper markdown formatting with headings (##, ###)
+- Include practical examples and actionable tips
+- Make it informative and engaging
+- Aim for 800-1500 words
+- Use bullet points and numbered lists where appropriate
+- Include a conclusion section
+- Write in a professional but accessible tone
+
+Return only the markdown content, no additional text or formatting.
+""",
+}
+
+
+class GenerationError(Exception):
+    pass
+
+
+Completion = namedtuple('Completion', 'text prompt_tokens response_tokens')
+
+
+def build_prompts(topic):
+    return {part: PROMPTS[part].format(topic=topic) for part in PARTS}
+
+
+def parse_prompt(prompt):
+    """(part, topic) for a prompt built by ``build_prompts``, or (None, None)"""
+    for part, template in PROMPTS.items():
+        prefix, suffix = template.split('{topic}')
+        if prompt.startswith(prefix) and prompt.endswith(suffix) and len(prompt) >= len(prefix) + len(suffix):
+            return part, prompt[len(prefix):len(prompt) - len(suffix)]
+    return None, None
+
+
+def normalize_topic(topic):
+    return ' '.join(topic.casefold().split())
+
+
+def cache_key(model_name, prompt):
+    """Same key for prompts that differ only in the case or spacing of their topic"""
+    part, topic = parse_prompt(prompt)
+    subject = f'{part}|{normalize_topic(topic)}' if part else prompt
+    return hashlib.sha256(f'{PROMPT_VERSION}|{model_name}|{subject}'.encode('utf-8')).hexdigest()
+
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English prose; used when the API reports no usage
+    return max(1, (len(text) + 3) // 4) if text else 0
+
+
+def clean(part, text):
+    text = text.strip()
+    return text if part == 'content' else text.replace('"', '')
+
+
+class GeminiBackend:
+    """One configured model per API key, shared by every job in the process.
+
+    ``genai.configure`` sets process-wide state, so it only runs when the key changes.
+    """
+
+    _lock = threading.Lock()
+    _configured_key = None
+
+    def __init__(self, genai, api_key, model_name):
+        self.api_key = api_key
+        self.model_name = model_name
+        with self._lock:
+            if GeminiBackend._configured_key != api_key:
+                genai.configure(api_key=api_key)
+                GeminiBackend._configured_key = api_key
+        self.model = genai.GenerativeModel(model_name)
+
+    def complete(self, prompt):
+        response = self.model.generate_content(prompt)
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None:
+            return Completion(response.text, usage.prompt_token_count, usage.candidates_token_count)
+        return Completion(response.text, estimate_tokens(prompt), estimate_tokens(response.text))
+
+    def generate(self, prompt):
+        return self.complete(prompt).text
+
+    def stream(self, prompt):
+        for chunk in self.model.generate_content(prompt, stream=True):
+            yield chunk.text
+
+
+class FakeBackend:
+    """Deterministic stand-in for the model; ``delay`` simulates a slow call and
+    ``chunk_delay`` a slow stream"""
+
+    model_name = 'fake'
+
+    def __init__(self, delay=0, chunk_delay=0):
+        self.delay = delay
+        self.chunk_delay = chunk_delay
+        self.prompts = []
+        self.streamed = 0
+
+    def complete(self, prompt):
+        text = self.generate(prompt)
+        return Completion(text, estimate_tokens(prompt), estimate_tokens(text))
+
+    def generate(self, prompt):
+        self.prompts.append(prompt)
+        if self.delay:
+            time.sleep(self.delay)
+        part, topic = parse_prompt(prompt)
+        if part is None:
+            return prompt
+        if part == 'title':
+            return f'"A Guide to {topic}"'
+        if part == 'excerpt':
+            return f'Everything you need to know about {topic}.'
+        return f'## {topic}\n\nAn introduction to {topic}.\n\n## Conclusion\n\nThat is {topic}.'
+
+    def stream(self, prompt):
+        for chunk in re.findall(r'\S+\s*|\s+', self.generate(prompt)):
+            if self.chunk_delay:
+                time.sleep(self.chunk_delay)
+            self.streamed += 1
+            yield chunk
+
+
+class RecordingBackend:
+    """Serves repeated prompts from ``store`` and reports every call to it.
+
+    ``store`` provides ``get(key)`` (a Completion or None), ``put(key, completion)`` and
+    ``record(part, status, latency, completion)``, where status is 'ok', 'cached', 'failed'
+    or 'cancelled' (a stream closed before the model finished).
+    """
+
+    def __init__(self, backend, store):
+        self.backend = backend
+        self.store = store
+        self.model_name = backend.model_name
+
+    def _complete(self, prompt):
+        complete = getattr(self.backend, 'complete', None)
+        if complete is not None:
+            return complete(prompt)
+        text = self.backend.generate(prompt)
+        return Completion(text, estimate_tokens(prompt), estimate_tokens(text))
+
+    def generate(self, prompt):
+        key, part = cache_key(self.model_name, prompt), parse_prompt(prompt)[0]
+        started = time.monotonic()
+        cached = self.store.get(key)
+        if cached is not None:
+            self.store.record(part, 'cached', time.monotonic() - started, cached)
+            return cached.text
+        try:
+            completion = self._complete(prompt)
+        except Exception:
+            self.store.record(part, 'failed', time.monotonic() - started, Completion('', estimate_tokens(prompt), 0))
+            raise
+        self.store.put(key, completion)
+        self.store.record(part, 'ok', time.monotonic() - started, completion)
+        return completion.text
+
+    def stream(self, prompt):
+        key, part = cache_key(self.model_name, prompt), parse_prompt(prompt)[0]
+        started = time.monotonic()
+        cached = self.store.get(key)
+        if cached is not None:
+            self.store.record(part, 'cached', time.monotonic() - started, cached)
+            # Block by block, so previews still build up
+            yield from re.findall(r'.+?(?:\n\n+|$)', cached.text, re.S)
+            return
+        chunks = []
+        status = 'cancelled'
+        try:
+            for chunk in self.backend.stream(prompt):
+                chunks.append(chunk)
+                yield chunk
+            status = 'ok'
+        except Exception:
+            status = 'failed'
+            raise
+        finally:
+            text = ''.join(chunks)
+            completion = Completion(text, estimate_tokens(prompt), estimate_tokens(text))
+            if status == 'ok':
+                self.store.put(key, completion)
+            self.store.record(part, status, time.monotonic() - started, completion)
+
+
+def generate_draft(backend, topic, executor=None, timeout=None):
+    """Title, excerpt and content for ``topic``; the calls run concurrently on ``executor``"""
+    prompts = build_prompts(topic)
+    if executor is None:
+        return {part: clean(part, backend.generate(prompts[part])) for part in PARTS}
+    futures = {part: executor.submit(backend.generate, prompts[part]) for part in PARTS}
+    deadline = None if timeout is None else time.monotonic() + timeout
+    draft = {}
+    try:
+        for part in PARTS:
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            draft[part] = clean(part, futures[part].result(timeout=remaining))
+    except FutureTimeout:
+        raise GenerationError(f'The model did not answer within {timeout} seconds')
+    finally:
+        for future in futures.values():
+            future.cancel()
+    return draft
+
+
+def stream_draft(backend, topic, executor=None, timeout=None):
+    """Yield (event, data) pairs for a draft: 'content' chunks as the model writes the body,
+    with 'title' and 'excerpt' once their concurrent calls finish.
+
+    Closing the generator stops reading the model's stream and cancels calls not yet started.
+    With an ``executor`` the stream is also read there, so a model that stops sending chunks
+    still fails at the deadline instead of holding the caller.
+    """
+    prompts = build_prompts(topic)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    if executor is None:
+        pending = {}
+        for part in ('title', 'excerpt'):
+            yield part, clean(part, backend.generate(prompts[part]))
+    else:
+        pending = {part: executor.submit(backend.generate, prompts[part]) for part in ('title', 'excerpt')}
+    chunks = backend.stream(prompts['content'])
+    reading = None
+    try:
+        first = True
+        while True:
+            if executor is None:
+                chunk = next(chunks, None)
+            else:
+                reading = executor.submit(next, chunks, None)
+                remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+                try:
+                    chunk = reading.result(timeout=remaining)
+                except FutureTimeout:
+                    raise GenerationError(f'The model did not finish within {timeout} seconds')
+            if chunk is None:
+                break
+            # Leading whitespace is dropped like in the non-streaming draft
+            chunk = chunk.lstrip() if first else chunk
+            if chunk:
+                first = False
+                yield 'content', chunk
+            for part in [part for part, future in pending.items() if future.done()]:
+                yield part, clean(part, pending.pop(part).result())
+            if deadline is not None and time.monotonic() > deadline:
+                raise GenerationError(f'The model did not finish within {timeout} seconds')
+        for part in list(pending):
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                yield part, clean(part, pending.pop(part).result(timeout=remaining))
+            except FutureTimeout:
+                raise GenerationError(f'The model did not answer within {timeout} seconds')
+    finally:
+        for future in pending.values():
+            future.cancel()
+        # A read still waiting on the model holds the stream; it ends with the model's connection
+        close = getattr(chunks, 'close', None)
+        if close is not None and (reading is None or reading.cancel() or reading.done()):
+            close()
+
+
+def sse(event, data):
+    """One server-sent event with a JSON payload"""
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
@@ -0,0 +1,25 @@
+"""
+gunicorn settings for ModernBlog, read automatically when gunicorn starts in this directory
+Keeps the per-worker metric files in METRICS_DIR consistent with the running workers.
+"""
+
+import os
+
+from metrics import MetricsStore
+
+# Threaded workers, so a streamed AI draft (which lasts up to GENERATION_TIMEOUT) holds one
+# thread rather than a whole worker; GENERATION_MAX_STREAMS should stay below the thread count
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+metrics_store = MetricsStore(os.environ.get('METRICS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'metrics')))
+
+
+def on_starting(server):
+    # Counters start from zero with the server, as they would in a single process
+    metrics_store.clear()
+
+
+def child_exit(server, worker):
+    # A dead worker's gauges would otherwise be added to the totals forever; its counters stay
+    metrics_store.mark_process_dead(worker.pid)
@@ -0,0 +1,129 @@
+"""
+Image variants for ModernBlog uploads
+Re-encodes uploads without metadata and renders width-bucketed variants in modern formats
+"""
+
+import io
+import os
+import tempfile
+from PIL import Image, ImageOps, features
+
+# Width buckets used for srcset; never upscaled past the original
+WIDTH_VARIANTS = (('thumb', 320), ('card', 640), ('hero', 1600))
+# Open Graph/Twitter cards want a fixed 1.91:1 crop in a format every scraper understands
+OG_SIZE = (1200, 630)
+PROCESSABLE_FORMATS = {'JPEG', 'PNG', 'GIF', 'WEBP'}
+Image.MAX_IMAGE_PIXELS = 50_000_000
+
+SAVE_OPTIONS = {
+    'avif': {'format': 'AVIF', 'quality': 55},
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+    'png': {'format': 'PNG', 'optimize': True},
+}
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def probe(stream):
+    """Check that ``stream`` holds an image Pillow can decode; returns (format, width, height)"""
+    try:
+        with Image.open(stream) as image:
+            image.verify()
+            result = image.format, image.width, image.height
+    except (OSError, SyntaxError, Image.DecompressionBombError) as exc:
+        raise InvalidImage(str(exc))
+    finally:
+        stream.seek(0)
+    if result[0] not in PROCESSABLE_FORMATS:
+        raise InvalidImage(f'Unsupported image format {result[0]}')
+    return result
+
+
+def modern_formats():
+    formats = ['webp']
+    if features.check('avif'):
+        formats.insert(0, 'avif')
+    return formats
+
+
+def _has_alpha(image):
+    return image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+
+
+def _save(image, path, fmt):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    os.close(fd)
+    try:
+        # Saving without exif/icc/comment arguments drops the source metadata
+        image.save(tmp_path, **SAVE_OPTIONS[fmt])
+        os.replace(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
+def _prepare(image, alpha):
+    image = ImageOps.exif_transpose(image)
+    return image.convert('RGBA' if alpha else 'RGB')
+
+
+def strip_metadata(data):
+    """``data`` re-encoded in its own format without EXIF, ICC or comments, turned upright.
+
+    Runs before an upload is hashed, so the stored original matches its content-addressed key.
+    Animated images and GIFs come back unchanged: re-encoding would drop their frames.
+    """
+    with Image.open(io.BytesIO(data)) as source:
+        original_format = {'JPEG': 'jpeg', 'PNG': 'png', 'WEBP': 'webp'}.get(source.format)
+        if original_format is None or getattr(source, 'is_animated', False):
+            return data
+        image = _prepare(source, _has_alpha(source))
+    buffer = io.BytesIO()
+    # Saving without exif/icc/comment arguments drops the source metadata
+    image.save(buffer, **SAVE_OPTIONS[original_format])
+    return buffer.getvalue()
+
+
+def generate_variants(source_path, output_dir, stem):
+    """Write the variants of the (already stripped) original at ``source_path`` to ``output_dir``.
+
+    Returns ``{'width', 'height', 'variants'}`` where ``variants`` maps a variant name to
+    ``{'width', 'height', 'files': {format: filename}}``; the 'fallback' format is JPEG,
+    or PNG for images with transparency.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    with Image.open(source_path) as source:
+        if getattr(source, 'is_animated', False):
+            # Re-encoding would drop the animation; keep the original and skip variants
+            return {'width': source.width, 'height': source.height, 'variants': {}}
+        alpha = _has_alpha(source)
+        image = _prepare(source, alpha)
+
+    fallback = 'png' if alpha else 'jpeg'
+    width, height = image.size
+    variants = {}
+    previous = None
+    for name, target_width in WIDTH_VARIANTS:
+        scaled_width = min(target_width, width)
+        if previous and previous['width'] == scaled_width:
+            # Small originals: larger buckets reuse the last rendition
+            variants[name] = previous
+            continue
+        scaled = image if scaled_width == width else image.resize(
+            (scaled_width, max(1, round(height * scaled_width / width))), Image.LANCZOS)
+        files = {}
+        for fmt in modern_formats() + [fallback]:
+            filename = f'{stem}-{name}.{"jpg" if fmt == "jpeg" else fmt}'
+            _save(scaled, os.path.join(output_dir, filename), fmt)
+            files[fmt] = filename
+        files['fallback'] = files[fallback]
+        previous = variants[name] = {'width': scaled.width, 'height': scaled.height, 'files': files}
+
+    og = ImageOps.fit(image.convert('RGB'), OG_SIZE, Image.LANCZOS)
+    og_filename = f'{stem}-og.jpg'
+    _save(og, os.path.join(output_dir, og_filename), 'jpeg')
+    variants['og'] = {'width': OG_SIZE[0], 'height': OG_SIZE[1], 'files': {'jpeg': og_filename, 'fallback': og_filename}}
+    return {'width': width, 'height': height, 'variants': variants}
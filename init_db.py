@@ -5,15 +5,16 @@ Creates tables and adds sample data
 """
 
 from app import app, db, Category, Tag, Post
+from migrations import upgrade
 from slugify import slugify
 from datetime import datetime
 
 def init_database():
     """Initialize the database with tables and sample data"""
     with app.app_context():
-        # Create all tables
-        db.create_all()
-        print("✓ Database tables created")
+        # Create or migrate the schema
+        upgrade()
+        print("✓ Database schema up to date")
         
         # Check if data already exists
         if Category.query.first():
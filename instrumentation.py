@@ -0,0 +1,167 @@
+"""
+Request instrumentation for ModernBlog
+Each request counts its queries and times its SQL, template rendering and Markdown rendering;
+the totals go out as a Server-Timing header and into per-route histograms that /admin/perf
+shows. A sampled share of requests can also run under cProfile.
+"""
+
+import bisect
+import cProfile
+import io
+import math
+import pstats
+import threading
+import time
+from collections import deque
+
+# Histogram bucket upper bounds in milliseconds, 25% apart from 0.1ms to about 30s
+BUCKETS = tuple(round(0.1 * 1.25 ** i, 4) for i in range(57))
+PERCENTILES = (50, 95, 99)
+TIMED_PARTS = (('sql', 'db'), ('template', 'tpl'), ('markdown', 'md'))
+
+
+class RequestTiming:
+    """What one request spent, in seconds"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql = 0.0
+        self.template = 0.0
+        self.markdown = 0.0
+        self.statements = []  # (seconds, statement)
+        self.template_started = None
+        self.profiler = None
+
+    def add_query(self, statement, elapsed):
+        self.queries += 1
+        self.sql += elapsed
+        self.statements.append((elapsed, statement))
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+def server_timing(timing, duration):
+    """Server-Timing header value; durations in milliseconds as the spec expects"""
+    metrics = [f'db;dur={timing.sql * 1000:.2f};desc="{timing.queries} queries"']
+    metrics += [f'{name};dur={getattr(timing, part) * 1000:.2f}' for part, name in TIMED_PARTS[1:]]
+    metrics.append(f'total;dur={duration * 1000:.2f}')
+    return ', '.join(metrics)
+
+
+class Histogram:
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile (the maximum for the overflow bucket)"""
+        if not self.count:
+            return 0.0
+        rank = math.ceil(p / 100 * self.count)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.bounds[index], self.max) if index < len(self.bounds) else self.max
+        return self.max
+
+    def nonzero(self):
+        """(upper bound, count) for the occupied buckets"""
+        return [(self.bounds[index] if index < len(self.bounds) else self.max, count)
+                for index, count in enumerate(self.counts) if count]
+
+
+class RouteStats:
+    def __init__(self):
+        self.duration = Histogram()
+        self.queries = 0
+        self.sql = 0.0
+        self.template = 0.0
+        self.markdown = 0.0
+
+    def summary(self):
+        requests = self.duration.count or 1
+        return {
+            'requests': self.duration.count,
+            'percentiles': {p: self.duration.percentile(p) for p in PERCENTILES},
+            'mean': self.duration.total / requests,
+            'max': self.duration.max,
+            'total': self.duration.total,
+            'queries': self.queries / requests,
+            'sql': self.sql * 1000 / requests,
+            'template': self.template * 1000 / requests,
+            'markdown': self.markdown * 1000 / requests,
+            'buckets': self.duration.nonzero(),
+        }
+
+
+class PerfRegistry:
+    """Per-process aggregate of request timings, the slowest statements and recent profiles"""
+
+    def __init__(self, slow_statements=25, profiles=20):
+        self.slow_statements = slow_statements
+        self._lock = threading.Lock()
+        self._routes = {}
+        self._slowest = []  # (milliseconds, statement, route), slowest first
+        self._profiles = deque(maxlen=profiles)
+        self.since = time.time()
+
+    def record(self, route, timing, duration):
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = RouteStats()
+            stats.duration.add(duration * 1000)
+            stats.queries += timing.queries
+            stats.sql += timing.sql
+            stats.template += timing.template
+            stats.markdown += timing.markdown
+            floor = self._slowest[-1][0] if len(self._slowest) >= self.slow_statements else 0.0
+            candidates = [(elapsed * 1000, statement, route) for elapsed, statement in timing.statements
+                          if elapsed * 1000 > floor]
+            if candidates:
+                self._slowest = sorted(self._slowest + candidates, key=lambda item: -item[0])[:self.slow_statements]
+
+    def add_profile(self, route, duration, text):
+        with self._lock:
+            self._profiles.appendleft({'route': route, 'duration': duration * 1000, 'at': time.time(), 'text': text})
+
+    def snapshot(self):
+        with self._lock:
+            routes = {route: stats.summary() for route, stats in self._routes.items()}
+            slowest = list(self._slowest)
+            profiles = list(self._profiles)
+        # Routes costing the most overall first
+        routes = dict(sorted(routes.items(), key=lambda item: -item[1]['total']))
+        return {'routes': routes, 'slowest': slowest, 'profiles': profiles, 'since': self.since}
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+            self._slowest = []
+            self._profiles.clear()
+            self.since = time.time()
+
+
+def start_profile():
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def profile_report(profiler, limit=30):
+    profiler.disable()
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(limit)
+    return output.getvalue()
@@ -0,0 +1,274 @@
+"""
+Prometheus metrics for ModernBlog
+Every worker process writes its samples to its own memory-mapped file in a shared directory;
+/metrics, answered by whichever worker gets the scrape, adds up the files of all of them.
+Recording a sample is an in-memory float update, with no locks shared between processes
+and no system calls.
+"""
+
+import bisect
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+
+INITIAL_FILE_SIZE = 1 << 16
+_HEADER = struct.Struct('<I4x')  # bytes used, padding
+_LENGTH = struct.Struct('<I')
+_VALUE = struct.Struct('<d')
+_FILE_NAME = re.compile(r'^(values|live)_(\d+)\.db$')
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _decode_key(encoded):
+    name, labels, suffix = json.loads(encoded)
+    return name, tuple(labels), suffix
+
+
+class ValueFile:
+    """A memory-mapped append-only map of JSON keys to doubles, written by a single process.
+
+    Entries are a 4-byte key length, the key padded to 8 bytes and the value. The header
+    records how many bytes are in use and is updated after an entry is complete, so readers
+    in other processes never see a partial one.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a+b')
+        size = os.fstat(self._file.fileno()).st_size
+        if size == 0:
+            self._file.truncate(INITIAL_FILE_SIZE)
+            size = INITIAL_FILE_SIZE
+        self._capacity = size
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._positions = {}
+        self._used = _HEADER.unpack_from(self._map, 0)[0] or _HEADER.size
+        for key, value, position in self._entries(self._map, self._used):
+            self._positions[_decode_key(key)] = position
+
+    @staticmethod
+    def _entries(data, used):
+        position = _HEADER.size
+        while position < used:
+            length = _LENGTH.unpack_from(data, position)[0]
+            key_end = position + _LENGTH.size + length
+            value_position = key_end + (-key_end % 8)
+            yield data[position + _LENGTH.size:key_end].decode('utf-8'), _VALUE.unpack_from(data, value_position)[0], value_position
+            position = value_position + _VALUE.size
+
+    def _position(self, key):
+        position = self._positions.get(key)
+        if position is None:
+            encoded = json.dumps(key).encode('utf-8')
+            key_end = self._used + _LENGTH.size + len(encoded)
+            position = key_end + (-key_end % 8)
+            while position + _VALUE.size > self._capacity:
+                self._capacity *= 2
+                self._file.truncate(self._capacity)
+                self._map.close()
+                self._map = mmap.mmap(self._file.fileno(), self._capacity)
+            _LENGTH.pack_into(self._map, self._used, len(encoded))
+            self._map[self._used + _LENGTH.size:key_end] = encoded
+            _VALUE.pack_into(self._map, position, 0.0)
+            self._used = position + _VALUE.size
+            _HEADER.pack_into(self._map, 0, self._used)
+            self._positions[key] = position
+        return position
+
+    def add(self, key, amount):
+        position = self._position(key)
+        _VALUE.pack_into(self._map, position, _VALUE.unpack_from(self._map, position)[0] + amount)
+
+    def set(self, key, value):
+        _VALUE.pack_into(self._map, self._position(key), value)
+
+    @classmethod
+    def read(cls, path):
+        """(key, value) pairs of a file another process may still be writing"""
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) < _HEADER.size:
+            return []
+        used = min(_HEADER.unpack_from(data, 0)[0], len(data))
+        return [(_decode_key(key), value) for key, value, _ in cls._entries(data, used)]
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+class MetricsStore:
+    """This process's files in ``directory``: ``values_<pid>.db`` holds counters and
+    histograms, which outlive the process, and ``live_<pid>.db`` gauges, which
+    ``mark_process_dead`` removes."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._files = {}
+        # Each worker writes its own files; a forked child drops the ones it inherited
+        os.register_at_fork(after_in_child=self._files.clear)
+
+    def _file(self, kind):
+        value_file = self._files.get(kind)
+        if value_file is None:
+            os.makedirs(self.directory, exist_ok=True)
+            value_file = self._files[kind] = ValueFile(os.path.join(self.directory, f'{kind}_{os.getpid()}.db'))
+        return value_file
+
+    def add(self, *increments):
+        """Add each (key, amount) pair, all under one lock"""
+        with self._lock:
+            value_file = self._file('values')
+            for key, amount in increments:
+                value_file.add(key, amount)
+
+    def set(self, key, value):
+        with self._lock:
+            self._file('live').set(key, value)
+
+    def collect(self):
+        """Values of every process, summed per key"""
+        totals = {}
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return totals
+        for name in sorted(names):
+            if _FILE_NAME.match(name):
+                try:
+                    entries = ValueFile.read(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue  # a worker exited while we were reading
+                for key, value in entries:
+                    totals[key] = totals.get(key, 0.0) + value
+        return totals
+
+    def mark_process_dead(self, pid):
+        try:
+            os.remove(os.path.join(self.directory, f'live_{pid}.db'))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        """Remove every file; for a fresh start before workers are forked"""
+        with self._lock:
+            for value_file in self._files.values():
+                value_file.close()
+            self._files.clear()
+            for name in os.listdir(self.directory) if os.path.isdir(self.directory) else ():
+                if _FILE_NAME.match(name):
+                    os.remove(os.path.join(self.directory, name))
+
+
+class Metric:
+    type = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.store = registry.store
+        registry.metrics.append(self)
+
+    def _labels(self, labels):
+        return tuple([str(labels[name]) for name in self.labelnames])
+
+    def samples(self, values):
+        """Exposition lines for this metric from the collected ``values``"""
+        raise NotImplementedError
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    return '+Inf' if value == math.inf else repr(float(value))
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self.store.add(((self.name, self._labels(labels), ''), amount))
+
+    def samples(self, values):
+        for (name, labels, suffix), value in values:
+            yield f'{self.name}_total{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+
+
+class Gauge(Metric):
+    """Summed over live processes, e.g. connections in use across all workers"""
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        self.store.set((self.name, self._labels(labels), ''), value)
+
+    def samples(self, values):
+        for (name, labels, suffix), value in values:
+            yield f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._slots = [str(index) for index in range(len(self.buckets) + 1)]
+
+    def observe(self, value, **labels):
+        labels = self._labels(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        # One slot per bucket (made cumulative on exposition), plus the sum; the count is the +Inf bucket
+        self.store.add(((self.name, labels, self._slots[index]), 1), ((self.name, labels, 'sum'), value))
+
+    def samples(self, values):
+        series = {}
+        for (name, labels, suffix), value in values:
+            series.setdefault(labels, {})[suffix] = value
+        for labels, slots in series.items():
+            cumulative = 0.0
+            for index, bound in enumerate(self.buckets + (math.inf,)):
+                cumulative += slots.get(str(index), 0.0)
+                le = [('le', _format_value(bound))]
+                yield f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {_format_value(cumulative)}'
+            yield f'{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(slots.get("sum", 0.0))}'
+            yield f'{self.name}_count{_format_labels(self.labelnames, labels)} {_format_value(cumulative)}'
+
+
+class Registry:
+    def __init__(self, directory):
+        self.store = MetricsStore(directory)
+        self.metrics = []
+
+    def counter(self, name, documentation, labelnames=()):
+        return Counter(self, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return Gauge(self, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return Histogram(self, name, documentation, labelnames, buckets)
+
+    def exposition(self):
+        """Prometheus text format (version 0.0.4) for every process's samples"""
+        grouped = {}
+        for key, value in self.store.collect().items():
+            grouped.setdefault(key[0], []).append((key, value))
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.samples(sorted(grouped.get(metric.name, []))))
+        return '\n'.join(lines) + '\n'
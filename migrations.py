@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Schema migrations for ModernBlog
+Versioned up/down steps that bring any existing database to the current models
+
+Usage:
+    python migrations.py upgrade [VERSION]   # apply pending migrations (default: all)
+    python migrations.py downgrade VERSION   # revert down to VERSION (0 reverts everything)
+    python migrations.py status
+"""
+
+import json
+import sys
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import Column, DateTime, MetaData, String, Table, func, inspect, select, text
+from app import (app, db, LISTINGS_VERSION, ensure_search_index, drop_search_index, rebuild_comment_counts, rebuild_counters,
+                 rebuild_upload_references, touch_listings)
+
+Migration = namedtuple('Migration', 'version description up down')
+
+# Kept out of db.metadata so create_all/drop_all never touch the migration history
+_version_metadata = MetaData()
+schema_migrations = Table('schema_migrations', _version_metadata,
+    Column('version', String(32), primary_key=True),
+    Column('applied_at', DateTime, nullable=False)
+)
+
+BASELINE_TABLES = ('category', 'tag', 'post', 'post_tags', 'comment', 'setting', 'page', 'contact', 'user', 'menu_item')
+CACHE_TABLES = ('cache_version', 'cache_purge')
+HOT_PATH_INDEXES = (
+    ('post', 'ix_post_published_created_at_id'),
+    ('post', 'ix_post_category_published_created_at_id'),
+    ('post_tags', 'ix_post_tags_tag_id'),
+    ('comment', 'ix_comment_post_approved_created_at'),
+    ('comment', 'ix_comment_approved_created_at'),
+    ('contact', 'ix_contact_read_created_at'),
+    ('menu_item', 'ix_menu_item_active_order'),
+)
+ADMIN_LIST_INDEXES = (
+    ('post', 'ix_post_created_at_id'),
+    ('comment', 'ix_comment_created_at_id'),
+    ('contact', 'ix_contact_created_at_id'),
+)
+
+def _tables(names):
+    return [db.metadata.tables[name] for name in names]
+
+def _model_index(table, name):
+    return next(index for index in db.metadata.tables[table].indexes if index.name == name)
+
+def _columns(connection, table):
+    return {column['name'] for column in inspect(connection).get_columns(table)}
+
+# 0001: the schema as it shipped before migrations existed. Fresh databases get the
+# current models here, which turns the later steps into no-ops.
+def baseline_up(connection):
+    db.metadata.create_all(connection, tables=_tables(BASELINE_TABLES))
+
+def baseline_down(connection):
+    db.metadata.drop_all(connection, tables=_tables(BASELINE_TABLES))
+
+# 0002: rendered Markdown stored next to the source
+def rendered_content_up(connection):
+    for table in ('post', 'page'):
+        columns = _columns(connection, table)
+        if 'content_html' not in columns:
+            connection.execute(text(f'ALTER TABLE {table} ADD COLUMN content_html TEXT'))
+        if 'content_hash' not in columns:
+            connection.execute(text(f'ALTER TABLE {table} ADD COLUMN content_hash VARCHAR(64)'))
+
+def rendered_content_down(connection):
+    for table in ('post', 'page'):
+        columns = _columns(connection, table)
+        for column in ('content_hash', 'content_html'):
+            if column in columns:
+                connection.execute(text(f'ALTER TABLE {table} DROP COLUMN {column}'))
+
+# 0003: cross-worker cache stamps and the page cache purge log
+def cache_tables_up(connection):
+    db.metadata.create_all(connection, tables=_tables(CACHE_TABLES))
+
+def cache_tables_down(connection):
+    db.metadata.drop_all(connection, tables=_tables(CACHE_TABLES))
+
+# 0004: full-text search index
+def search_index_up(connection):
+    ensure_search_index(connection)
+
+def search_index_down(connection):
+    drop_search_index(connection)
+
+# 0005: composite indexes for the public listings, comments, admin badges and menu
+def hot_path_indexes_up(connection):
+    for table, name in HOT_PATH_INDEXES:
+        _model_index(table, name).create(connection, checkfirst=True)
+
+def hot_path_indexes_down(connection):
+    for table, name in HOT_PATH_INDEXES:
+        _model_index(table, name).drop(connection, checkfirst=True)
+
+# 0006: maintained admin counters, seeded from the current row counts
+def counters_up(connection):
+    db.metadata.tables['counter'].create(connection, checkfirst=True)
+    rebuild_counters(connection)
+
+def counters_down(connection):
+    db.metadata.tables['counter'].drop(connection, checkfirst=True)
+
+# 0007: uploaded images and their rendered variants
+def image_assets_up(connection):
+    db.metadata.tables['image_asset'].create(connection, checkfirst=True)
+
+def image_assets_down(connection):
+    db.metadata.tables['image_asset'].drop(connection, checkfirst=True)
+
+# 0008: content-addressed uploads. Variants rendered before this step sit in the variants/
+# directory and were stored without it; references are seeded from current content.
+def _rewrite_variant_keys(connection, rewrite):
+    assets = db.metadata.tables['image_asset']
+    for asset_id, variants in connection.execute(select(assets.c.id, assets.c.variants).where(assets.c.variants.isnot(None))):
+        variants = json.loads(variants)
+        for variant in variants.values():
+            variant['files'] = {fmt: rewrite(key) for fmt, key in variant['files'].items()}
+        connection.execute(assets.update().where(assets.c.id == asset_id).values(variants=json.dumps(variants)))
+
+def upload_references_up(connection):
+    if 'uploaded_at' not in _columns(connection, 'image_asset'):
+        connection.execute(text('ALTER TABLE image_asset ADD COLUMN uploaded_at TIMESTAMP'))
+        connection.execute(text('UPDATE image_asset SET uploaded_at = created_at'))
+        _rewrite_variant_keys(connection, lambda key: 'variants/' + key)
+    db.metadata.tables['upload_reference'].create(connection, checkfirst=True)
+    rebuild_upload_references(connection)
+
+def upload_references_down(connection):
+    db.metadata.tables['upload_reference'].drop(connection, checkfirst=True)
+    if 'uploaded_at' in _columns(connection, 'image_asset'):
+        _rewrite_variant_keys(connection, lambda key: key.split('/')[-1])
+        connection.execute(text('ALTER TABLE image_asset DROP COLUMN uploaded_at'))
+
+# 0009: approved comment count and last comment change on post, seeded from the comments
+def comment_counts_up(connection):
+    columns = _columns(connection, 'post')
+    if 'approved_comment_count' not in columns:
+        connection.execute(text('ALTER TABLE post ADD COLUMN approved_comment_count INTEGER NOT NULL DEFAULT 0'))
+    if 'comments_changed_at' not in columns:
+        connection.execute(text('ALTER TABLE post ADD COLUMN comments_changed_at TIMESTAMP'))
+    rebuild_comment_counts(connection)
+
+def comment_counts_down(connection):
+    columns = _columns(connection, 'post')
+    for column in ('comments_changed_at', 'approved_comment_count'):
+        if column in columns:
+            connection.execute(text(f'ALTER TABLE post DROP COLUMN {column}'))
+
+# 0010: newest-first indexes for the unfiltered admin lists
+def admin_list_indexes_up(connection):
+    for table, name in ADMIN_LIST_INDEXES:
+        _model_index(table, name).create(connection, checkfirst=True)
+
+def admin_list_indexes_down(connection):
+    for table, name in ADMIN_LIST_INDEXES:
+        _model_index(table, name).drop(connection, checkfirst=True)
+
+# 0011: background AI draft jobs
+def generation_jobs_up(connection):
+    db.metadata.tables['generation_job'].create(connection, checkfirst=True)
+
+def generation_jobs_down(connection):
+    db.metadata.tables['generation_job'].drop(connection, checkfirst=True)
+
+# 0012: cached model responses and per-call generation accounting
+GENERATION_ACCOUNTING_TABLES = ('generation_cache_entry', 'generation_call', 'generation_usage')
+
+def generation_accounting_up(connection):
+    db.metadata.create_all(connection, tables=_tables(GENERATION_ACCOUNTING_TABLES))
+
+def generation_accounting_down(connection):
+    db.metadata.drop_all(connection, tables=_tables(GENERATION_ACCOUNTING_TABLES))
+
+# 0013: progress of resumable bulk imports
+def import_checkpoints_up(connection):
+    db.metadata.tables['import_checkpoint'].create(connection, checkfirst=True)
+
+def import_checkpoints_down(connection):
+    db.metadata.tables['import_checkpoint'].drop(connection, checkfirst=True)
+
+# 0014: the public listings' validator, seeded from the newest published post
+def listings_stamp_up(connection):
+    posts = db.metadata.tables['post']
+    latest = connection.execute(select(func.max(posts.c.updated_at)).where(posts.c.published == True)).scalar()
+    touch_listings(connection, latest)
+
+def listings_stamp_down(connection):
+    versions = db.metadata.tables['cache_version']
+    connection.execute(versions.delete().where(versions.c.name == LISTINGS_VERSION))
+
+MIGRATIONS = [
+    Migration('0001', 'Baseline schema', baseline_up, baseline_down),
+    Migration('0002', 'Rendered content columns on post and page', rendered_content_up, rendered_content_down),
+    Migration('0003', 'Cache version and purge log tables', cache_tables_up, cache_tables_down),
+    Migration('0004', 'Full-text search index', search_index_up, search_index_down),
+    Migration('0005', 'Indexes for hot query paths', hot_path_indexes_up, hot_path_indexes_down),
+    Migration('0006', 'Admin counters', counters_up, counters_down),
+    Migration('0007', 'Image assets', image_assets_up, image_assets_down),
+    Migration('0008', 'Upload references', upload_references_up, upload_references_down),
+    Migration('0009', 'Approved comment counts on post', comment_counts_up, comment_counts_down),
+    Migration('0010', 'Indexes for admin lists', admin_list_indexes_up, admin_list_indexes_down),
+    Migration('0011', 'AI draft generation jobs', generation_jobs_up, generation_jobs_down),
+    Migration('0012', 'AI generation cache and accounting', generation_accounting_up, generation_accounting_down),
+    Migration('0013', 'Bulk import checkpoints', import_checkpoints_up, import_checkpoints_down),
+    Migration('0014', 'Listings validator stamp', listings_stamp_up, listings_stamp_down),
+]
+
+def applied_versions(engine=None):
+    engine = engine or db.engine
+    with engine.begin() as connection:
+        schema_migrations.create(connection, checkfirst=True)
+        return {row[0] for row in connection.execute(select(schema_migrations.c.version))}
+
+def upgrade(target=None, engine=None):
+    """Apply pending migrations up to ``target`` (default: latest); returns the versions applied"""
+    engine = engine or db.engine
+    done = applied_versions(engine)
+    applied = []
+    for migration in MIGRATIONS:
+        if target is not None and migration.version > target:
+            break
+        if migration.version in done:
+            continue
+        # Each step and its history row commit together
+        with engine.begin() as connection:
+            migration.up(connection)
+            connection.execute(schema_migrations.insert().values(version=migration.version, applied_at=datetime.utcnow()))
+        applied.append(migration.version)
+    return applied
+
+def downgrade(target, engine=None):
+    """Revert applied migrations newer than ``target``, newest first; returns the versions reverted"""
+    engine = engine or db.engine
+    done = applied_versions(engine)
+    reverted = []
+    for migration in reversed(MIGRATIONS):
+        if migration.version <= target:
+            break
+        if migration.version not in done:
+            continue
+        with engine.begin() as connection:
+            migration.down(connection)
+            connection.execute(schema_migrations.delete().where(schema_migrations.c.version == migration.version))
+        reverted.append(migration.version)
+    return reverted
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else 'upgrade'
+    target = sys.argv[2] if len(sys.argv) > 2 else None
+    with app.app_context():
+        if command == 'upgrade':
+            target = target.zfill(4) if target else None
+            for version in upgrade(target):
+                print(f"✓ Applied {version}")
+            print("✓ Database schema is up to date" if target is None else f"✓ Database schema at {target}")
+        elif command == 'downgrade' and target is not None:
+            for version in downgrade(target.zfill(4)):
+                print(f"✓ Reverted {version}")
+        elif command == 'status':
+            done = applied_versions()
+            for migration in MIGRATIONS:
+                mark = '✓' if migration.version in done else ' '
+                print(f"[{mark}] {migration.version} {migration.description}")
+        else:
+            print(__doc__.strip())
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""
+Full-page cache backends for ModernBlog
+Entries are tagged with what they depend on so writes can purge exactly the affected pages
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+CachedPage = namedtuple('CachedPage', 'body headers tags stored_at')
+
+
+class MemoryPageCache:
+    """Per-process LRU cache; each gunicorn worker keeps its own copy"""
+
+    shared = False
+
+    def __init__(self, max_entries=512, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._tag_index = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry.stored_at > self.ttl:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, body, headers, tags):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = CachedPage(body, headers, frozenset(tags), time.time())
+            for tag in tags:
+                self._tag_index.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def purge(self, tags):
+        with self._lock:
+            for tag in tags:
+                for key in self._tag_index.pop(tag, set()):
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tag_index.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry.tags:
+            keys = self._tag_index.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tag_index[tag]
+
+
+class FilesystemPageCache:
+    """Cache shared by every worker on the host through a directory.
+
+    Each entry records the version of every tag it depends on; purging a tag
+    bumps its version file, which makes all entries holding the old version
+    misses without having to find them. Those and expired entries stay on disk
+    until a sweep, which also caps the directory at ``max_entries`` files.
+    """
+
+    shared = True
+
+    def __init__(self, directory, max_entries=512, ttl=300):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # Every worker sweeps after a tenth of the limit in writes of its own, or once per TTL
+        self._sweep_every = max(1, max_entries // 10)
+        self._writes = 0
+        self._swept_at = time.time()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(directory, 'pages'), exist_ok=True)
+        os.makedirs(os.path.join(directory, 'tags'), exist_ok=True)
+
+    def get(self, key):
+        try:
+            with open(self._page_path(key), 'rb') as f:
+                entry, versions = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if time.time() - entry.stored_at > self.ttl:
+            return None
+        for tag, version in versions.items():
+            if self._tag_version(tag) != version:
+                return None
+        return entry
+
+    def set(self, key, body, headers, tags):
+        entry = CachedPage(body, headers, frozenset(tags), time.time())
+        versions = {tag: self._tag_version(tag) for tag in tags}
+        self._atomic_write(self._page_path(key), pickle.dumps((entry, versions), pickle.HIGHEST_PROTOCOL))
+        with self._lock:
+            self._writes += 1
+            due = self._writes >= self._sweep_every or time.time() - self._swept_at > self.ttl
+            if due:
+                self._writes, self._swept_at = 0, time.time()
+        if due:
+            self.sweep()
+
+    def purge(self, tags):
+        for tag in tags:
+            self._atomic_write(self._tag_path(tag), os.urandom(8).hex().encode())
+
+    def clear(self):
+        for name in os.listdir(os.path.join(self.directory, 'pages')):
+            try:
+                os.remove(os.path.join(self.directory, 'pages', name))
+            except OSError:
+                pass
+
+    def sweep(self):
+        """Delete expired entries, then the oldest ones beyond ``max_entries``"""
+        now = time.time()
+        live = []
+        for entry in os.scandir(os.path.join(self.directory, 'pages')):
+            if entry.name.startswith('tmp'):
+                continue  # still being written by _atomic_write
+            try:
+                stored_at = entry.stat().st_mtime
+                if now - stored_at > self.ttl:
+                    os.remove(entry.path)
+                else:
+                    live.append((stored_at, entry.path))
+            except OSError:
+                pass
+        for stored_at, path in sorted(live)[:max(0, len(live) - self.max_entries)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _page_path(self, key):
+        return os.path.join(self.directory, 'pages', hashlib.sha256(key.encode('utf-8')).hexdigest())
+
+    def _tag_path(self, tag):
+        return os.path.join(self.directory, 'tags', hashlib.sha1(tag.encode('utf-8')).hexdigest())
+
+    def _tag_version(self, tag):
+        try:
+            with open(self._tag_path(tag), 'rb') as f:
+                return f.read()
+        except OSError:
+            return b''
+
+    def _atomic_write(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+def create_page_cache(backend, directory=None, max_entries=512, ttl=300):
+    if backend == 'filesystem':
+        return FilesystemPageCache(directory, max_entries=max_entries, ttl=ttl)
+    if backend == 'memory':
+        return MemoryPageCache(max_entries=max_entries, ttl=ttl)
+    return None
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Image variant backfill for ModernBlog
+Registers uploads that predate the image pipeline and renders their variants
+"""
+
+import sys
+from app import app, db, ImageAsset, IMAGE_EXTENSIONS, process_image_asset, upload_storage
+
+def pending_uploads(force=False):
+    extensions = set(IMAGE_EXTENSIONS.values()) | {'jpeg'}
+    assets = ImageAsset.query.all()
+    statuses = {asset.filename: asset.status for asset in assets}
+    # Rendered variants live in the same storage; only originals are candidates
+    variants = set()
+    for asset in assets:
+        variants |= asset.storage_keys() - {asset.filename}
+    for key in sorted(upload_storage.keys()):
+        if key in variants or key.startswith('variants/'):
+            continue
+        if key.rsplit('.', 1)[-1].lower() not in extensions:
+            continue
+        if force or statuses.get(key) != 'ready':
+            yield key, key in statuses
+
+def main():
+    force = '--force' in sys.argv
+    with app.app_context():
+        processed = 0
+        for key, known in pending_uploads(force):
+            if not known:
+                db.session.add(ImageAsset(filename=key))
+                db.session.commit()
+            process_image_asset(key)
+            processed += 1
+        print(f"✓ Rendered variants for {processed} uploads")
+
+if __name__ == '__main__':
+    main()
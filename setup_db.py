@@ -7,6 +7,7 @@ Detects database type and initializes automatically
 import os
 import sys
 from app import app, db
+from migrations import upgrade
 
 def setup_database():
     """Automatically detect and setup database"""
@@ -36,8 +37,8 @@ def setup_database():
             
             print(f"🏗️  Setting up {db_type} database...")
             
-            # Create all tables
-            db.create_all()
+            # Create or migrate the schema
+            upgrade()
             
             # Import models for data creation
             from app import Category, Tag, Post, Comment, Setting, Page, Contact, User, MenuItem
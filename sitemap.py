@@ -0,0 +1,143 @@
+"""
+Pre-generated sitemaps for ModernBlog
+URLs are streamed into gzip-compressed files; past MAX_URLS they are split into numbered
+child sitemaps behind a sitemap index, as the sitemaps.org protocol requires
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime, timezone
+from xml.sax.saxutils import escape
+
+MAX_URLS = 50000
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+URLSET_OPEN = '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+INDEX_OPEN = '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+
+
+def url_entry(loc, lastmod=None, changefreq=None, priority=None):
+    parts = ['  <url>\n    <loc>', escape(loc), '</loc>\n']
+    if lastmod:
+        parts += ['    <lastmod>', lastmod.strftime('%Y-%m-%d'), '</lastmod>\n']
+    if changefreq:
+        parts += ['    <changefreq>', changefreq, '</changefreq>\n']
+    if priority:
+        parts += ['    <priority>', priority, '</priority>\n']
+    parts.append('  </url>\n')
+    return ''.join(parts)
+
+
+class _ShardWriter:
+    """Writes one gzip file to a temp path while hashing the uncompressed XML"""
+
+    def __init__(self, directory):
+        fd, self.tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        self._raw = os.fdopen(fd, 'wb')
+        # mtime=0 keeps the bytes identical for identical content
+        self._gzip = gzip.GzipFile(fileobj=self._raw, mode='wb', mtime=0)
+        self._digest = hashlib.sha1()
+        self.count = 0
+
+    def write(self, text):
+        data = text.encode('utf-8')
+        self._digest.update(data)
+        self._gzip.write(data)
+
+    def close(self):
+        self._gzip.close()
+        self._raw.close()
+        return self._digest.hexdigest()
+
+
+class SitemapStore:
+    """Sitemap files for one site, rebuilt only when the caller's fingerprint changes.
+
+    Rebuilds stream every URL again but only replace the shards whose content changed,
+    so unchanged child sitemaps keep their lastmod in the index.
+    """
+
+    def __init__(self, directory, max_urls=MAX_URLS):
+        self.directory = directory
+        self.max_urls = max_urls
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def current(self, fingerprint):
+        manifest = self.manifest()
+        if manifest and manifest['fingerprint'] == fingerprint:
+            return manifest
+        return None
+
+    def manifest(self):
+        try:
+            with open(self.path('manifest.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def build(self, fingerprint, urls, base_url):
+        """Write the sitemap for ``urls`` (an iterable of <url> XML fragments) and return its manifest"""
+        with self._lock:
+            manifest = self.current(fingerprint)
+            if manifest:
+                return manifest
+            previous = {shard['file']: shard for shard in (self.manifest() or {}).get('shards', [])}
+            now = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S+00:00')
+            shards = []
+            writer = None
+            for entry in urls:
+                if writer is None:
+                    writer = _ShardWriter(self.directory)
+                    writer.write(XML_HEADER + URLSET_OPEN)
+                writer.write(entry)
+                writer.count += 1
+                if writer.count == self.max_urls:
+                    shards.append(self._finish_shard(writer, len(shards) + 1, previous, now))
+                    writer = None
+            if writer is not None or not shards:
+                if writer is None:
+                    writer = _ShardWriter(self.directory)
+                    writer.write(XML_HEADER + URLSET_OPEN)
+                shards.append(self._finish_shard(writer, len(shards) + 1, previous, now))
+
+            root = shards[0]['file']
+            if len(shards) > 1:
+                root = 'sitemap_index.xml.gz'
+                writer = _ShardWriter(self.directory)
+                writer.write(XML_HEADER + INDEX_OPEN)
+                for number, shard in enumerate(shards, 1):
+                    writer.write('  <sitemap>\n    <loc>%s</loc>\n    <lastmod>%s</lastmod>\n  </sitemap>\n'
+                                 % (escape('%s/sitemap-%d.xml' % (base_url, number)), shard['lastmod']))
+                writer.write('</sitemapindex>\n')
+                writer.close()
+                os.replace(writer.tmp_path, self.path(root))
+
+            for stale in set(previous) - {shard['file'] for shard in shards}:
+                try:
+                    os.remove(self.path(stale))
+                except OSError:
+                    pass
+            manifest = {'fingerprint': fingerprint, 'root': root, 'shards': shards, 'generated_at': now}
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(manifest, f)
+            os.replace(tmp_path, self.path('manifest.json'))
+            return manifest
+
+    def _finish_shard(self, writer, number, previous, now):
+        writer.write('</urlset>\n')
+        digest = writer.close()
+        filename = 'sitemap-%d.xml.gz' % number
+        old = previous.get(filename)
+        if old and old['sha1'] == digest and os.path.exists(self.path(filename)):
+            os.remove(writer.tmp_path)
+            return old
+        os.replace(writer.tmp_path, self.path(filename))
+        return {'file': filename, 'sha1': digest, 'urls': writer.count, 'lastmod': now}
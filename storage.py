@@ -0,0 +1,123 @@
+"""
+Upload storage backends for ModernBlog
+Files are addressed by the SHA-256 of their stored bytes and sharded into
+two levels of directories, so identical uploads share one object
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+
+
+CONTENT_KEY = re.compile(r'[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.\w+')
+
+
+def content_key(data, extension):
+    """Storage key for ``data``: ab/cd/abcd....<extension>"""
+    digest = hashlib.sha256(data).hexdigest()
+    return f'{digest[:2]}/{digest[2:4]}/{digest}.{extension}'
+
+
+def is_content_key(key):
+    """Whether ``key`` names its object by content, rather than being a legacy or made-up name"""
+    return CONTENT_KEY.fullmatch(key) is not None
+
+
+class LocalStorage:
+    """Files under a directory on local disk; public URLs are left to the web app's static route"""
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key):
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValueError(f'Key escapes the storage root: {key}')
+        return path
+
+    def exists(self, key):
+        return os.path.isfile(self.path(key))
+
+    def save(self, key, stream, content_type=None):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            shutil.copyfileobj(stream, f)
+        os.replace(tmp_path, path)
+
+    def open(self, key):
+        return open(self.path(key), 'rb')
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def keys(self):
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if not filename.endswith('.tmp') and not filename.startswith('tmp'):
+                    yield os.path.relpath(os.path.join(directory, filename), self.root).replace(os.sep, '/')
+
+    def url(self, key):
+        return None
+
+
+class S3Storage:
+    """Objects in an S3-compatible bucket, driven through a boto3-style client"""
+
+    def __init__(self, client, bucket, public_url, prefix=''):
+        self.client = client
+        self.bucket = bucket
+        self.public_url = public_url.rstrip('/')
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+
+    def _key(self, key):
+        return self.prefix + key
+
+    def exists(self, key):
+        response = self.client.list_objects_v2(Bucket=self.bucket, Prefix=self._key(key), MaxKeys=1)
+        return any(item['Key'] == self._key(key) for item in response.get('Contents', []))
+
+    def save(self, key, stream, content_type=None):
+        extra = {'ContentType': content_type} if content_type else {}
+        # Keys change whenever content does, so objects never need revalidating
+        self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=stream.read(),
+                               CacheControl='public, max-age=31536000, immutable', **extra)
+
+    def open(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=self._key(key))['Body']
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def keys(self):
+        token = None
+        while True:
+            kwargs = {'Bucket': self.bucket, 'Prefix': self.prefix}
+            if token:
+                kwargs['ContinuationToken'] = token
+            response = self.client.list_objects_v2(**kwargs)
+            for item in response.get('Contents', []):
+                yield item['Key'][len(self.prefix):]
+            if not response.get('IsTruncated'):
+                return
+            token = response['NextContinuationToken']
+
+    def url(self, key):
+        return f'{self.public_url}/{self._key(key)}'
+
+
+def create_storage(backend, root=None, bucket=None, prefix='', public_url=None, endpoint_url=None):
+    if backend == 's3':
+        if not bucket or not public_url:
+            raise ValueError('The S3 upload backend needs a bucket and a public URL')
+        import boto3  # only needed for the S3 backend
+        client = boto3.client('s3', endpoint_url=endpoint_url or None)
+        return S3Storage(client, bucket, public_url, prefix=prefix)
+    return LocalStorage(root)
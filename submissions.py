@@ -0,0 +1,174 @@
+"""
+Queued comment and contact submissions for ModernBlog
+Requests spool submissions to a directory shared by every worker on the host; a background
+writer inserts them in batches, so a flood of posts costs the database one short write
+transaction per batch instead of one per submission
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+LINK = re.compile(r'https?://|www\.', re.I)
+
+
+class SubmissionQueue:
+    """Spool directory of JSON files; ``new/`` holds queued records, ``processing/`` the claimed ones
+    and ``failed/`` the ones the database refused, kept for an admin to inspect.
+
+    Claiming is an atomic rename, so any number of writers can drain the same spool. Records
+    are only deleted after their batch commits, and claims older than ``stale_after`` seconds
+    (a writer that died mid-batch) are queued again.
+    """
+
+    def __init__(self, directory, stale_after=60):
+        self.new_dir = os.path.join(directory, 'new')
+        self.processing_dir = os.path.join(directory, 'processing')
+        self.failed_dir = os.path.join(directory, 'failed')
+        self.stale_after = stale_after
+        os.makedirs(self.new_dir, exist_ok=True)
+        os.makedirs(self.processing_dir, exist_ok=True)
+        os.makedirs(self.failed_dir, exist_ok=True)
+
+    def put(self, kind, data):
+        # Names sort in arrival order, so batches keep submissions in sequence
+        name = f'{time.time_ns():020d}-{uuid.uuid4().hex}.json'
+        fd, tmp_path = tempfile.mkstemp(dir=self.new_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'kind': kind, 'data': data}, f)
+        os.replace(tmp_path, os.path.join(self.new_dir, name))
+        return name
+
+    def pending(self):
+        return sorted(name for name in os.listdir(self.new_dir) if name.endswith('.json'))
+
+    def claim(self, limit):
+        """Move up to ``limit`` queued records to processing/; returns [(name, record)]"""
+        claimed = []
+        for name in self.pending():
+            if len(claimed) == limit:
+                break
+            target = os.path.join(self.processing_dir, name)
+            try:
+                os.rename(os.path.join(self.new_dir, name), target)
+            except FileNotFoundError:
+                continue  # another writer got there first
+            # Claims are aged from when they were taken, not when they were queued
+            os.utime(target)
+            try:
+                with open(target) as f:
+                    claimed.append((name, json.load(f)))
+            except ValueError:
+                os.remove(target)
+        return claimed
+
+    def ack(self, names):
+        for name in names:
+            try:
+                os.remove(os.path.join(self.processing_dir, name))
+            except FileNotFoundError:
+                pass
+
+    def release(self, names):
+        for name in names:
+            try:
+                os.rename(os.path.join(self.processing_dir, name), os.path.join(self.new_dir, name))
+            except FileNotFoundError:
+                pass
+
+    def reject(self, names):
+        """Set claimed records aside in failed/ so they are never retried"""
+        for name in names:
+            try:
+                os.rename(os.path.join(self.processing_dir, name), os.path.join(self.failed_dir, name))
+            except FileNotFoundError:
+                pass
+
+    def recover(self):
+        """Queue again the claims of writers that stopped before finishing their batch"""
+        cutoff = time.time() - self.stale_after
+        stale = []
+        for name in os.listdir(self.processing_dir):
+            try:
+                if os.path.getmtime(os.path.join(self.processing_dir, name)) < cutoff:
+                    stale.append(name)
+            except FileNotFoundError:
+                pass
+        self.release(stale)
+        return len(stale)
+
+
+class SlidingWindow:
+    """At most ``limit`` events per key in any ``window`` seconds; remembers ``max_keys`` keys"""
+
+    def __init__(self, limit, window, max_keys=10000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._events = OrderedDict()
+
+    def allows(self, key, now):
+        """Whether one more event for ``key`` fits; records nothing"""
+        events = self._events.get(key)
+        if not events:
+            return True
+        while events and events[0] <= now - self.window:
+            events.popleft()
+        return len(events) < self.limit
+
+    def record(self, key, now):
+        events = self._events.pop(key, None) or deque()
+        events.append(now)
+        self._events[key] = events
+        while len(self._events) > self.max_keys:
+            self._events.popitem(last=False)
+
+
+class SubmissionFilter:
+    """Cheap in-process checks run before a submission is queued.
+
+    ``check`` returns None for an acceptable submission, otherwise 'rate_limited' (too many
+    from this address or to this post), 'duplicate' (the same text was accepted recently)
+    or 'spam'. Limits are per worker process.
+    """
+
+    def __init__(self, per_ip=5, per_target=30, window=60, duplicate_ttl=3600, max_links=3, max_duplicates=10000):
+        self.per_ip = SlidingWindow(per_ip, window)
+        self.per_target = SlidingWindow(per_target, window)
+        self.duplicate_ttl = duplicate_ttl
+        self.max_links = max_links
+        self.max_duplicates = max_duplicates
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, ip, target, text, honeypot=''):
+        if honeypot or len(LINK.findall(text)) > self.max_links:
+            return 'spam'
+        digest = hashlib.sha1(' '.join(text.lower().split()).encode('utf-8')).hexdigest()
+        now = time.monotonic()
+        with self._lock:
+            seen_at = self._seen.get((target, digest))
+            if seen_at is not None and now - seen_at < self.duplicate_ttl:
+                return 'duplicate'
+            if not self.per_ip.allows(ip, now) or not self.per_target.allows(target, now):
+                return 'rate_limited'
+            # Only accepted submissions count, so a refused one costs the visitor nothing
+            self.per_ip.record(ip, now)
+            self.per_target.record(target, now)
+            self._seen.pop((target, digest), None)
+            self._seen[(target, digest)] = now
+            while len(self._seen) > self.max_duplicates:
+                self._seen.popitem(last=False)
+        return None
+
+    def clear(self):
+        with self._lock:
+            self.per_ip._events.clear()
+            self.per_target._events.clear()
+            self._seen.clear()
@@ -0,0 +1,53 @@
+from app import db, Comment, Contact, Counter, Post, Tag
+
+
+def test_admin_pages_do_not_count_rows(admin_client, seeded, count_queries):
+    admin_client.get('/admin')
+    for url in ('/admin', '/admin/posts', '/admin/comments', '/admin/contacts'):
+        with count_queries() as counter:
+            assert admin_client.get(url).status_code == 200
+        assert not [statement for statement in counter.statements if 'count(' in statement.lower()], url
+
+
+def test_pending_counter_follows_comment_moderation(app, admin_client, seeded):
+    reader = app.test_client()
+    reader.post('/post/post-1', data={'name': 'Reader', 'email': 'r@example.com', 'content': 'Hi'})
+    comment_id = Comment.query.one().id
+
+    admin_client.get('/admin')
+    counters = dict(db.session.query(Counter.name, Counter.value).all())
+    assert counters['pending_comments'] == 1
+
+    reader.post('/post/post-2', data={'name': 'Other', 'email': 'o@example.com', 'content': 'Hello'})
+    admin_client.post(f'/admin/comments/{comment_id}/approve')
+    counters = dict(db.session.query(Counter.name, Counter.value).all())
+    assert counters['pending_comments'] == 1
+
+    other_id = Comment.query.filter_by(approved=False).one().id
+    admin_client.post(f'/admin/comments/{other_id}/delete')
+    admin_client.post(f'/admin/comments/{comment_id}/delete')
+    counters = dict(db.session.query(Counter.name, Counter.value).all())
+    assert counters['pending_comments'] == 0
+
+
+def test_counters_match_real_counts(admin_client, seeded):
+    admin_client.get('/admin')
+    post = Post.query.filter_by(slug='post-1').first()
+    post.published = False
+    db.session.add(Tag(name='fresh', slug='fresh'))
+    db.session.add(Contact(name='V', email='v@example.com', subject='S', message='M'))
+    db.session.delete(Post.query.filter_by(slug='post-2').first())
+    db.session.commit()
+
+    counters = dict(db.session.query(Counter.name, Counter.value).all())
+    assert counters['posts'] == Post.query.count()
+    assert counters['published_posts'] == Post.query.filter_by(published=True).count()
+    assert counters['tags'] == Tag.query.count()
+    assert counters['unread_contacts'] == Contact.query.filter_by(read=False).count()
+
+
+def test_missing_counters_are_rebuilt(admin_client, seeded):
+    db.session.query(Counter).delete()
+    db.session.commit()
+    assert admin_client.get('/admin').status_code == 200
+    assert db.session.get(Counter, 'posts').value == 10
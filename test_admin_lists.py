@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+
+from app import db, ADMIN_PER_PAGE, Comment, Contact, Counter, Post
+
+
+def _counter(name):
+    return db.session.get(Counter, name).value
+
+
+def _add_comments(post_id, count, approved=False, start=datetime(2024, 1, 1)):
+    db.session.add_all([Comment(name=f'Reader {i}', email='r@example.com', content=f'Comment {i}', post_id=post_id,
+                                approved=approved, created_at=start + timedelta(hours=i)) for i in range(count)])
+    db.session.commit()
+
+
+def _comment_ids(**filters):
+    return [row.id for row in Comment.query.filter_by(**filters).order_by(Comment.id)]
+
+
+def _listed(body):
+    return body.count('name="ids"')
+
+
+def _next_cursor(body):
+    return body.split(' rel="next"', 1)[0].rsplit('cursor=', 1)[1].split('"', 1)[0]
+
+
+def test_comment_list_pages_by_cursor(admin_client, seeded):
+    _add_comments(Post.query.filter_by(slug='post-1').one().id, ADMIN_PER_PAGE + 5)
+    body = admin_client.get('/admin/comments').get_data(as_text=True)
+    assert _listed(body) == ADMIN_PER_PAGE
+    assert f'Comment {ADMIN_PER_PAGE + 4}<' in body and 'Comment 4<' not in body
+
+    body = admin_client.get(f'/admin/comments?cursor={_next_cursor(body)}').get_data(as_text=True)
+    assert _listed(body) == 5
+    assert 'Comment 4<' in body and 'Comment 0<' in body and 'rel="next"' not in body
+
+
+def test_filters_narrow_the_lists(admin_client, seeded):
+    first, second = (Post.query.filter_by(slug=slug).one().id for slug in ('post-1', 'post-2'))
+    _add_comments(first, 3)
+    _add_comments(second, 2, approved=True, start=datetime(2024, 3, 1))
+
+    assert _listed(admin_client.get(f'/admin/comments?post={second}').get_data(as_text=True)) == 2
+    assert _listed(admin_client.get('/admin/comments?status=pending').get_data(as_text=True)) == 3
+    body = admin_client.get('/admin/comments?date_from=2024-03-01&date_to=2024-03-01').get_data(as_text=True)
+    assert _listed(body) == 2
+    # Malformed filters are ignored rather than failing the page
+    assert _listed(admin_client.get('/admin/comments?date_from=yesterday&post=x').get_data(as_text=True)) == 5
+
+    assert 'No posts yet' in admin_client.get('/admin/posts?status=draft').get_data(as_text=True)
+    category_id = Post.query.filter_by(slug='post-0').one().category_id
+    body = admin_client.get(f'/admin/posts?category={category_id}').get_data(as_text=True)
+    assert body.count('title="Edit Post"') == 2 * 4  # mobile cards and desktop rows
+
+
+def test_bulk_approve_keeps_counts_in_step(admin_client, seeded, count_queries):
+    post_id = Post.query.filter_by(slug='post-1').one().id
+    updated_at = Post.query.filter_by(slug='post-1').one().updated_at
+    admin_client.get('/admin')  # seeds the counters
+    _add_comments(post_id, 5)
+    ids = _comment_ids()[:3]
+    assert _counter('pending_comments') == 5
+
+    with count_queries() as queries:
+        response = admin_client.post('/admin/comments/bulk', data={'action': 'approve', 'ids': ids,
+                                                                   'next': '/admin/comments?status=pending'})
+    assert response.status_code == 302 and response.headers['Location'].endswith('/admin/comments?status=pending')
+    assert sum(1 for statement in queries.statements if statement.startswith('UPDATE comment')) == 1
+
+    post = Post.query.filter_by(slug='post-1').one()
+    assert post.approved_comment_count == 3 and post.updated_at == updated_at
+    assert _counter('pending_comments') == 2
+    # Approving again changes nothing
+    admin_client.post('/admin/comments/bulk', data={'action': 'approve', 'ids': ids})
+    assert Post.query.filter_by(slug='post-1').one().approved_comment_count == 3
+
+
+def test_bulk_delete_comments(admin_client, seeded):
+    post_id = Post.query.filter_by(slug='post-1').one().id
+    admin_client.get('/admin')
+    _add_comments(post_id, 2, approved=True)
+    _add_comments(post_id, 2)
+    ids = [_comment_ids(approved=True)[0], _comment_ids(approved=False)[0]]
+    admin_client.post('/admin/comments/bulk', data={'action': 'delete', 'ids': ids})
+    assert Comment.query.count() == 2
+    assert Post.query.filter_by(slug='post-1').one().approved_comment_count == 1
+    assert _counter('pending_comments') == 1
+
+
+def test_bulk_contact_actions(admin_client, app):
+    admin_client.get('/admin')
+    db.session.add_all([Contact(name='A', email='a@example.com', subject=f'S{i}', message='Hi') for i in range(4)])
+    db.session.commit()
+    ids = [row.id for row in Contact.query.order_by(Contact.id)]
+    assert _counter('unread_contacts') == 4
+
+    admin_client.post('/admin/contacts/bulk', data={'action': 'mark_read', 'ids': ids[:2]})
+    assert _counter('unread_contacts') == 2
+    admin_client.post('/admin/contacts/bulk', data={'action': 'delete', 'ids': ids[1:3]})
+    assert Contact.query.count() == 2
+    assert _counter('unread_contacts') == 1
+    # Off-site redirects are refused
+    response = admin_client.post('/admin/contacts/bulk', data={'action': 'delete', 'ids': ids, 'next': '//evil.example'})
+    assert response.headers['Location'].endswith('/admin/contacts')
@@ -0,0 +1,79 @@
+import gzip
+import json
+
+from flask import url_for
+
+import app as app_module
+from assets import AssetManifest, build, fingerprint
+
+
+def _static(tmp_path):
+    (tmp_path / 'css').mkdir()
+    (tmp_path / 'css' / 'style.css').write_text('body { color: #111; }\n' * 50)
+    (tmp_path / 'uploads').mkdir()
+    (tmp_path / 'uploads' / 'photo.jpg').write_bytes(b'jpeg')
+    return tmp_path
+
+
+def test_url_for_static_emits_fingerprinted_names(app):
+    with app.test_request_context():
+        url = url_for('static', filename='css/style.css')
+        assert url.startswith('/static/css/style.') and url != '/static/css/style.css'
+        assert url_for('static', filename='uploads/ab/cd/file.jpg') == '/static/uploads/ab/cd/file.jpg'
+
+
+def test_fingerprinted_urls_are_served_as_immutable(app, client):
+    with app.test_request_context():
+        url = url_for('static', filename='css/style.css')
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.cache_control.immutable
+    assert response.cache_control.max_age == 365 * 24 * 3600
+    assert b'.prose' in response.data
+
+    plain = client.get('/static/css/style.css')
+    assert plain.status_code == 200
+    assert not plain.cache_control.immutable
+
+
+def test_fingerprints_change_with_content():
+    assert fingerprint('js/main.js', b'a') != fingerprint('js/main.js', b'b')
+    assert fingerprint('js/main.js', b'a').startswith('js/main.')
+
+
+def test_build_writes_copies_compressed_siblings_and_manifest(tmp_path):
+    static = _static(tmp_path)
+    assets = build(str(static))
+    hashed = assets['css/style.css']
+    assert 'uploads/photo.jpg' not in assets
+    assert (static / hashed).read_bytes() == (static / 'css' / 'style.css').read_bytes()
+    assert gzip.decompress((static / (hashed + '.gz')).read_bytes()) == (static / hashed).read_bytes()
+    assert json.loads((static / 'manifest.json').read_text()) == assets
+
+    # A rebuild neither fingerprints its own output nor changes the manifest
+    assert build(str(static)) == assets
+    manifest = AssetManifest(str(static))
+    assert manifest.url_path('css/style.css') == hashed
+    assert manifest.original(hashed) == 'css/style.css'
+    assert manifest.url_path('css/other.css') == 'css/other.css'
+
+
+def test_manifest_hashes_files_when_no_build_exists(tmp_path):
+    static = _static(tmp_path)
+    manifest = AssetManifest(str(static))
+    assert manifest.url_path('css/style.css') == fingerprint('css/style.css', (static / 'css' / 'style.css').read_bytes())
+    assert not (static / 'manifest.json').exists()
+
+
+def test_built_gzip_siblings_are_served_precompressed(app, client, tmp_path, monkeypatch):
+    static = _static(tmp_path)
+    hashed = build(str(static))['css/style.css']
+    monkeypatch.setattr(app, 'static_folder', str(static))
+    monkeypatch.setattr(app_module, 'static_assets', AssetManifest(str(static)))
+
+    response = client.get('/static/' + hashed, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.mimetype == 'text/css'
+    assert gzip.decompress(response.data) == (static / hashed).read_bytes()
+    response.close()
+    assert 'Content-Encoding' not in client.get('/static/' + hashed).headers
@@ -0,0 +1,50 @@
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture
+def run_script(tmp_path):
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{tmp_path / "load.db"}', SITEMAP_DIR=str(tmp_path / 'sitemaps'),
+               METRICS_DIR=str(tmp_path / 'metrics'), SUBMISSION_QUEUE_DIR=str(tmp_path / 'submissions'))
+
+    def run(script, *args):
+        return subprocess.run([sys.executable, script, *args], cwd=ROOT, env=env, capture_output=True, text=True, timeout=300)
+    return run
+
+
+def test_generated_data_is_consistent_and_replayed(run_script, tmp_path):
+    generated = run_script('generate_data.py', '--posts', '120', '--comments', '900', '--tags', '30', '--categories', '8', '--contacts', '20')
+    assert generated.returncode == 0, generated.stderr
+
+    connection = sqlite3.connect(tmp_path / 'load.db')
+    (comments,), = connection.execute('SELECT count(*) FROM comment')
+    mismatched = connection.execute('SELECT count(*) FROM post WHERE approved_comment_count != '
+                                    '(SELECT count(*) FROM comment WHERE post_id = post.id AND approved)').fetchone()[0]
+    (indexed,), = connection.execute('SELECT count(*) FROM post_fts')
+    (published,), = connection.execute('SELECT count(*) FROM post WHERE published')
+    counters = dict(connection.execute('SELECT name, value FROM counter'))
+    connection.close()
+    assert comments == 900 and mismatched == 0 and indexed == published
+    assert counters['posts'] == 120 and counters['tags'] == 30
+
+    baseline = tmp_path / 'baseline.json'
+    recorded = run_script('benchmark.py', '--requests', '80', '--warmup', '5', '--baseline', str(baseline), '--save-baseline')
+    assert recorded.returncode == 0, recorded.stderr
+    report = json.loads(baseline.read_text())
+    assert set(report['routes']) >= {'index', 'post_detail', 'search', 'tag_posts', 'admin_comments'}
+    assert all(route['errors'] == 0 and route['queries'] > 0 for route in report['routes'].values())
+    assert report['throughput'] > 0 and report['dataset']['posts'] == 120
+
+    # A baseline that issued fewer queries makes the run fail
+    report['routes']['post_detail']['queries'] -= 2
+    baseline.write_text(json.dumps(report))
+    compared = run_script('benchmark.py', '--requests', '80', '--warmup', '5', '--baseline', str(baseline), '--tolerance', '1000')
+    assert compared.returncode == 1
+    assert 'post_detail' in compared.stdout and 'queries per request' in compared.stdout
@@ -0,0 +1,87 @@
+from app import db, Setting, CacheVersion
+
+
+def test_setting_get_returns_default_for_missing_key(app):
+    assert Setting.get('site_name', 'ModernBlog') == 'ModernBlog'
+    assert Setting.get('logo') == ''
+
+
+def test_warm_setting_reads_hit_the_database_zero_times(app, count_queries):
+    Setting.set('site_name', 'Cached Blog')
+    Setting.get('site_name')
+
+    with count_queries() as counter:
+        for _ in range(20):
+            assert Setting.get('site_name') == 'Cached Blog'
+            Setting.get('tracking_code')
+    assert counter.count == 0
+
+
+def test_setting_set_invalidates_local_cache(app):
+    Setting.set('ads_header', 'old')
+    assert Setting.get('ads_header') == 'old'
+    Setting.set('ads_header', 'new')
+    assert Setting.get('ads_header') == 'new'
+
+
+def test_stamp_change_from_another_worker_is_picked_up(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'CACHE_VERSION_CHECK_INTERVAL', 0)
+    Setting.set('site_name', 'Before')
+    assert Setting.get('site_name') == 'Before'
+
+    # Simulate another worker: write directly and bump the stamp without touching our local cache
+    db.session.query(Setting).filter_by(key='site_name').update({'value': 'After'})
+    CacheVersion.bump('settings')
+    db.session.commit()
+
+    assert Setting.get('site_name') == 'After'
+
+
+def test_admin_settings_saves_in_one_invalidation(admin_client, app):
+    stamp_before = CacheVersion.current('settings')
+    response = admin_client.post('/admin/settings', data={'site_name': 'Saved', 'ads_footer': '<ad>'})
+    assert response.status_code == 302
+    assert CacheVersion.current('settings') != stamp_before
+    assert Setting.get('site_name') == 'Saved'
+    assert Setting.get('ads_footer') == '<ad>'
+
+
+def test_post_html_is_rendered_on_save_and_reused(app, monkeypatch):
+    import app as app_module
+    from app import Post
+
+    post = Post(title='Code', slug='code', content='```python\nprint(1)\n```', published=True)
+    db.session.add(post)
+    db.session.commit()
+    assert 'codehilite' in post.content_html
+    assert post.content_hash
+
+    calls = []
+    monkeypatch.setattr(app_module, 'render_markdown', lambda text: calls.append(text) or '<p>x</p>')
+    post.excerpt = 'Only the excerpt changed'
+    db.session.commit()
+    assert post.html_content.count('codehilite') == 1
+    assert calls == []
+
+    post.content = 'New body'
+    db.session.commit()
+    assert calls == ['New body']
+    assert post.html_content == '<p>x</p>'
+
+
+def test_backfill_renders_rows_without_touching_updated_at(app):
+    from app import Post
+    from backfill_html import backfill
+
+    post = Post(title='Old', slug='old', content='**bold**', published=True)
+    db.session.add(post)
+    db.session.commit()
+    db.session.query(Post).update({'content_html': None, 'content_hash': None}, synchronize_session=False)
+    db.session.commit()
+    updated_at = db.session.query(Post.updated_at).scalar()
+
+    assert backfill(Post) == 1
+    assert backfill(Post) == 0
+    row = db.session.query(Post.content_html, Post.updated_at).one()
+    assert row.content_html == '<p><strong>bold</strong></p>'
+    assert row.updated_at == updated_at
@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+
+from app import db, Comment, Post, rebuild_comment_counts
+
+
+def _add_comments(post_id, count, approved=True):
+    start = datetime(2024, 1, 1)
+    db.session.add_all([Comment(name=f'Reader {i}', email='r@example.com', content=f'Comment {i}', post_id=post_id,
+                                approved=approved, created_at=start + timedelta(minutes=i)) for i in range(count)])
+    db.session.commit()
+
+
+def _post(slug='post-1'):
+    return Post.query.filter_by(slug=slug).one()
+
+
+def test_approved_count_follows_moderation_without_touching_updated_at(seeded):
+    post = _post()
+    post_id, updated_at = post.id, post.updated_at
+    _add_comments(post_id, 3, approved=False)
+    assert _post().approved_comment_count == 0
+
+    comments = Comment.query.filter_by(post_id=post_id).order_by(Comment.id).all()
+    comments[0].approved = comments[1].approved = True
+    db.session.commit()
+    assert _post().approved_comment_count == 2
+
+    db.session.delete(Comment.query.filter_by(post_id=post_id, approved=True).first())
+    db.session.commit()
+    post = _post()
+    assert post.approved_comment_count == 1
+    assert post.updated_at == updated_at
+    assert post.comments_changed_at is not None
+
+
+def test_rebuild_recounts_every_post(seeded):
+    post_id = _post().id
+    _add_comments(post_id, 4)
+    Post.query.update({'approved_comment_count': 0, 'comments_changed_at': None}, synchronize_session=False)
+    db.session.commit()
+    rebuild_comment_counts(db.session.connection())
+    db.session.commit()
+    post = _post()
+    assert post.approved_comment_count == 4
+    assert post.comments_changed_at == datetime(2024, 1, 1, 0, 3)
+
+
+def test_long_threads_render_one_page_and_load_the_rest(client, seeded):
+    _add_comments(_post().id, 45)
+    body = client.get('/post/post-1').get_data(as_text=True)
+    assert 'Comments (45)' in body
+    assert 'Comment 44' in body and 'Comment 25' in body and 'Comment 24' not in body
+    cursor = body.split('data-cursor="', 1)[1].split('"', 1)[0]
+
+    page = client.get(f'/post/post-1/comments?cursor={cursor}').get_json()
+    assert [c['content'] for c in page['comments']] == [f'Comment {i}' for i in range(24, 4, -1)]
+    last = client.get(f'/post/post-1/comments?cursor={page["next_cursor"]}').get_json()
+    assert [c['content'] for c in last['comments']] == [f'Comment {i}' for i in range(4, -1, -1)]
+    assert last['next_cursor'] is None
+    assert client.get('/post/post-1/comments?cursor=garbage').status_code == 404
+
+
+def test_post_page_cost_does_not_grow_with_comments(client, seeded, count_queries):
+    _add_comments(_post('post-1').id, 5)
+    _add_comments(_post('post-2').id, 300)
+    client.get('/post/post-3')  # warm the site chrome
+    with count_queries() as small:
+        client.get('/post/post-1')
+    with count_queries() as large:
+        client.get('/post/post-2')
+    assert small.count == large.count
+
+
+def test_approving_a_comment_changes_the_comments_endpoint_validator(client, seeded):
+    _add_comments(_post().id, 1, approved=False)
+    etag = client.get('/post/post-1/comments').headers['ETag']
+    Comment.query.one().approved = True
+    db.session.commit()
+    response = client.get('/post/post-1/comments', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()['comments'][0]['name'] == 'Reader 0'
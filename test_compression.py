@@ -0,0 +1,79 @@
+import gzip
+
+import pytest
+
+import app as app_module
+from compression import minify_html
+from page_cache import MemoryPageCache
+
+GZIP = {'Accept-Encoding': 'gzip'}
+
+
+@pytest.fixture
+def page_cache(app, monkeypatch):
+    cache = MemoryPageCache(max_entries=50)
+    monkeypatch.setattr(app_module, 'page_cache', cache)
+    monkeypatch.setitem(app_module._page_cache_sync, 'last_id', None)
+    monkeypatch.setitem(app_module._page_cache_sync, 'checked_at', None)
+    return cache
+
+
+def test_minify_collapses_whitespace_but_keeps_significant_blocks():
+    html = ('<div>\n    <!-- note -->\n    <a>one</a>   <a>two</a>\n</div>\n'
+            '<pre>  keep\n    this  </pre>\n<textarea>\n  as is</textarea>\n'
+            '<style>\n    /* theme */\n    body { color: red; }\n</style>\n'
+            '<script>\n    let a = 1;\n\n    let b = `\n  raw`;\n</script>')
+    minified = minify_html(html)
+    assert minified.startswith('<div>\n<a>one</a> <a>two</a>\n</div>')
+    assert '<!--' not in minified
+    assert '<pre>  keep\n    this  </pre>' in minified
+    assert '<textarea>\n  as is</textarea>' in minified
+    assert '<style>\nbody { color: red; }\n</style>' in minified
+    assert '    let b = `\n  raw`;' in minified
+
+
+def test_minify_leaves_attributes_and_inline_code_alone():
+    html = '<p title="two  spaces" data-x="a\n   b">text   here <code>x  =  1</code></p>'
+    assert minify_html(html) == '<p title="two  spaces" data-x="a\n   b">text here <code>x  =  1</code></p>'
+
+
+def test_pages_are_gzipped_for_clients_that_accept_it(client, seeded):
+    plain = client.get('/post/post-1')
+    compressed = client.get('/post/post-1', headers=GZIP)
+    assert 'Content-Encoding' not in plain.headers
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert gzip.decompress(compressed.data) == plain.data
+    assert len(compressed.data) < len(plain.data)
+    assert '\n    ' not in plain.get_data(as_text=True).split('<script', 1)[0]
+
+
+def test_small_responses_are_left_uncompressed(app, client, seeded, monkeypatch):
+    monkeypatch.setitem(app.config, 'COMPRESS_MIN_SIZE', 10 ** 7)
+    assert 'Content-Encoding' not in client.get('/', headers=GZIP).headers
+
+
+def test_each_encoding_has_its_own_etag(client, seeded):
+    plain = client.get('/post/post-1')
+    compressed = client.get('/post/post-1', headers=GZIP)
+    assert plain.headers['ETag'] != compressed.headers['ETag']
+    revalidated = client.get('/post/post-1', headers={**GZIP, 'If-None-Match': compressed.headers['ETag']})
+    assert revalidated.status_code == 304
+
+
+def test_cached_pages_are_compressed_once(client, seeded, page_cache, monkeypatch):
+    calls = []
+    compress = app_module.compress
+    monkeypatch.setattr(app_module, 'compress', lambda data, encoding: calls.append(encoding) or compress(data, encoding))
+
+    first = client.get('/', headers=GZIP)
+    second = client.get('/', headers=GZIP)
+    assert (first.headers['X-Page-Cache'], second.headers['X-Page-Cache']) == ('MISS', 'HIT')
+    assert second.headers['Content-Encoding'] == 'gzip'
+    assert second.data == first.data
+    assert calls == ['gzip']
+
+    # Clients without gzip get their own entry rather than a body they cannot decode
+    plain = client.get('/')
+    assert plain.headers['X-Page-Cache'] == 'MISS'
+    assert 'Content-Encoding' not in plain.headers
@@ -0,0 +1,99 @@
+import pytest
+
+import app as app_module
+from app import db, CacheVersion, Post, Comment, Setting
+from page_cache import MemoryPageCache
+
+
+@pytest.mark.parametrize('url', ['/', '/post/post-1', '/category/category-1', '/tag/tag0',
+                                 '/categories', '/page/about', '/sitemap.xml'])
+def test_matching_etag_returns_304_without_rendering(client, seeded, url, monkeypatch):
+    response = client.get(url)
+    etag = response.headers['ETag']
+    assert response.headers['Last-Modified']
+
+    def fail(*args, **kwargs):
+        raise AssertionError('template rendered for a conditional hit')
+    monkeypatch.setattr(app_module, 'render_template', fail)
+
+    response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.get_data() == b''
+
+
+def test_if_modified_since_is_honoured(client, seeded):
+    last_modified = client.get('/post/post-1').headers['Last-Modified']
+    assert client.get('/post/post-1', headers={'If-Modified-Since': last_modified}).status_code == 304
+    assert client.get('/post/post-1', headers={'If-Modified-Since': 'Mon, 01 Jan 2001 00:00:00 GMT'}).status_code == 200
+
+
+def test_pending_flashes_are_never_answered_with_304(client, seeded):
+    etag = client.get('/post/post-1').headers['ETag']
+    with client.session_transaction() as session:
+        session['_flashes'] = [('success', 'Thanks for your comment')]
+    response = client.get('/post/post-1', headers={'If-None-Match': etag})
+    assert response.status_code == 200 and b'Thanks for your comment' in response.data
+    assert client.get('/post/post-1', headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_post_edit_changes_the_validator(client, seeded):
+    etag = client.get('/post/post-1').headers['ETag']
+    post = Post.query.filter_by(slug='post-1').first()
+    post.content = 'Rewritten'
+    db.session.commit()
+    assert client.get('/post/post-1', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_comment_approval_changes_the_validator(client, seeded):
+    post = Post.query.filter_by(slug='post-1').first()
+    comment = Comment(name='Reader', email='r@example.com', content='Hi', post_id=post.id)
+    db.session.add(comment)
+    db.session.commit()
+    comment_id = comment.id
+    etag = client.get('/post/post-1').headers['ETag']
+    assert client.get('/post/post-1', headers={'If-None-Match': etag}).status_code == 304
+
+    db.session.get(Comment, comment_id).approved = True
+    db.session.commit()
+    assert client.get('/post/post-1', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_settings_change_the_validator(client, seeded):
+    etag = client.get('/page/about').headers['ETag']
+    Setting.set('ads_footer', '<new-ad>')
+    assert client.get('/page/about', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_cached_pages_answer_conditional_requests(client, seeded, monkeypatch):
+    monkeypatch.setattr(app_module, 'page_cache', MemoryPageCache())
+    etag = client.get('/post/post-1').headers['ETag']
+    response = client.get('/post/post-1', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['X-Page-Cache'] == 'HIT'
+
+
+def test_listing_validator_is_a_stamp_moved_by_published_posts(client, seeded, count_queries):
+    etag = client.get('/').headers['ETag']
+    with count_queries() as counter:
+        assert client.get('/', headers={'If-None-Match': etag}).status_code == 304
+    assert not any('max(post.updated_at)' in statement for statement in counter.statements)
+
+    # Drafts do not show in listings
+    db.session.add(Post(title='Draft', slug='draft', content='Soon', published=False))
+    db.session.commit()
+    assert client.get('/', headers={'If-None-Match': etag}).status_code == 304
+
+    post = Post.query.filter_by(slug='draft').first()
+    post.published = True
+    db.session.commit()
+    assert client.get('/', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_listings_without_a_stamp_are_served_without_writing(client, seeded, count_queries):
+    CacheVersion.query.filter_by(name=app_module.LISTINGS_VERSION).delete()
+    db.session.commit()
+    with count_queries() as counter:
+        etag = client.get('/').headers['ETag']
+        assert client.get('/', headers={'If-None-Match': etag}).status_code == 304
+    assert all(statement.lstrip().upper().startswith('SELECT') for statement in counter.statements)
+    assert db.session.get(CacheVersion, app_module.LISTINGS_VERSION) is None
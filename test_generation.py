@@ -0,0 +1,246 @@
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as app_module
+from app import db, generation_usage, GenerationCacheEntry, GenerationCall, GenerationJob, Setting
+from generation import FakeBackend, GeminiBackend, GenerationError, build_prompts, generate_draft, stream_draft
+
+
+def _generate(client, topic='Flask caching'):
+    response = client.post('/admin/generate-blog', json={'topic': topic})
+    assert response.status_code == 202
+    return response.get_json()
+
+
+def test_draft_is_generated_by_a_job(admin_client):
+    job = _generate(admin_client)
+    data = admin_client.get(job['status_url']).get_json()
+    assert data['status'] == 'done'
+    assert data['title'] == 'A Guide to Flask caching'
+    assert data['excerpt'] == 'Everything you need to know about Flask caching.'
+    assert data['content'].startswith('## Flask caching')
+
+
+def test_request_returns_before_the_model_answers(admin_client, monkeypatch):
+    backend = FakeBackend(delay=0.3)
+    monkeypatch.setattr(app_module, 'generation_backend', lambda: backend)
+    monkeypatch.setattr(app_module, 'generation_executor', ThreadPoolExecutor(1))
+    monkeypatch.setattr(app_module, 'generation_call_executor', ThreadPoolExecutor(3))
+
+    started = time.monotonic()
+    job = _generate(admin_client)
+    assert time.monotonic() - started < 0.2
+    status = admin_client.get(job['status_url']).get_json()['status']
+    assert status in ('pending', 'running')
+    while status not in ('done', 'failed'):
+        time.sleep(0.05)
+        status = admin_client.get(job['status_url']).get_json()['status']
+    assert status == 'done'
+    # The three calls overlapped rather than running back to back
+    assert time.monotonic() - started < 0.8
+    assert len(backend.prompts) == 3
+
+
+def test_parts_are_requested_concurrently_and_time_out():
+    with ThreadPoolExecutor(3) as executor:
+        started = time.monotonic()
+        draft = generate_draft(FakeBackend(delay=0.2), 'SQL', executor)
+        assert time.monotonic() - started < 0.5
+        assert draft['title'] == 'A Guide to SQL'
+        with pytest.raises(GenerationError):
+            generate_draft(FakeBackend(delay=0.5), 'SQL', executor, timeout=0.1)
+
+
+def test_a_stalled_stream_fails_at_the_deadline():
+    resume = threading.Event()
+
+    class Stalled(FakeBackend):
+        def stream(self, prompt):
+            yield 'Partial '
+            resume.wait(5)
+            yield 'late'
+
+    with ThreadPoolExecutor(3) as executor:
+        started = time.monotonic()
+        events = []
+        with pytest.raises(GenerationError):
+            for event in stream_draft(Stalled(), 'SQL', executor, timeout=0.3):
+                events.append(event)
+        assert time.monotonic() - started < 1
+        assert ('content', 'Partial ') in events
+        resume.set()
+
+
+def test_failures_are_reported_on_the_job(admin_client, monkeypatch):
+    class Broken:
+        def generate(self, prompt):
+            raise RuntimeError('quota exceeded')
+
+    monkeypatch.setattr(app_module, 'generation_backend', lambda: Broken())
+    data = admin_client.get(_generate(admin_client)['status_url']).get_json()
+    assert data['status'] == 'failed'
+    assert 'quota exceeded' in data['error']
+
+
+def test_interrupted_jobs_are_reported_as_failed(admin_client):
+    job = GenerationJob(topic='Lost', status='running', created_at=datetime.utcnow() - timedelta(hours=1))
+    db.session.add(job)
+    db.session.commit()
+    job_id = job.id
+    data = admin_client.get(f'/admin/generate-blog/{job_id}').get_json()
+    assert data['status'] == 'failed'
+
+
+def test_gemini_needs_an_api_key(admin_client, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'GENERATION_BACKEND', 'gemini')
+    response = admin_client.post('/admin/generate-blog', json={'topic': 'Flask'})
+    assert response.status_code == 400
+    assert admin_client.post('/admin/generate-blog', json={}).status_code == 400
+
+
+def test_gemini_backend_is_configured_once_per_key(app, monkeypatch):
+    class FakeGenai:
+        def __init__(self):
+            self.configured = []
+
+        def configure(self, api_key):
+            self.configured.append(api_key)
+
+        def GenerativeModel(self, name):
+            return object()
+
+    genai = FakeGenai()
+    monkeypatch.setattr(GeminiBackend, '_configured_key', None)
+    monkeypatch.setitem(app_module.app.config, 'GENERATION_BACKEND', 'gemini')
+    monkeypatch.setattr(app_module, 'genai', genai)
+    monkeypatch.setattr(app_module, '_generation_backends', {})
+    Setting.set('gemini_api_key', 'key-1')
+    first = app_module.generation_backend()
+    assert app_module.generation_backend() is first
+    Setting.set('gemini_api_key', 'key-2')
+    assert app_module.generation_backend() is not first
+    assert genai.configured == ['key-1', 'key-2']
+
+
+def _events(body):
+    events = []
+    for block in body.strip().split('\n\n'):
+        event, data = block.split('\n', 1)
+        events.append((event[len('event: '):], json.loads(data[len('data: '):])))
+    return events
+
+
+def test_stream_relays_the_draft_as_it_is_written(admin_client):
+    response = admin_client.get('/admin/generate-blog/stream?topic=Flask caching', buffered=True)
+    assert response.mimetype == 'text/event-stream'
+    assert 'Content-Encoding' not in response.headers
+    events = _events(response.get_data(as_text=True))
+    assert events[0] == ('start', {'topic': 'Flask caching'})
+    assert events[-1] == ('done', {})
+    values = dict(events)
+    assert values['title'] == 'A Guide to Flask caching'
+    assert values['excerpt'] == 'Everything you need to know about Flask caching.'
+    chunks = [data for event, data in events if event == 'content']
+    assert len(chunks) > 5
+    assert ''.join(chunks).strip() == FakeBackend().generate(build_prompts('Flask caching')['content'])
+    previews = [data for event, data in events if event == 'preview']
+    assert len(previews) > 1 and '<h2>Conclusion</h2>' in previews[-1]
+
+
+def test_stream_starts_at_once_and_stops_when_the_client_leaves(admin_client, monkeypatch):
+    backend = FakeBackend(chunk_delay=0.05)
+    monkeypatch.setattr(app_module, 'generation_backend', lambda: backend)
+    started = time.monotonic()
+    response = admin_client.get('/admin/generate-blog/stream?topic=SQL', buffered=False)
+    body = iter(response.response)
+    assert b'event: start' in next(body)
+    assert time.monotonic() - started < 0.5
+    next(body), next(body), next(body)
+    response.close()
+    streamed = backend.streamed
+    time.sleep(0.2)
+    assert backend.streamed == streamed < 10
+
+
+def test_stream_reports_model_errors(admin_client, monkeypatch):
+    class Broken(FakeBackend):
+        def stream(self, prompt):
+            yield 'Partial '
+            raise RuntimeError('connection reset')
+
+    monkeypatch.setattr(app_module, 'generation_backend', lambda: Broken())
+    events = _events(admin_client.get('/admin/generate-blog/stream?topic=SQL', buffered=True).get_data(as_text=True))
+    assert events[-1][0] == 'error' and 'connection reset' in events[-1][1]['error']
+    assert admin_client.get('/admin/generate-blog/stream').status_code == 400
+
+
+def _model():
+    return app_module.generation_backend().backend
+
+
+def test_repeat_topics_are_served_from_the_cache(admin_client):
+    _generate(admin_client, 'Flask caching')
+    assert len(_model().prompts) == 3
+    data = admin_client.get(_generate(admin_client, '  flask   CACHING ')['status_url']).get_json()
+    assert len(_model().prompts) == 3
+    assert data['title'] == 'A Guide to Flask caching'
+
+    statuses = sorted(status for (status,) in db.session.query(GenerationCall.status))
+    assert statuses == ['cached'] * 3 + ['ok'] * 3
+    usage = generation_usage()
+    assert usage['content']['calls'] == 2 and usage['content']['cached'] == 1
+    assert usage['title']['prompt_tokens'] > 0 and usage['title']['response_tokens'] > 0
+
+
+def test_cache_entries_expire_and_are_evicted(admin_client, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'GENERATION_CACHE_MAX_ENTRIES', 4)
+    _generate(admin_client, 'One')
+    _generate(admin_client, 'Two')
+    assert GenerationCacheEntry.query.count() == 4
+
+    GenerationCacheEntry.query.update({'created_at': datetime.utcnow() - timedelta(days=30)})
+    db.session.commit()
+    _generate(admin_client, 'Two')
+    assert len(_model().prompts) == 9
+
+
+def test_streams_are_cached_and_accounted(admin_client):
+    first = admin_client.get('/admin/generate-blog/stream?topic=SQL', buffered=True).get_data(as_text=True)
+    second = admin_client.get('/admin/generate-blog/stream?topic=sql', buffered=True).get_data(as_text=True)
+    assert _model().streamed > 0 and len(_model().prompts) == 3
+    first, second = (''.join(data for event, data in _events(body) if event == 'content') for body in (first, second))
+    assert first.strip() == second.strip()
+
+    response = admin_client.get('/admin/generate-blog/stream?topic=Indexes', buffered=False)
+    body = iter(response.response)
+    assert b'event: content' in b''.join(next(body) for _ in range(5))
+    response.close()
+    assert GenerationCall.query.filter_by(status='cancelled', part='content').count() == 1
+    # Three parts for SQL; the title and excerpt about indexes, but not their unfinished body
+    assert GenerationCacheEntry.query.count() == 5
+
+
+def test_dashboard_reports_usage_without_counting_rows(admin_client, count_queries):
+    admin_client.get('/admin')
+    _generate(admin_client)
+    with count_queries() as counter:
+        body = admin_client.get('/admin').get_data(as_text=True)
+    assert 'AI Generation' in body
+    assert not [statement for statement in counter.statements if 'count(' in statement.lower()]
+
+
+def test_streams_past_the_limit_fall_back_to_jobs(admin_client, monkeypatch):
+    monkeypatch.setattr(app_module, 'generation_streams', threading.BoundedSemaphore(1))
+    response = admin_client.get('/admin/generate-blog/stream?topic=SQL', buffered=False)
+    assert b'event: start' in next(iter(response.response))
+    assert _events(admin_client.get('/admin/generate-blog/stream?topic=Indexes', buffered=True).get_data(as_text=True)) == [('busy', {})]
+
+    # Closing the stream, read to the end or not, frees its slot
+    response.close()
+    events = _events(admin_client.get('/admin/generate-blog/stream?topic=Indexes', buffered=True).get_data(as_text=True))
+    assert events[0][0] == 'start' and events[-1] == ('done', {})
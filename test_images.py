@@ -0,0 +1,124 @@
+import io
+import json
+import os
+
+import pytest
+from PIL import Image
+
+import app as app_module
+import gc_uploads
+from app import db, ImageAsset, Post, picture
+from storage import LocalStorage, content_key
+
+
+@pytest.fixture
+def uploads(app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    monkeypatch.setattr(app_module, 'upload_storage', LocalStorage(str(tmp_path)))
+    return tmp_path
+
+
+def _key(response):
+    return response.get_json()['url'].split('/static/uploads/', 1)[1]
+
+
+def _jpeg(width=2000, height=1200):
+    image = Image.new('RGB', (width, height), (40, 90, 200))
+    exif = Image.Exif()
+    exif[0x010F] = 'Camera Maker'
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', exif=exif)
+    buffer.seek(0)
+    return buffer
+
+
+def test_upload_renders_variants_and_strips_metadata(admin_client, uploads):
+    response = admin_client.post('/admin/upload', data={'file': (_jpeg(), 'photo.jpeg')})
+    filename = _key(response)
+
+    asset = ImageAsset.query.filter_by(filename=filename).one()
+    assert asset.status == 'ready'
+    assert (asset.width, asset.height) == (2000, 1200)
+    variants = asset.variant_map
+    assert variants['thumb']['width'] == 320
+    assert variants['card']['width'] == 640
+    assert variants['hero']['width'] == 1600
+    assert (variants['og']['width'], variants['og']['height']) == (1200, 630)
+    for name in ('thumb', 'card', 'hero'):
+        assert {'webp', 'jpeg'} <= set(variants[name]['files'])
+        for variant_file in variants[name]['files'].values():
+            assert os.path.exists(uploads / variant_file)
+    with Image.open(uploads / filename) as original:
+        assert not original.getexif()
+
+
+def test_small_images_are_not_upscaled(admin_client, uploads):
+    response = admin_client.post('/admin/upload', data={'file': (_jpeg(500, 300), 'small.jpg')})
+    filename = _key(response)
+    variants = ImageAsset.query.filter_by(filename=filename).one().variant_map
+    assert variants['card']['width'] == 500
+    assert variants['hero'] == variants['card']
+
+
+def test_non_images_are_rejected(admin_client, uploads):
+    response = admin_client.post('/admin/upload', data={'file': (io.BytesIO(b'<script>'), 'evil.png')})
+    assert response.status_code == 400
+    assert not os.listdir(uploads)
+
+
+def test_variants_are_rendered_off_the_request_thread(admin_client, uploads, monkeypatch):
+    jobs = []
+
+    class Executor:
+        def submit(self, fn, *args):
+            jobs.append((fn, args))
+
+    monkeypatch.setattr(app_module, 'image_executor', Executor())
+    filename = _key(admin_client.post('/admin/upload', data={'file': (_jpeg(), 'photo.jpg')}))
+    assert ImageAsset.query.filter_by(filename=filename).one().status == 'pending'
+
+    fn, args = jobs.pop()
+    fn(*args)
+    assert ImageAsset.query.filter_by(filename=filename).one().status == 'ready'
+
+
+def test_cards_use_picture_with_srcset(admin_client, seeded, uploads):
+    filename = _key(admin_client.post('/admin/upload', data={'file': (_jpeg(), 'photo.jpg')}))
+    post = Post.query.filter_by(slug='post-9').first()
+    post.cover_image = filename
+    db.session.commit()
+
+    body = admin_client.get('/').get_data(as_text=True)
+    assert '<picture><source type="image/' in body
+    assert '-thumb.webp 320w' in body
+    assert 'sizes="(min-width: 1024px) 33vw' in body
+    detail = admin_client.get('/post/post-9').get_data(as_text=True)
+    assert f'/static/uploads/{filename[:-4]}-og.jpg' in detail
+
+
+def test_unprocessed_images_fall_back_to_the_original(app):
+    with app.test_request_context():
+        html = str(picture('legacy.jpg', alt='Legacy'))
+    assert html.startswith('<img src="/static/uploads/legacy.jpg"')
+    assert 'alt="Legacy"' in html
+
+
+def test_stored_originals_match_their_content_keys(admin_client, uploads):
+    filename = _key(admin_client.post('/admin/upload', data={'file': (_jpeg(), 'photo.jpg')}))
+    data = (uploads / filename).read_bytes()
+    assert content_key(data, 'jpg') == filename
+    with Image.open(io.BytesIO(data)) as original:
+        assert not original.getexif()
+
+    # The same photo uploaded again lands on the same object
+    assert _key(admin_client.post('/admin/upload', data={'file': (_jpeg(), 'again.jpg')})) == filename
+
+
+def test_replaced_svg_logos_are_collected(admin_client, uploads):
+    svg = b'<svg xmlns="http://www.w3.org/2000/svg" width="10" height="10"/>'
+    admin_client.post('/admin/settings', data={'site_name': 'Blog', 'logo': (io.BytesIO(svg), 'logo.svg')})
+    key = content_key(svg, 'svg')
+    assert ImageAsset.query.filter_by(filename=key).one().status == 'ready'
+
+    admin_client.post('/admin/settings', data={'site_name': 'Blog', 'logo': (_jpeg(64, 64), 'logo.jpg')})
+    assert [asset.filename for asset in gc_uploads.unreferenced_assets(grace_hours=-1)] == [key]
@@ -0,0 +1,71 @@
+import re
+
+from flask import g
+
+import app as app_module
+from app import perf_registry, render_markdown
+from instrumentation import Histogram, RequestTiming
+
+
+def _timing(response):
+    return dict(re.findall(r'(\w+);dur=([\d.]+)', response.headers['Server-Timing']))
+
+
+def test_histogram_percentiles_are_bucket_bounds():
+    histogram = Histogram()
+    for value in [1.0] * 90 + [10.0] * 9 + [250.0]:
+        histogram.add(value)
+    assert 1.0 <= histogram.percentile(50) < 1.25
+    assert 10.0 <= histogram.percentile(95) < 12.5
+    assert histogram.percentile(99) < 12.5
+    assert histogram.percentile(100) == 250.0
+
+
+def test_admin_responses_carry_server_timing(admin_client, seeded, count_queries):
+    admin_client.get('/admin')
+    with count_queries() as counter:
+        response = admin_client.get('/admin/posts')
+    assert set(_timing(response)) == {'db', 'tpl', 'md', 'total'}
+    assert f'desc="{counter.count} queries"' in response.headers['Server-Timing']
+    assert float(_timing(response)['tpl']) > 0
+
+
+def test_public_responses_only_carry_it_when_enabled(client, seeded, monkeypatch):
+    assert 'Server-Timing' not in client.get('/').headers
+    monkeypatch.setitem(app_module.app.config, 'SERVER_TIMING', 'all')
+    assert 'Server-Timing' in client.get('/').headers
+    # Reporting must not make static files vary on the session cookie
+    assert 'Cookie' not in client.get('/static/css/style.css').headers.get('Vary', '')
+
+
+def test_markdown_time_is_attributed_to_the_request(app):
+    with app.test_request_context('/'):
+        g.request_timing = RequestTiming()
+        render_markdown('# Title\n\n```python\nprint(1)\n```')
+        assert g.request_timing.markdown > 0
+
+
+def test_perf_page_lists_routes_and_statements(admin_client, seeded):
+    for _ in range(3):
+        admin_client.get('/post/post-1')
+    admin_client.get('/admin/comments')
+    snapshot = perf_registry.snapshot()
+    route = snapshot['routes']['GET /post/<slug>']
+    assert route['requests'] == 3 and route['queries'] > 0
+    assert route['percentiles'][50] <= route['percentiles'][99] <= route['max'] * 1.25
+    assert snapshot['slowest']
+
+    body = admin_client.get('/admin/perf').get_data(as_text=True)
+    assert 'GET /post/&lt;slug&gt;' in body and 'SELECT' in body
+
+    # Resetting leaves only the reset request itself
+    admin_client.post('/admin/perf')
+    assert list(perf_registry.snapshot()['routes']) == ['POST /admin/perf']
+
+
+def test_sampled_requests_are_profiled(admin_client, seeded, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'PROFILE_SAMPLE_PERCENT', 100)
+    admin_client.get('/post/post-1')
+    profiles = perf_registry.snapshot()['profiles']
+    assert profiles[0]['route'] == 'GET /post/post-1'
+    assert 'cumulative' in profiles[0]['text'] and 'post_detail' in profiles[0]['text']
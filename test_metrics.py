@@ -0,0 +1,122 @@
+import io
+import multiprocessing
+import re
+import time
+
+from PIL import Image
+
+import app as app_module
+from metrics import Registry
+from page_cache import MemoryPageCache
+from storage import LocalStorage
+
+
+def _samples(text):
+    return {name: float(value) for name, value in re.findall(r'^(\S+) (\S+)$', text, re.M)}
+
+
+def _scrape(client):
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    return _samples(response.get_data(as_text=True))
+
+
+def test_requests_are_counted_per_route(client, seeded):
+    client.get('/')
+    client.get('/')
+    client.get('/post/post-1')
+    client.get('/post/missing')
+    samples = _scrape(client)
+    assert samples['modernblog_http_requests_total{method="GET",route="/",status="200"}'] == 2
+    assert samples['modernblog_http_requests_total{method="GET",route="/post/<slug>",status="404"}'] == 1
+    assert samples['modernblog_http_request_duration_seconds_count{method="GET",route="/"}'] == 2
+    assert samples['modernblog_http_request_duration_seconds_bucket{method="GET",route="/",le="+Inf"}'] == 2
+    assert samples['modernblog_http_request_duration_seconds_sum{method="GET",route="/"}'] > 0
+    assert samples['modernblog_http_request_queries_count{method="GET",route="/post/<slug>"}'] == 2
+    assert samples['modernblog_db_pool_limit'] > 0
+    assert samples['modernblog_db_pool_connections{state="checked_out"}'] >= 0
+
+
+def _record_in_child(directory):
+    registry = Registry(directory)
+    registry.counter('jobs', 'Jobs').inc(3)
+    registry.gauge('busy', 'Busy').set(2)
+    registry.histogram('latency_seconds', 'Latency').observe(0.2)
+
+
+def test_samples_of_every_worker_are_summed(tmp_path):
+    registry = Registry(str(tmp_path))
+    jobs, busy = registry.counter('jobs', 'Jobs'), registry.gauge('busy', 'Busy')
+    latency = registry.histogram('latency_seconds', 'Latency')
+    jobs.inc()
+    busy.set(1)
+    latency.observe(0.02)
+    child = multiprocessing.get_context('fork').Process(target=_record_in_child, args=(str(tmp_path),))
+    child.start()
+    child.join()
+
+    samples = _samples(registry.exposition())
+    assert samples['jobs_total'] == 4 and samples['busy'] == 3
+    assert samples['latency_seconds_bucket{le="0.025"}'] == 1
+    assert samples['latency_seconds_bucket{le="0.25"}'] == 2
+    assert samples['latency_seconds_count'] == 2
+
+    # Gauges of exited workers stop counting; what they counted stays in the totals
+    registry.store.mark_process_dead(child.pid)
+    samples = _samples(registry.exposition())
+    assert samples['jobs_total'] == 4 and samples['busy'] == 1
+
+
+def test_uploads_and_model_calls_are_measured(admin_client, tmp_path, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    monkeypatch.setattr(app_module, 'upload_storage', LocalStorage(str(tmp_path)))
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), (40, 90, 200)).save(buffer, 'PNG')
+    size = buffer.tell()
+    buffer.seek(0)
+    assert admin_client.post('/admin/upload', data={'file': (buffer, 'dot.png')}).status_code == 200
+    admin_client.post('/admin/generate-blog', json={'topic': 'Flask'})
+    admin_client.post('/admin/generate-blog', json={'topic': 'flask'})
+
+    samples = _scrape(admin_client)
+    assert samples['modernblog_upload_bytes_sum{format="png"}'] == size
+    assert samples['modernblog_upload_bytes_bucket{format="png",le="16384.0"}'] == 1
+    assert samples['modernblog_generation_call_duration_seconds_count{part="content",status="ok"}'] == 1
+    assert samples['modernblog_generation_call_duration_seconds_count{part="content",status="cached"}'] == 1
+    assert samples['modernblog_generation_tokens_total{part="title",direction="response"}'] > 0
+
+
+def test_page_cache_lookups_are_counted(client, seeded, monkeypatch):
+    monkeypatch.setattr(app_module, 'page_cache', MemoryPageCache())
+    client.get('/')
+    client.get('/')
+    samples = _scrape(client)
+    assert samples['modernblog_page_cache_lookups_total{result="miss"}'] == 1
+    assert samples['modernblog_page_cache_lookups_total{result="hit"}'] == 1
+
+
+def test_recording_costs_microseconds(tmp_path):
+    registry = Registry(str(tmp_path))
+    requests = registry.counter('requests', 'Requests', ('route', 'status'))
+    duration = registry.histogram('duration_seconds', 'Duration', ('route',))
+    started = time.perf_counter()
+    for i in range(10000):
+        requests.inc(route='/post/<slug>', status=200)
+        duration.observe(i / 10000, route='/post/<slug>')
+    assert (time.perf_counter() - started) / 10000 < 50e-6
+    assert _samples(registry.exposition())['duration_seconds_count{route="/post/<slug>"}'] == 10000
+
+
+def test_scrapes_can_require_a_token(client, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'METRICS_TOKEN', 's3cret')
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer s3cret'}).status_code == 200
+
+
+def test_scrapes_need_a_token_outside_debug(client, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'TESTING', False)
+    assert client.get('/metrics').status_code == 404
+    monkeypatch.setitem(app_module.app.config, 'METRICS_TOKEN', 's3cret')
+    assert client.get('/metrics', headers={'Authorization': 'Bearer s3cret'}).status_code == 200
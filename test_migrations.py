@@ -0,0 +1,60 @@
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from app import db
+from migrations import MIGRATIONS, HOT_PATH_INDEXES, applied_versions, downgrade, upgrade
+
+HEAD = MIGRATIONS[-1].version
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'migrations.db'}")
+    yield engine
+    engine.dispose()
+
+
+def _indexes(engine):
+    inspector = inspect(engine)
+    return {index['name'] for table in inspector.get_table_names() for index in inspector.get_indexes(table)}
+
+
+def test_upgrade_creates_the_current_schema(engine):
+    assert upgrade(engine=engine) == [migration.version for migration in MIGRATIONS]
+    assert upgrade(engine=engine) == []
+    assert applied_versions(engine) == {migration.version for migration in MIGRATIONS}
+
+    model_indexes = {index.name for table in db.metadata.tables.values() for index in table.indexes}
+    assert model_indexes <= _indexes(engine)
+    assert 'post_fts' in inspect(engine).get_table_names()
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT stamp FROM cache_version WHERE name = 'listings'")).scalar()
+
+
+def test_downgrade_and_upgrade_round_trip(engine):
+    upgrade(engine=engine)
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO post (title, slug, content, published) VALUES ('Kept', 'kept', 'Body', 1)"))
+
+    assert downgrade('0001', engine=engine) == ['0014', '0013', '0012', '0011', '0010', '0009', '0008', '0007', '0006', '0005', '0004', '0003', '0002']
+    inspector = inspect(engine)
+    assert 'content_html' not in {column['name'] for column in inspector.get_columns('post')}
+    assert 'cache_version' not in inspector.get_table_names()
+    assert not {name for _, name in HOT_PATH_INDEXES} & _indexes(engine)
+
+    upgrade(engine=engine)
+    assert {name for _, name in HOT_PATH_INDEXES} <= _indexes(engine)
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT rowid FROM post_fts WHERE post_fts MATCH 'kept'")).all()
+
+
+def test_upgrade_adopts_a_database_built_with_create_all(engine):
+    db.metadata.create_all(engine)
+    assert upgrade(engine=engine) == [migration.version for migration in MIGRATIONS]
+    assert downgrade(HEAD, engine=engine) == []
+
+
+def test_upgrade_to_a_target_version(engine):
+    assert upgrade('0002', engine=engine) == ['0001', '0002']
+    assert 'cache_purge' not in inspect(engine).get_table_names()
@@ -0,0 +1,138 @@
+import os
+import time
+
+import pytest
+
+import app as app_module
+from app import db, Post, Comment, Setting, CachePurge
+from page_cache import MemoryPageCache, FilesystemPageCache
+
+
+@pytest.fixture
+def page_cache(app, monkeypatch):
+    cache = MemoryPageCache(max_entries=50)
+    monkeypatch.setattr(app_module, 'page_cache', cache)
+    monkeypatch.setitem(app_module._page_cache_sync, 'last_id', None)
+    monkeypatch.setitem(app_module._page_cache_sync, 'checked_at', None)
+    return cache
+
+
+def test_anonymous_pages_are_served_from_cache(client, seeded, page_cache, count_queries):
+    assert client.get('/post/post-1').headers['X-Page-Cache'] == 'MISS'
+    with count_queries() as counter:
+        response = client.get('/post/post-1')
+    assert response.headers['X-Page-Cache'] == 'HIT'
+    assert 'Post 1' in response.get_data(as_text=True)
+    assert counter.count == 0
+
+
+def test_query_string_is_part_of_the_key(client, seeded, page_cache):
+    client.get('/?page=1')
+    assert client.get('/?page=2').headers['X-Page-Cache'] == 'MISS'
+    assert client.get('/?page=1').headers['X-Page-Cache'] == 'HIT'
+
+
+def test_admins_bypass_the_cache(admin_client, seeded, page_cache):
+    admin_client.get('/')
+    assert 'X-Page-Cache' not in admin_client.get('/').headers
+    assert len(page_cache) == 0
+
+
+def test_editing_a_post_purges_only_its_pages(client, seeded, page_cache):
+    for url in ('/', '/post/post-1', '/post/post-2', '/page/about'):
+        client.get(url)
+
+    post = Post.query.filter_by(slug='post-1').first()
+    post.title = 'Edited title'
+    db.session.commit()
+
+    assert client.get('/post/post-1').headers['X-Page-Cache'] == 'MISS'
+    assert client.get('/').headers['X-Page-Cache'] == 'MISS'
+    assert client.get('/post/post-2').headers['X-Page-Cache'] == 'HIT'
+    assert client.get('/page/about').headers['X-Page-Cache'] == 'HIT'
+
+
+def test_comment_approval_purges_the_post(app, admin_client, seeded, page_cache):
+    client = app.test_client()
+    post = Post.query.filter_by(slug='post-1').first()
+    post_id = post.id
+    comment = Comment(name='Reader', email='r@example.com', content='Nice', post_id=post.id)
+    db.session.add(comment)
+    db.session.commit()
+    comment_id = comment.id
+    client.get('/post/post-1')
+    client.get('/post/post-2')
+
+    pending = Comment(name='Other', email='o@example.com', content='Awaiting moderation', post_id=post_id)
+    db.session.add(pending)
+    db.session.commit()
+    assert client.get('/post/post-1').headers['X-Page-Cache'] == 'HIT'
+
+    admin_client.post(f'/admin/comments/{comment_id}/approve')
+    assert client.get('/post/post-1').headers['X-Page-Cache'] == 'MISS'
+    assert client.get('/post/post-2').headers['X-Page-Cache'] == 'HIT'
+
+
+def test_settings_save_purges_everything(client, seeded, page_cache):
+    client.get('/post/post-1')
+    client.get('/page/about')
+    Setting.set('site_name', 'Renamed')
+    assert len(page_cache) == 0
+    assert 'Renamed' in client.get('/page/about').get_data(as_text=True)
+
+
+def test_purges_from_other_workers_are_replayed(client, seeded, page_cache, app):
+    client.get('/post/post-1')
+    client.get('/post/post-2')
+
+    # Another worker committed a purge; this worker only sees the log row
+    db.session.add(CachePurge(tag='post:%d' % Post.query.filter_by(slug='post-1').first().id))
+    db.session.commit()
+    app_module._page_cache_sync['checked_at'] -= app.config['CACHE_VERSION_CHECK_INTERVAL']
+
+    assert client.get('/post/post-1').headers['X-Page-Cache'] == 'MISS'
+    assert client.get('/post/post-2').headers['X-Page-Cache'] == 'HIT'
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryPageCache(max_entries=2)
+    cache.set('a', b'a', {}, {'site'})
+    cache.set('b', b'b', {}, {'site'})
+    cache.get('a')
+    cache.set('c', b'c', {}, {'site'})
+    assert cache.get('b') is None
+    assert cache.get('a').body == b'a'
+    cache.purge({'site'})
+    assert len(cache) == 0
+
+
+def test_filesystem_cache_purges_by_tag(tmp_path):
+    writer = FilesystemPageCache(str(tmp_path))
+    reader = FilesystemPageCache(str(tmp_path))
+    writer.set('/post/a', b'A', {'Content-Type': 'text/html'}, {'site', 'post:1'})
+    writer.set('/post/b', b'B', {'Content-Type': 'text/html'}, {'site', 'post:2'})
+    assert reader.get('/post/a').body == b'A'
+
+    writer.purge({'post:1'})
+    assert reader.get('/post/a') is None
+    assert reader.get('/post/b').body == b'B'
+
+
+def test_unknown_query_parameters_share_an_entry(client, seeded, page_cache):
+    client.get('/?page=1')
+    assert client.get('/?page=1&x=123').headers['X-Page-Cache'] == 'HIT'
+    client.get('/?x=456')
+    assert len(page_cache) == 2
+
+
+def test_filesystem_cache_is_bounded(tmp_path, monkeypatch):
+    cache = FilesystemPageCache(str(tmp_path), max_entries=20, ttl=300)
+    for number in range(100):
+        cache.set(f'/?page={number}', b'x', {}, {'site'})
+    assert len(os.listdir(tmp_path / 'pages')) <= 20 + cache._sweep_every
+
+    # Expired entries go at the next sweep even below the limit
+    later = time.time() + 301
+    monkeypatch.setattr(time, 'time', lambda: later)
+    cache.sweep()
+    assert os.listdir(tmp_path / 'pages') == []
@@ -0,0 +1,77 @@
+import re
+from datetime import datetime, timedelta
+
+from app import db, Post, encode_cursor
+
+
+def _make_posts(count, same_time_every=3):
+    base = datetime(2024, 1, 1)
+    for i in range(count):
+        # Several posts share a timestamp so the id tie-breaker matters
+        created_at = base + timedelta(minutes=i // same_time_every)
+        db.session.add(Post(title=f'P{i}', slug=f'p-{i}', content='x', published=True, created_at=created_at))
+    db.session.commit()
+
+
+def _slugs(body):
+    return re.findall(r'href="/post/(p-\d+)"', body)
+
+
+def _cursor(body, rel):
+    match = re.search(r'href="/\?cursor=([\w-]+)" rel="%s"' % rel, body)
+    return match.group(1) if match else None
+
+
+def test_cursor_walk_covers_every_post_once_in_order(client, app):
+    _make_posts(20)
+    expected = [p.slug for p in Post.query.order_by(Post.created_at.desc(), Post.id.desc())]
+
+    seen, pages = [], []
+    body = client.get('/').get_data(as_text=True)
+    while True:
+        page = list(dict.fromkeys(_slugs(body)))
+        pages.append(body)
+        seen.extend(page)
+        cursor = _cursor(body, 'next')
+        if not cursor:
+            break
+        body = client.get(f'/?cursor={cursor}').get_data(as_text=True)
+
+    assert seen == expected
+    assert _cursor(pages[0], 'prev') is None
+
+    # And back again from the last page
+    back = client.get(f'/?cursor={_cursor(pages[-1], "prev")}').get_data(as_text=True)
+    assert list(dict.fromkeys(_slugs(back))) == list(dict.fromkeys(_slugs(pages[-2])))
+
+
+def test_deep_pages_use_a_single_bounded_query(client, app, count_queries):
+    _make_posts(30)
+    last = Post.query.order_by(Post.created_at, Post.id).offset(5).first()
+    cursor = encode_cursor(last, 'a')
+    client.get(f'/?cursor={cursor}')
+    with count_queries() as counter:
+        client.get(f'/?cursor={cursor}')
+    listing = [s for s in counter.statements if 'FROM post' in s and 'LIMIT' in s and 'post_tags' not in s]
+    assert len(listing) == 1
+    assert '(post.created_at, post.id) <' in listing[0]
+    assert not any('count(' in s.lower() and 'FROM post' in s and 'max(' not in s.lower() for s in counter.statements)
+
+
+def test_legacy_page_links_still_work(client, app):
+    _make_posts(12)
+    body = client.get('/?page=2').get_data(as_text=True)
+    assert len(set(_slugs(body))) == 6
+    assert _cursor(body, 'prev')
+
+
+def test_garbage_cursor_is_a_404(client, app):
+    assert client.get('/?cursor=not-a-cursor').status_code == 404
+    assert client.get('/category/none?cursor=x').status_code == 404
+
+
+def test_listing_index_is_used(app):
+    plan = db.session.execute(db.text(
+        'EXPLAIN QUERY PLAN SELECT id FROM post WHERE published = 1 AND (created_at, id) < (:c, :i) '
+        'ORDER BY created_at DESC, id DESC LIMIT 7'), {'c': '2024-01-01 00:00:00', 'i': 5}).all()
+    assert any('ix_post_published_created_at_id' in row[-1] for row in plan)
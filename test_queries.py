@@ -0,0 +1,88 @@
+import pytest
+
+from app import db, Category, Post
+
+
+ROUTES = [
+    '/',
+    '/?page=2',
+    '/post/post-3',
+    '/category/category-1',
+    '/tag/tag0',
+    '/search?q=Body',
+    '/page/about',
+    '/categories',
+    '/no-such-page',
+]
+
+
+def _warm_get(client, count_queries, url):
+    client.get(url)
+    with count_queries() as counter:
+        response = client.get(url)
+    return response, counter
+
+
+@pytest.mark.parametrize('url', ROUTES)
+def test_public_routes_do_not_query_site_chrome_when_warm(client, seeded, count_queries, url):
+    response, counter = _warm_get(client, count_queries, url)
+    assert response.status_code in (200, 404)
+    for statement in counter.statements:
+        assert 'FROM setting' not in statement
+        assert 'FROM menu_item' not in statement
+        assert 'FROM page' not in statement or url.startswith('/page/')
+
+
+# Budgets include the conditional-GET validator query; categories and tags are loaded with the page
+@pytest.mark.parametrize('url, max_queries', [
+    ('/', 3),
+    ('/post/post-3', 4),
+    ('/category/category-1', 4),
+    ('/tag/tag0', 4),
+    ('/search?q=Body', 5),
+    ('/page/about', 1),
+    ('/categories', 4),
+    ('/no-such-page', 0),
+])
+def test_public_route_query_budget(client, seeded, count_queries, url, max_queries):
+    response, counter = _warm_get(client, count_queries, url)
+    assert counter.count <= max_queries, counter.statements
+
+
+def test_chrome_is_rendered_from_cache(client, seeded):
+    body = client.get('/').get_data(as_text=True)
+    assert 'Test Blog' in body
+    assert '<ad-header>' in body
+    assert 'Category 0' in body
+
+
+def test_menu_change_invalidates_chrome(admin_client, seeded):
+    admin_client.get('/')
+    admin_client.post('/admin/menu/new', data={'title': 'Fresh Link', 'url': '/fresh', 'order': 2})
+    assert 'Fresh Link' in admin_client.get('/').get_data(as_text=True)
+
+
+def test_category_rename_invalidates_chrome(admin_client, seeded):
+    admin_client.get('/')
+    category = Category.query.filter_by(slug='category-0').first()
+    admin_client.post(f'/admin/categories/{category.id}/edit', data={'name': 'Renamed Category'})
+    assert 'Renamed Category' in admin_client.get('/').get_data(as_text=True)
+
+
+def test_categories_page_query_count_does_not_grow_with_posts(client, seeded, count_queries):
+    _, before = _warm_get(client, count_queries, '/categories')
+    category = Category.query.filter_by(slug='category-1').first()
+    for i in range(20):
+        db.session.add(Post(title=f'Extra {i}', slug=f'extra-{i}', content='Body', published=True, category=category))
+    db.session.commit()
+    response, after = _warm_get(client, count_queries, '/categories')
+    assert after.count == before.count
+    assert 'Extra 19' in response.get_data(as_text=True)
+
+
+def test_categories_page_counts_only_published_posts(client, seeded):
+    category = Category.query.filter_by(slug='category-0').first()
+    db.session.add(Post(title='Secret draft', slug='secret-draft', content='Body', published=False, category=category))
+    db.session.commit()
+    body = client.get('/categories').get_data(as_text=True)
+    assert 'Secret draft' not in body
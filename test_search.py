@@ -0,0 +1,56 @@
+from app import db, Post, search_posts, fts5_match_expression
+
+
+def _post(slug, title, content, excerpt='', published=True):
+    post = Post(title=title, slug=slug, content=content, excerpt=excerpt, published=published)
+    db.session.add(post)
+    db.session.commit()
+    return post
+
+
+def test_match_expression_quotes_user_input():
+    assert fts5_match_expression('flask AND "web app" -x') == '"flask" "AND" "web app" "x"*'
+    assert fts5_match_expression('"web app"') == '"web app"'
+    assert fts5_match_expression('"" ***') == ''
+
+
+def test_results_are_ranked_by_relevance(app):
+    _post('body-only', 'Cooking notes', 'A short aside about flask bottles.')
+    _post('title-hit', 'Flask routing guide', 'Routing with flask, flask blueprints and flask views.')
+
+    results = search_posts('flask', page=1)
+    assert [post.slug for post in results.items] == ['title-hit', 'body-only']
+    assert results.total == 2
+
+
+def test_unpublished_posts_are_not_returned(app):
+    post = _post('draft', 'Secret flask draft', 'flask', published=False)
+    assert search_posts('flask', page=1).items == []
+
+    post.published = True
+    db.session.commit()
+    assert search_posts('flask', page=1).total == 1
+
+
+def test_index_follows_edits_and_deletes(app):
+    post = _post('edited', 'Original title', 'nothing interesting')
+    assert search_posts('pygments', page=1).total == 0
+
+    post.content = 'Now about pygments highlighting'
+    db.session.commit()
+    assert [p.slug for p in search_posts('pygments', page=1).items] == ['edited']
+
+    db.session.delete(post)
+    db.session.commit()
+    assert search_posts('pygments', page=1).total == 0
+
+
+def test_snippets_are_highlighted_and_escaped(client, app):
+    _post('xss', 'Escaping', 'Careful with <script>alert(1)</script> near the keyword sqlite here.')
+    results = search_posts('sqlite', page=1)
+    snippet = str(results.snippets[results.items[0].id])
+    assert '<mark>sqlite</mark>' in snippet
+    assert '<script>' not in snippet
+
+    body = client.get('/search?q=sqlite').get_data(as_text=True)
+    assert '<mark>sqlite</mark>' in body
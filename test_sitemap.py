@@ -0,0 +1,77 @@
+import gzip
+import os
+
+import app as app_module
+from app import db, Category, Post
+from sitemap import SitemapStore, url_entry
+
+
+def test_sitemap_lists_every_public_url(client, seeded):
+    response = client.get('/sitemap.xml')
+    body = response.get_data(as_text=True)
+    assert response.mimetype == 'application/xml'
+    assert body.startswith('<?xml') and body.rstrip().endswith('</urlset>')
+    assert body.count('<url>') == 1 + 10 + 1 + 3 + 1
+    assert 'http://localhost/post/post-9' in body
+    assert 'http://localhost/category/category-2' in body
+
+
+def test_gzip_is_served_as_stored(client, seeded):
+    response = client.get('/sitemap.xml', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert b'/post/post-1</loc>' in gzip.decompress(response.get_data())
+
+
+def test_sitemap_is_only_rebuilt_when_content_changes(client, seeded, count_queries):
+    client.get('/sitemap.xml')
+    with count_queries() as counter:
+        client.get('/sitemap.xml')
+    assert not [statement for statement in counter.statements if 'post.slug' in statement]
+
+    post = Post.query.filter_by(slug='post-3').first()
+    post.slug = 'renamed-post'
+    db.session.commit()
+    body = client.get('/sitemap.xml').get_data(as_text=True)
+    assert '/post/renamed-post' in body
+    assert '/post/post-3<' not in body
+
+
+def test_category_rename_refreshes_the_sitemap(admin_client, seeded):
+    admin_client.get('/sitemap.xml')
+    category = Category.query.filter_by(slug='category-1').first()
+    admin_client.post(f'/admin/categories/{category.id}/edit', data={'name': 'Fresh Name'})
+    assert '/category/fresh-name' in admin_client.get('/sitemap.xml').get_data(as_text=True)
+
+
+def test_large_sites_get_a_sitemap_index(client, seeded, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'SITEMAP_MAX_URLS', 5)
+    index = client.get('/sitemap.xml').get_data(as_text=True)
+    assert '<sitemapindex' in index
+    assert index.count('<sitemap>') == 4
+    assert 'http://localhost/sitemap-4.xml' in index
+
+    shards = [client.get(f'/sitemap-{n}.xml').get_data(as_text=True) for n in range(1, 5)]
+    assert [shard.count('<url>') for shard in shards] == [5, 5, 5, 1]
+    assert client.get('/sitemap-5.xml').status_code == 404
+
+
+def test_rebuild_keeps_unchanged_shards(tmp_path):
+    store = SitemapStore(str(tmp_path), max_urls=2)
+    urls = [url_entry(f'http://example.com/{n}') for n in range(5)]
+    first = store.build('v1', iter(urls), 'http://example.com')
+    urls[4] = url_entry('http://example.com/changed')
+    second = store.build('v2', iter(urls), 'http://example.com')
+
+    assert first['shards'][:2] == second['shards'][:2]
+    assert first['shards'][2]['sha1'] != second['shards'][2]['sha1']
+    assert store.current('v2') == second
+    assert os.path.exists(store.path('sitemap_index.xml.gz'))
+
+
+def test_host_header_does_not_change_the_sitemap(client, seeded):
+    body = client.get('/sitemap.xml', headers={'Host': 'evil.example'}).get_data(as_text=True)
+    assert 'evil.example' not in body and 'http://localhost/post/post-1' in body
+    client.get('/sitemap.xml', headers={'Host': 'other.example'})
+    assert len(app_module._sitemap_stores) == 1
+    assert 'Sitemap: http://localhost/sitemap.xml' in client.get('/robots.txt', headers={'Host': 'evil.example'}).get_data(as_text=True)
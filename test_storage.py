@@ -0,0 +1,129 @@
+import io
+import re
+from datetime import datetime, timedelta
+
+import pytest
+from PIL import Image
+
+import app as app_module
+import gc_uploads
+from app import db, ImageAsset, Page, Post, UploadReference
+from images import strip_metadata
+from storage import LocalStorage, S3Storage, content_key
+
+
+@pytest.fixture
+def storage(app, tmp_path, monkeypatch):
+    storage = LocalStorage(str(tmp_path))
+    monkeypatch.setattr(app_module, 'upload_storage', storage)
+    monkeypatch.setattr(gc_uploads, 'upload_storage', storage)
+    return storage
+
+
+def _png(color=(200, 40, 40)):
+    buffer = io.BytesIO()
+    Image.new('RGB', (400, 300), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def _upload(client, data, name='image.png'):
+    response = client.post('/admin/upload', data={'file': (io.BytesIO(data), name)})
+    return response.get_json()['url'].split('/static/uploads/', 1)[1]
+
+
+def _references(owner):
+    return {ref.filename for ref in UploadReference.query.filter_by(owner=owner)}
+
+
+def test_keys_are_sharded_content_hashes():
+    key = content_key(b'hello', 'png')
+    assert re.fullmatch(r'2c/f2/2cf24dba[0-9a-f]{56}\.png', key)
+
+
+def test_identical_uploads_are_stored_once(admin_client, storage):
+    data = _png()
+    first = _upload(admin_client, data, 'a.png')
+    second = _upload(admin_client, data, 'renamed.png')
+    assert first == second == content_key(strip_metadata(data), 'png')
+    assert ImageAsset.query.count() == 1
+    originals = [key for key in storage.keys() if key.endswith('.png') and '-' not in key]
+    assert originals == [first]
+
+
+def test_references_follow_posts_and_pages(admin_client, seeded, storage):
+    cover = _upload(admin_client, _png())
+    inline = _upload(admin_client, _png((10, 10, 10)))
+    post = Post.query.filter_by(slug='post-1').first()
+    post_owner = 'post:%d' % post.id
+    post.cover_image = cover
+    post.content += f'\n\n![Chart](/static/uploads/{inline})'
+    page = Page.query.first()
+    page_owner = 'page:%d' % page.id
+    page.content = f'![Team](/static/uploads/{inline})'
+    db.session.commit()
+    assert _references(post_owner) == {cover, inline}
+    assert _references(page_owner) == {inline}
+
+    db.session.delete(Post.query.filter_by(slug='post-1').first())
+    db.session.commit()
+    assert _references(post_owner) == set()
+    assert _references(page_owner) == {inline}
+
+
+def test_gc_removes_only_unreferenced_uploads_past_the_grace_period(admin_client, seeded, storage):
+    kept = _upload(admin_client, _png())
+    orphan = _upload(admin_client, _png((0, 200, 0)))
+    fresh = _upload(admin_client, _png((0, 0, 200)))
+    post = Post.query.filter_by(slug='post-2').first()
+    post.cover_image = kept
+    ImageAsset.query.filter(ImageAsset.filename != fresh).update(
+        {'uploaded_at': datetime.utcnow() - timedelta(days=2)}, synchronize_session=False)
+    db.session.commit()
+    orphan_keys = ImageAsset.query.filter_by(filename=orphan).one().storage_keys()
+    assert len(orphan_keys) > 1
+
+    assert gc_uploads.collect(dry_run=True) == (1, len(orphan_keys))
+    assert storage.exists(orphan)
+
+    assert gc_uploads.collect() == (1, len(orphan_keys))
+    assert not any(storage.exists(key) for key in orphan_keys)
+    assert storage.exists(kept) and storage.exists(fresh)
+    assert {asset.filename for asset in ImageAsset.query} == {kept, fresh}
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, **extra):
+        self.objects[Key] = (Body, extra)
+
+    def get_object(self, Bucket, Key):
+        return {'Body': io.BytesIO(self.objects[Key][0])}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+    def list_objects_v2(self, Bucket, Prefix, MaxKeys=1000, ContinuationToken=None):
+        keys = sorted(key for key in self.objects if key.startswith(Prefix))
+        start = int(ContinuationToken or 0)
+        page = keys[start:start + MaxKeys]
+        response = {'Contents': [{'Key': key} for key in page], 'IsTruncated': start + MaxKeys < len(keys)}
+        if response['IsTruncated']:
+            response['NextContinuationToken'] = str(start + MaxKeys)
+        return response
+
+
+def test_s3_storage_prefixes_keys_and_serves_immutable_objects():
+    client = FakeS3()
+    storage = S3Storage(client, 'bucket', 'https://cdn.example.com/', prefix='blog')
+    key = content_key(b'data', 'jpg')
+    storage.save(key, io.BytesIO(b'data'), 'image/jpeg')
+
+    assert storage.exists(key)
+    assert list(storage.keys()) == [key]
+    assert storage.open(key).read() == b'data'
+    assert storage.url(key) == f'https://cdn.example.com/blog/{key}'
+    assert client.objects[f'blog/{key}'][1]['CacheControl'].endswith('immutable')
+    storage.delete(key)
+    assert not storage.exists(key)
@@ -0,0 +1,129 @@
+import os
+
+import pytest
+
+import app as app_module
+from app import db, Comment, Contact, Page, Post, flush_submissions
+from submissions import SubmissionFilter, SubmissionQueue
+
+
+@pytest.fixture
+def queue(app, tmp_path, monkeypatch):
+    """Queue submissions without writing them, as a deployment with a flush interval does"""
+    queue = SubmissionQueue(str(tmp_path))
+    monkeypatch.setattr(app_module, 'submission_queue', queue)
+    monkeypatch.setitem(app.config, 'SUBMISSION_FLUSH_INTERVAL', 1)
+    monkeypatch.setattr(app_module, 'start_submission_writer', lambda: None)
+    return queue
+
+
+def _comment(client, content, slug='post-1', ip='10.0.0.1', headers=None, **extra):
+    return client.post(f'/post/{slug}', data={'name': 'Reader', 'email': 'r@example.com', 'content': content, **extra},
+                       environ_base={'REMOTE_ADDR': ip}, headers=headers)
+
+
+def test_comments_are_queued_and_written_in_one_batch(client, seeded, queue, count_queries):
+    for i in range(3):
+        _comment(client, f'Comment {i}', ip=f'10.0.0.{i}')
+    assert Comment.query.count() == 0
+    assert len(queue.pending()) == 3
+
+    with count_queries() as counter:
+        assert flush_submissions() == 3
+    assert [c.content for c in Comment.query.order_by(Comment.id)] == ['Comment 0', 'Comment 1', 'Comment 2']
+    assert not queue.pending() and not list(queue.claim(10))
+    inserts = [s for s in counter.statements if s.startswith('INSERT INTO comment')]
+    assert len(inserts) == 1
+
+
+def test_contact_messages_go_through_the_queue(client, seeded, queue):
+    db.session.add(Page(title='Contact', slug='contact', content='Write to us', published=True))
+    db.session.commit()
+    client.post('/page/contact', data={'name': 'A', 'email': 'a@example.com', 'subject': 'Hi', 'message': 'Hello there'})
+    flush_submissions()
+    assert Contact.query.one().subject == 'Hi'
+
+
+def test_addresses_are_rate_limited(client, seeded):
+    for i in range(5):
+        _comment(client, f'Comment {i}')
+    response = _comment(client, 'One too many', slug='post-2', ip='10.0.0.1')
+    assert Comment.query.count() == 5
+    assert b'too quickly' in client.get(response.headers['Location']).data
+    _comment(client, 'From elsewhere', ip='10.0.0.99')
+    assert Comment.query.count() == 6
+
+
+def test_visitors_behind_the_proxy_have_their_own_limits(client, seeded):
+    for i in range(5):
+        _comment(client, f'Comment {i}', ip='127.0.0.1', headers={'X-Forwarded-For': '203.0.113.7'})
+    _comment(client, 'One too many', ip='127.0.0.1', headers={'X-Forwarded-For': '203.0.113.7'})
+    _comment(client, 'Another visitor', ip='127.0.0.1', headers={'X-Forwarded-For': '198.51.100.2'})
+    assert Comment.query.count() == 6
+
+
+def test_refused_submissions_do_not_use_up_the_allowance():
+    spam_filter = SubmissionFilter(per_ip=2, per_target=1, window=60)
+    assert spam_filter.check('ip', 'post:1', 'first') is None
+    assert spam_filter.check('ip', 'post:1', 'second') == 'rate_limited'
+    assert spam_filter.check('ip', 'post:1', 'first') == 'duplicate'
+    assert spam_filter.check('ip', 'post:2', 'third') is None
+
+
+def test_repeats_and_spam_are_dropped_quietly(client, seeded):
+    _comment(client, 'Great post!')
+    response = _comment(client, '  great   POST! ', ip='10.0.0.2')
+    _comment(client, 'Buy now', ip='10.0.0.3', website='http://spam.example')
+    _comment(client, ' '.join(f'http://spam.example/{i}' for i in range(4)), ip='10.0.0.4')
+    assert Comment.query.count() == 1
+    assert b'It will appear after admin approval' in client.get(response.headers['Location']).data
+
+
+def test_comments_on_deleted_posts_are_dropped(client, seeded, queue):
+    _comment(client, 'Too late')
+    db.session.delete(Post.query.filter_by(slug='post-1').one())
+    db.session.commit()
+    assert flush_submissions() == 1
+    assert Comment.query.count() == 0
+    assert not queue.pending()
+
+
+def test_fields_are_cut_to_their_columns(client, seeded, queue):
+    _comment(client, 'Long name', name='N' * 300, email='e' * 300 + '@example.com')
+    flush_submissions()
+    comment = Comment.query.one()
+    assert len(comment.name) == 100 and len(comment.email) == 120
+
+
+def test_refused_submissions_do_not_hold_up_the_queue(client, seeded, queue):
+    _comment(client, 'Before', ip='10.0.0.1')
+    # Queued by an older release, or edited in the spool: the database refuses it
+    queue.put('comment', {'name': None, 'email': 'r@example.com', 'content': 'Broken',
+                          'post_id': Post.query.first().id, 'created_at': '2024-01-01T00:00:00'})
+    _comment(client, 'After', ip='10.0.0.2')
+    assert flush_submissions() == 3
+    assert [c.content for c in Comment.query.order_by(Comment.id)] == ['Before', 'After']
+    assert not queue.pending() and not os.listdir(queue.processing_dir)
+    assert len(os.listdir(queue.failed_dir)) == 1
+    assert flush_submissions() == 0
+
+
+def test_failed_batches_and_stale_claims_are_queued_again(tmp_path):
+    queue = SubmissionQueue(str(tmp_path), stale_after=0)
+    queue.put('comment', {'content': 'a'})
+    names = [name for name, _ in queue.claim(10)]
+    assert not queue.pending()
+    queue.release(names)
+    assert queue.pending() == names
+
+    queue.claim(10)
+    assert queue.recover() == 1
+    assert queue.pending() == names
+
+
+def test_filter_windows_expire():
+    spam_filter = SubmissionFilter(per_ip=1, window=60)
+    assert spam_filter.check('ip', 'post:1', 'first') is None
+    assert spam_filter.check('ip', 'post:1', 'second') == 'rate_limited'
+    spam_filter.per_ip._events['ip'][0] -= 61
+    assert spam_filter.check('ip', 'post:1', 'second') is None
@@ -0,0 +1,216 @@
+import io
+import json
+
+import pytest
+from PIL import Image
+
+import app as app_module
+import transfer
+from app import db, Comment, Counter, ImageAsset, ImportCheckpoint, Post, Tag, UploadReference, rebuild_counters
+from storage import LocalStorage
+
+WXR = '''<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0" xmlns:excerpt="http://wordpress.org/export/1.2/excerpt/" xmlns:content="http://purl.org/rss/1.0/modules/content/"
+     xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:wp="http://wordpress.org/export/1.2/">
+<channel>
+  <title>Old blog</title>
+  <item>
+    <title>Hello WordPress</title>
+    <content:encoded><![CDATA[<p>Moved <img src="http://old.example.com/wp-content/uploads/2020/01/dot.png"></p>]]></content:encoded>
+    <excerpt:encoded><![CDATA[First post]]></excerpt:encoded>
+    <wp:post_date_gmt>2020-01-02 10:00:00</wp:post_date_gmt>
+    <wp:post_name>hello-wordpress</wp:post_name>
+    <wp:status>publish</wp:status>
+    <wp:post_type>post</wp:post_type>
+    <category domain="category" nicename="news"><![CDATA[News]]></category>
+    <category domain="post_tag" nicename="flask"><![CDATA[Flask]]></category>
+    <wp:comment>
+      <wp:comment_author><![CDATA[Ada]]></wp:comment_author>
+      <wp:comment_author_email>ada@example.com</wp:comment_author_email>
+      <wp:comment_date_gmt>2020-01-03 09:00:00</wp:comment_date_gmt>
+      <wp:comment_content><![CDATA[Welcome!]]></wp:comment_content>
+      <wp:comment_approved>1</wp:comment_approved>
+      <wp:comment_type>comment</wp:comment_type>
+    </wp:comment>
+    <wp:comment>
+      <wp:comment_author><![CDATA[Bot]]></wp:comment_author>
+      <wp:comment_content><![CDATA[Buy now]]></wp:comment_content>
+      <wp:comment_approved>spam</wp:comment_approved>
+      <wp:comment_type>comment</wp:comment_type>
+    </wp:comment>
+  </item>
+  <item>
+    <title>About</title>
+    <wp:post_name>about</wp:post_name>
+    <wp:status>publish</wp:status>
+    <wp:post_type>page</wp:post_type>
+  </item>
+  <item>
+    <title>Unfinished</title>
+    <content:encoded><![CDATA[Draft body]]></content:encoded>
+    <wp:post_name>unfinished</wp:post_name>
+    <wp:status>draft</wp:status>
+    <wp:post_type>post</wp:post_type>
+  </item>
+</channel>
+</rss>
+'''
+
+
+@pytest.fixture
+def uploads(app, tmp_path, monkeypatch):
+    storage = LocalStorage(str(tmp_path / 'uploads'))
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path / 'uploads'))
+    monkeypatch.setattr(app_module, 'upload_storage', storage)
+    monkeypatch.setattr(transfer, 'upload_storage', storage)
+    return storage
+
+
+def _png(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.new('RGB', (8, 8), (200, 40, 40)).save(path, 'PNG')
+
+
+def _records(posts=30, comments_per_post=3):
+    for i in range(posts):
+        yield {'type': 'post', 'slug': f'imported-{i}', 'title': f'Imported {i}', 'content': f'Body about flask number {i}',
+               'excerpt': f'Excerpt {i}', 'published': i % 5 != 0, 'created_at': f'2021-03-{i % 28 + 1:02d}T08:00:00',
+               'category': f'Topic {i % 3}', 'tags': [f'Tag {i % 4}', 'Shared']}
+    for i in range(posts):
+        for n in range(comments_per_post):
+            yield {'type': 'comment', 'post': f'imported-{i}', 'name': 'Reader', 'email': 'reader@example.com',
+                   'content': f'Comment {n}', 'approved': n != 0, 'created_at': '2021-04-01T00:00:00'}
+
+
+def _write_ndjson(path, records):
+    path.write_text(''.join(json.dumps(record) + '\n' for record in records))
+
+
+def _consistent(connection):
+    counters = dict(connection.execute(db.select(Counter.name, Counter.value)).all())
+    mismatched = connection.execute(db.text('SELECT count(*) FROM post WHERE approved_comment_count != '
+                                            '(SELECT count(*) FROM comment WHERE post_id = post.id AND approved)')).scalar()
+    indexed = connection.execute(db.text('SELECT count(*) FROM post_fts')).scalar()
+    published = connection.execute(db.text('SELECT count(*) FROM post WHERE published')).scalar()
+    return counters, mismatched == 0 and indexed == published
+
+
+def test_ndjson_import_writes_batches_and_keeps_derived_state(app, seeded, tmp_path, count_queries):
+    source = tmp_path / 'posts.ndjson'
+    _write_ndjson(source, _records())
+    with db.engine.begin() as connection:
+        rebuild_counters(connection)
+    with count_queries() as queries:
+        stats = transfer.run_import(transfer.read_ndjson(str(source)), 'test', batch_size=50, render_workers=2,
+                                    progress=lambda message: None)
+    assert stats['posts'] == 30 and stats['comments'] == 90 and stats['tags'] == 5 and stats['categories'] == 3
+    # Statements per batch, not per row: 120 records in three batches
+    assert queries.count < 60
+
+    with db.engine.connect() as connection:
+        counters, consistent = _consistent(connection)
+    assert consistent
+    assert counters['posts'] == 40 and counters['published_posts'] == 34 and counters['tags'] == 9
+    assert counters['pending_comments'] == 30
+    post = Post.query.filter_by(slug='imported-7').one()
+    assert post.approved_comment_count == 2 and sorted(tag.name for tag in post.tags) == ['Shared', 'Tag 3']
+    assert post.category.name == 'Topic 1' and '<p>Body about flask number 7</p>' in post.html_content
+    assert ImportCheckpoint.query.count() == 0
+
+    # Importing the same file again skips every post and attaches no comments to them
+    stats = transfer.run_import(transfer.read_ndjson(str(source)), 'test', progress=lambda message: None)
+    assert stats['posts'] == 0 and stats['skipped_posts'] == 30 and stats['comments'] == 0
+    assert Comment.query.count() == 90
+
+
+def test_export_and_import_round_trip_with_media(app, uploads, tmp_path):
+    _png(tmp_path / 'site' / 'media' / 'img' / 'dot.png')
+    (tmp_path / 'site' / 'posts').mkdir()
+    (tmp_path / 'site' / 'posts' / 'hello.md').write_text(
+        '---\ntitle: "Hello: world"\ndate: 2022-05-01T12:00:00Z\ntags:\n  - flask\n  - python\ncover_image: img/dot.png\n'
+        'published: true\n---\nSee ![dot](../img/dot.png)\n')
+    (tmp_path / 'site' / 'comments.ndjson').write_text(json.dumps(
+        {'type': 'comment', 'post': 'hello', 'name': 'Ada', 'email': 'ada@example.com', 'content': 'Nice', 'approved': True}) + '\n')
+    media = transfer.default_media_dir('markdown', str(tmp_path / 'site'))
+    transfer.run_import(transfer.read_markdown(str(tmp_path / 'site')), 'site', media, progress=lambda message: None)
+
+    post = Post.query.filter_by(slug='hello').one()
+    key = post.cover_image
+    assert uploads.exists(key) and f'](/static/uploads/{key})' in post.content
+    assert post.title == 'Hello: world' and post.created_at.isoformat() == '2022-05-01T12:00:00'
+    assert {reference.filename for reference in UploadReference.query.filter_by(owner=f'post:{post.id}')} == {key}
+    assert ImageAsset.query.filter_by(filename=key, status='pending').count() == 1
+
+    posts, comments, copied = transfer.run_export('ndjson', str(tmp_path / 'out.ndjson'), progress=lambda message: None)
+    assert (posts, comments, copied) == (1, 1, 1)
+    assert (tmp_path / 'out.ndjson.media' / key).exists()
+    exported = [json.loads(line) for line in (tmp_path / 'out.ndjson').read_text().splitlines()]
+    assert exported[0]['tags'] == ['flask', 'python'] and exported[1]['post'] == 'hello'
+
+    transfer.run_export('markdown', str(tmp_path / 'md'), progress=lambda message: None)
+    meta, body = transfer.parse_front_matter((tmp_path / 'md' / 'posts' / 'hello.md').read_text())
+    assert meta['title'] == 'Hello: world' and meta['tags'] == ['flask', 'python'] and body == post.content + '\n'
+
+
+def test_covers_outside_the_imported_media_are_skipped(app, uploads, tmp_path):
+    (tmp_path / 'site' / 'posts').mkdir(parents=True)
+    (tmp_path / 'site' / 'posts' / 'moved.md').write_text('---\ntitle: Moved\nimage: /images/cover.jpg\n---\nBody\n')
+    (tmp_path / 'site' / 'posts' / 'escaping.md').write_text('---\ntitle: Escaping\ncover_image: ../../etc/passwd\n---\nBody\n')
+    messages = []
+    stats = transfer.run_import(transfer.read_markdown(str(tmp_path / 'site')), 'site', progress=messages.append)
+    assert stats['posts'] == 2
+    assert [post.cover_image for post in Post.query.order_by(Post.slug)] == [None, None]
+    assert sum('Skipping cover image' in message for message in messages) == 2
+
+
+def test_wxr_import_takes_posts_and_their_comments(app, uploads, tmp_path):
+    (tmp_path / 'export.xml').write_text(WXR)
+    _png(tmp_path / 'uploads' / '2020' / '01' / 'dot.png')
+    stats = transfer.run_import(transfer.read_wxr(str(tmp_path / 'export.xml')), 'wp', str(tmp_path / 'uploads'),
+                                progress=lambda message: None)
+    assert stats['posts'] == 2 and stats['comments'] == 1
+
+    post = Post.query.filter_by(slug='hello-wordpress').one()
+    assert post.published and post.excerpt == 'First post' and post.category.name == 'News'
+    assert [tag.slug for tag in post.tags] == ['flask'] and post.approved_comment_count == 1
+    assert 'old.example.com' not in post.content and '/static/uploads/' in post.content
+    assert not Post.query.filter_by(slug='unfinished').one().published
+    assert Post.query.filter_by(slug='about').count() == 0
+
+
+def test_interrupted_import_resumes_from_its_checkpoint(app, tmp_path, monkeypatch):
+    source = tmp_path / 'posts.ndjson'
+    _write_ndjson(source, _records(posts=20, comments_per_post=1))
+    original = transfer.Importer.import_batch
+    calls = []
+
+    def failing(self, records):
+        calls.append(len(records))
+        if len(calls) == 3:
+            raise RuntimeError('connection lost')
+        return original(self, records)
+
+    monkeypatch.setattr(transfer.Importer, 'import_batch', failing)
+    with pytest.raises(RuntimeError):
+        transfer.run_import(transfer.read_ndjson(str(source)), 'resume', batch_size=8, progress=lambda message: None)
+    assert Post.query.count() == 16 and db.session.get(ImportCheckpoint, 'resume').position == 16
+
+    monkeypatch.setattr(transfer.Importer, 'import_batch', original)
+    stats = transfer.run_import(transfer.read_ndjson(str(source)), 'resume', batch_size=8, progress=lambda message: None)
+    assert stats['posts'] == 4 and stats['comments'] == 20
+    assert Post.query.count() == 20 and Comment.query.count() == 20 and Tag.query.count() == 5
+    with db.engine.connect() as connection:
+        assert _consistent(connection)[1]
+
+
+def test_dry_run_writes_nothing(app, seeded, uploads, tmp_path):
+    source = tmp_path / 'posts.ndjson'
+    _write_ndjson(source, _records(posts=10))
+    _png(tmp_path / 'posts.ndjson.media' / 'dot.png')
+    before = dict(db.session.query(Counter.name, Counter.value).all())
+    stats = transfer.run_import(transfer.read_ndjson(str(source)), 'dry', transfer.default_media_dir('ndjson', str(source)),
+                                dry_run=True, progress=lambda message: None)
+    assert stats['posts'] == 10 and stats['comments'] == 30
+    assert Post.query.count() == 10 and Comment.query.count() == 0 and ImportCheckpoint.query.count() == 0
+    assert ImageAsset.query.count() == 0 and not list(uploads.keys())
+    assert dict(db.session.query(Counter.name, Counter.value).all()) == before
@@ -0,0 +1,618 @@
+#!/usr/bin/env python3
+"""
+Bulk import and export for ModernBlog
+Moves posts with their comments and images in and out as newline-delimited JSON or as a
+directory of Markdown files with front matter, and imports WordPress (WXR) exports. Records
+stream through in constant memory and are written in one transaction per batch with
+multi-row inserts; categories and tags resolve through an in-memory slug -> id map. Each
+batch also moves the import's checkpoint, so an interrupted import resumes where it stopped.
+
+Formats:
+    ndjson    one JSON record per line: posts first, then comments naming their post's slug;
+              images sit in FILE.media/ under their paths in the content
+    markdown  posts/<slug>.md (front matter, then the Markdown body), comments.ndjson, media/
+    wxr       WordPress export file (import only); pass its wp-content/uploads as --media
+
+Usage:
+    python transfer.py export ndjson|markdown DEST [--no-media] [--workers N]
+    python transfer.py import ndjson|markdown|wxr SOURCE [--media DIR] [--batch-size N]
+                              [--workers N] [--render-workers N] [--dry-run] [--restart]
+"""
+
+import argparse
+import io
+import json
+import os
+import re
+import sys
+import time
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial
+from datetime import datetime, timezone
+
+from slugify import slugify
+from app import (app, db, Category, Comment, ImageAsset, ImportCheckpoint, Post, Tag, UploadReference, post_tags,
+                 IMAGE_CONTENT_TYPES, IMAGE_EXTENSIONS, _adjust_counter, chrome_cache, content_digest, purge_page_cache,
+                 recount_comments, referenced_uploads, render_markdown, search_index_ready, touch_listings, upload_storage,
+                 upload_url)
+from images import InvalidImage, probe, strip_metadata
+from storage import content_key, is_content_key
+from migrations import upgrade
+
+BATCH_SIZE = 500
+EXPORT_CHUNK = 500
+MEDIA_WORKERS = 8
+# Rendering Markdown is most of the work of an import and is CPU-bound
+RENDER_WORKERS = os.cpu_count() or 1
+MEDIA_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+# An image path in Markdown or HTML, with whatever site URL or directory precedes it
+MEDIA_REFERENCE = re.compile(r'(?:https?://[^\s"\'()<>\[\]]+?/|/)?((?:[\w.-]+/)*[\w.-]+\.(?:jpe?g|png|gif|webp))', re.I)
+FRONT_MATTER = re.compile(r'\A---[ \t]*\n(.*?)\n---[ \t]*(?:\n|\Z)', re.S)
+FRONT_MATTER_FIELDS = (('title', 'title'), ('slug', 'slug'), ('date', 'created_at'), ('updated', 'updated_at'),
+                       ('published', 'published'), ('category', 'category'), ('tags', 'tags'), ('excerpt', 'excerpt'),
+                       ('cover_image', 'cover_image'))
+# Checked in order: the excerpt namespace lives under the WordPress export one
+WXR_NAMESPACES = (('excerpt', 'wordpress.org/export/1.2/excerpt'), ('wp', 'wordpress.org/export'),
+                  ('content', 'purl.org/rss/1.0/modules/content'), ('dc', 'purl.org/dc/elements'))
+
+
+def parse_date(value):
+    """Naive UTC datetime from an ISO 8601 or WordPress date; None for empty or zero dates"""
+    if not value or str(value).startswith('0000'):
+        return None
+    parsed = datetime.fromisoformat(str(value).strip())
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def format_date(value):
+    return value.isoformat(timespec='seconds') if value else None
+
+
+# Readers: each yields post and comment records in a stable order, so positions can be resumed
+
+def read_ndjson(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def _front_matter_value(value):
+    # Values are written as JSON, which YAML also reads; hand-written files may use bare YAML scalars
+    try:
+        return json.loads(value)
+    except ValueError:
+        if value.startswith('[') and value.endswith(']'):
+            return [_front_matter_value(item.strip()) for item in value[1:-1].split(',') if item.strip()]
+        return value.strip('\'"')
+
+def parse_front_matter(text):
+    """(metadata, body) of a Markdown file; supports ``key: value`` lines and ``- item`` lists"""
+    match = FRONT_MATTER.match(text)
+    if not match:
+        return {}, text
+    meta, key = {}, None
+    for line in match.group(1).splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith('#'):
+            continue
+        if stripped.startswith('- ') and key is not None:
+            if not isinstance(meta.get(key), list):
+                meta[key] = []
+            meta[key].append(_front_matter_value(stripped[2:].strip()))
+            continue
+        key, _, value = line.partition(':')
+        key = key.strip()
+        meta[key] = _front_matter_value(value.strip()) if value.strip() else None
+    return meta, text[match.end():]
+
+def markdown_record(meta, body, default_slug):
+    # Hugo and Jekyll files carry lists of categories and may give a single tag as a string
+    categories, tags = meta.get('categories') or [], meta.get('tags') or []
+    if not isinstance(categories, list):
+        categories = [categories]
+    if not isinstance(tags, list):
+        tags = [tags]
+    published = meta['published'] if 'published' in meta else not meta.get('draft', False)
+    return {
+        'type': 'post',
+        'slug': str(meta.get('slug') or default_slug),
+        'title': str(meta.get('title') or default_slug),
+        'content': body.strip('\n'),
+        'excerpt': meta.get('excerpt') or meta.get('description'),
+        'published': bool(published),
+        'created_at': meta.get('date'),
+        'updated_at': meta.get('updated') or meta.get('lastmod'),
+        'category': meta.get('category') or (categories[0] if categories else None),
+        'tags': [str(tag) for tag in tags],
+        'cover_image': meta.get('cover_image') or meta.get('image'),
+    }
+
+def read_markdown(directory):
+    posts = os.path.join(directory, 'posts')
+    for name in sorted(name for name in os.listdir(posts) if name.endswith('.md')):
+        with open(os.path.join(posts, name), encoding='utf-8') as f:
+            meta, body = parse_front_matter(f.read())
+        yield markdown_record(meta, body, name[:-3])
+    comments = os.path.join(directory, 'comments.ndjson')
+    if os.path.exists(comments):
+        yield from read_ndjson(comments)
+
+def _wxr_name(tag):
+    if not tag.startswith('{'):
+        return tag
+    uri, local = tag[1:].split('}', 1)
+    for prefix, marker in WXR_NAMESPACES:
+        if marker in uri:
+            return f'{prefix}:{local}'
+    return local
+
+def read_wxr(path):
+    """Posts (not pages or attachments) and their comments, item by item"""
+    channel = None
+    for event, element in ElementTree.iterparse(path, events=('start', 'end')):
+        name = _wxr_name(element.tag)
+        if event == 'start':
+            if name == 'channel':
+                channel = element
+            continue
+        if name != 'item':
+            continue
+        fields, categories, tags, comments = {}, [], [], []
+        for child in element:
+            child_name = _wxr_name(child.tag)
+            if child_name == 'category':
+                {'category': categories, 'post_tag': tags}.get(child.get('domain'), []).append((child.text or '').strip())
+            elif child_name == 'wp:comment':
+                comments.append({_wxr_name(field.tag): field.text or '' for field in child})
+            else:
+                fields[child_name] = child.text or ''
+        # Parsed items are dropped so memory stays flat however long the file is
+        if channel is not None:
+            channel.clear()
+        if fields.get('wp:post_type', 'post') != 'post' or fields.get('wp:status') == 'trash':
+            continue
+        slug = fields.get('wp:post_name') or slugify(fields.get('title', ''))
+        yield {
+            'type': 'post',
+            'slug': slug,
+            'title': fields.get('title') or slug,
+            'content': fields.get('content:encoded', ''),
+            'excerpt': fields.get('excerpt:encoded') or None,
+            'published': fields.get('wp:status') == 'publish',
+            'created_at': fields.get('wp:post_date_gmt') if parse_date(fields.get('wp:post_date_gmt')) else fields.get('wp:post_date'),
+            'updated_at': fields.get('wp:post_modified_gmt') if parse_date(fields.get('wp:post_modified_gmt')) else fields.get('wp:post_modified'),
+            'category': categories[0] if categories else None,
+            'tags': tags,
+            'cover_image': None,
+        }
+        for comment in comments:
+            if comment.get('wp:comment_type') not in ('', 'comment') or comment.get('wp:comment_approved') not in ('0', '1'):
+                continue  # pingbacks, spam and trash
+            yield {
+                'type': 'comment',
+                'post': slug,
+                'name': comment.get('wp:comment_author'),
+                'email': comment.get('wp:comment_author_email'),
+                'content': comment.get('wp:comment_content', ''),
+                'approved': comment.get('wp:comment_approved') == '1',
+                'created_at': comment.get('wp:comment_date_gmt') or comment.get('wp:comment_date'),
+            }
+
+READERS = {'ndjson': read_ndjson, 'markdown': read_markdown, 'wxr': read_wxr}
+
+
+# Media
+
+def _media_files(directory):
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(MEDIA_EXTENSIONS):
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, directory).replace(os.sep, '/'), path
+
+def copy_media_in(directory, workers=MEDIA_WORKERS, dry_run=False):
+    """Store every image under ``directory`` by its content; returns {relative path: storage key}"""
+    def store(item):
+        relative, path = item
+        with open(path, 'rb') as f:
+            data = f.read()
+        try:
+            extension = IMAGE_EXTENSIONS[probe(io.BytesIO(data))[0]]
+        except InvalidImage:
+            return relative, None
+        # Stored like uploads: without metadata, under the hash of the stored bytes
+        data = strip_metadata(data)
+        key = content_key(data, extension)
+        if not dry_run and not upload_storage.exists(key):
+            upload_storage.save(key, io.BytesIO(data), IMAGE_CONTENT_TYPES[extension])
+        return relative, key
+
+    with ThreadPoolExecutor(workers) as executor:
+        media = {relative: key for relative, key in executor.map(store, _media_files(directory)) if key}
+    if not dry_run and media:
+        # Registered as pending; process_images.py renders their variants
+        keys = sorted(set(media.values()))
+        with db.engine.begin() as connection:
+            for start in range(0, len(keys), BATCH_SIZE):
+                chunk = keys[start:start + BATCH_SIZE]
+                known = set(connection.execute(db.select(ImageAsset.filename).where(ImageAsset.filename.in_(chunk))).scalars())
+                new = [{'filename': key, 'status': 'pending', 'uploaded_at': datetime.utcnow()} for key in chunk if key not in known]
+                if new:
+                    connection.execute(ImageAsset.__table__.insert(), new)
+    return media
+
+def copy_media_out(keys, directory, workers=MEDIA_WORKERS):
+    """Copy the stored images ``keys`` to ``directory`` under their keys; returns how many were copied"""
+    def fetch(key):
+        target = os.path.join(directory, *key.split('/'))
+        if os.path.exists(target) or not upload_storage.exists(key):
+            return 0
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with upload_storage.open(key) as stream, open(target, 'wb') as f:
+            f.write(stream.read())
+        return 1
+
+    with ThreadPoolExecutor(workers) as executor:
+        return sum(executor.map(fetch, keys))
+
+
+# Import
+
+class Importer:
+    """Writes batches of records through ``connection``, keeping the state the ORM events
+    maintain for single rows (rendered HTML, search index, counters, comment counts and
+    upload references) in step with the inserted rows"""
+
+    def __init__(self, connection, first_post_id, media=None, render=map, warn=print):
+        self.connection = connection
+        self.first_post_id = first_post_id
+        self.media = media or {}
+        self.render = render
+        self.warn = warn
+        self._urls = {}
+        self.categories = dict(connection.execute(db.select(Category.slug, Category.id)).all())
+        self.tags = dict(connection.execute(db.select(Tag.slug, Tag.id)).all())
+        self.stats = dict.fromkeys(('posts', 'skipped_posts', 'comments', 'skipped_comments', 'categories', 'tags'), 0)
+
+    def import_batch(self, records):
+        posts = [record for record in records if record.get('type') == 'post']
+        comments = [record for record in records if record.get('type') == 'comment']
+        categories, tags = self.stats['categories'], self.stats['tags']
+        if posts:
+            self._insert_posts(posts)
+        if comments:
+            self._insert_comments(comments)
+        _adjust_counter(self.connection, 'categories', self.stats['categories'] - categories)
+        _adjust_counter(self.connection, 'tags', self.stats['tags'] - tags)
+
+    def _media_key(self, path):
+        parts = path.split('/')
+        for start in range(len(parts)):
+            key = self.media.get('/'.join(parts[start:]))
+            if key:
+                return key
+        return None
+
+    def rewrite_media(self, text):
+        """Point images found in the imported media at their stored copies"""
+        if not self.media or not text:
+            return text
+        def replace(match):
+            key = self._media_key(match.group(1))
+            if key is None:
+                return match.group(0)
+            if key not in self._urls:
+                self._urls[key] = upload_url(key)
+            return self._urls[key]
+        return MEDIA_REFERENCE.sub(replace, text)
+
+    def _cover_image(self, value):
+        if not value:
+            return None
+        match = MEDIA_REFERENCE.search(value)
+        key = self._media_key(match.group(1)) if match else None
+        # Otherwise only an upload already in this blog's storage, named by its content hash
+        if key is None and is_content_key(value) and upload_storage.exists(value):
+            key = value
+        if key is None:
+            self.warn(f"  Skipping cover image {value!r}: not found in the imported media")
+        return key
+
+    def _taxonomy_id(self, model, ids, name, length):
+        name = (name or '').strip()[:length]
+        slug = slugify(name)[:length]
+        if not slug:
+            return None
+        if slug not in ids:
+            ids[slug] = self.connection.execute(model.__table__.insert().values(name=name, slug=slug)).inserted_primary_key[0]
+            self.stats['categories' if model is Category else 'tags'] += 1
+        return ids[slug]
+
+    def _insert_posts(self, records):
+        connection = self.connection
+        slugs = {}
+        for record in records:
+            slug = slugify(str(record.get('slug') or record.get('title') or ''))[:200]
+            if not slug or slug in slugs:
+                self.stats['skipped_posts'] += 1
+                continue
+            slugs[slug] = record
+        existing = set(connection.execute(db.select(Post.slug).where(Post.slug.in_(list(slugs)))).scalars())
+        self.stats['skipped_posts'] += len(existing)
+        rows, tag_names = [], {}
+        now = datetime.utcnow()
+        for slug, record in slugs.items():
+            if slug in existing:
+                continue
+            content = self.rewrite_media(record.get('content') or '')
+            created_at = parse_date(record.get('created_at')) or now
+            rows.append({
+                'slug': slug,
+                'title': (record.get('title') or slug)[:200],
+                'content': content,
+                'content_hash': content_digest(content),
+                'excerpt': record.get('excerpt'),
+                'cover_image': self._cover_image(record.get('cover_image')),
+                'published': bool(record.get('published', True)),
+                'category_id': self._taxonomy_id(Category, self.categories, record.get('category'), 100) if record.get('category') else None,
+                'created_at': created_at,
+                'updated_at': parse_date(record.get('updated_at')) or created_at,
+            })
+            tag_names[slug] = record.get('tags') or []
+        if not rows:
+            return
+        for row, html in zip(rows, self.render(render_markdown, [row['content'] for row in rows])):
+            row['content_html'] = html
+        # One executemany, then the ids by slug: SQLite cannot batch a RETURNING that keeps the row order
+        connection.execute(Post.__table__.insert(), rows)
+        post_ids = dict(connection.execute(db.select(Post.slug, Post.id).where(Post.slug.in_([row['slug'] for row in rows]))).all())
+        tag_rows, references, search_rows = [], [], []
+        for row in rows:
+            slug = row['slug']
+            post_id = post_ids[slug]
+            tag_ids = {self._taxonomy_id(Tag, self.tags, name, 50) for name in tag_names[slug]} - {None}
+            tag_rows.extend({'post_id': post_id, 'tag_id': tag_id} for tag_id in sorted(tag_ids))
+            filenames = ({row['cover_image']} if row['cover_image'] else set()) | referenced_uploads(row['content'])
+            references.extend({'owner': 'post:%d' % post_id, 'filename': filename} for filename in sorted(filenames))
+            if row['published']:
+                search_rows.append({'id': post_id, 'title': row['title'], 'excerpt': row['excerpt'] or '', 'content': row['content']})
+        if tag_rows:
+            connection.execute(post_tags.insert(), tag_rows)
+        if references:
+            connection.execute(UploadReference.__table__.insert(), references)
+        if search_rows and connection.dialect.name == 'sqlite' and search_index_ready(connection):
+            connection.execute(db.text('INSERT INTO post_fts (rowid, title, excerpt, content) VALUES (:id, :title, :excerpt, :content)'),
+                               search_rows)
+        _adjust_counter(connection, 'posts', len(rows))
+        _adjust_counter(connection, 'published_posts', sum(1 for row in rows if row['published']))
+        if search_rows:
+            touch_listings(connection)
+        self.stats['posts'] += len(rows)
+
+    def _insert_comments(self, records):
+        connection = self.connection
+        slugs = {str(record.get('post') or '') for record in records}
+        # Only posts this import created take comments, so importing a file twice adds none
+        post_ids = dict(connection.execute(db.select(Post.slug, Post.id).where(
+            Post.slug.in_(list(slugs)), Post.id >= self.first_post_id)).all())
+        rows = []
+        for record in records:
+            post_id = post_ids.get(str(record.get('post') or ''))
+            if post_id is None or not record.get('content'):
+                self.stats['skipped_comments'] += 1
+                continue
+            rows.append({
+                'post_id': post_id,
+                'name': (record.get('name') or 'Anonymous')[:100],
+                'email': (record.get('email') or '')[:120],
+                'content': record['content'],
+                'approved': bool(record.get('approved')),
+                'created_at': parse_date(record.get('created_at')) or datetime.utcnow(),
+            })
+        if not rows:
+            return
+        connection.execute(Comment.__table__.insert(), rows)
+        approved_posts = sorted({row['post_id'] for row in rows if row['approved']})
+        if approved_posts:
+            recount_comments(connection, approved_posts)
+        _adjust_counter(connection, 'pending_comments', sum(1 for row in rows if not row['approved']))
+        self.stats['comments'] += len(rows)
+
+def run_import(records, source, media_dir=None, batch_size=BATCH_SIZE, workers=MEDIA_WORKERS, dry_run=False,
+               restart=False, render_workers=1, progress=print):
+    """Import ``records`` from ``source`` (its identity for the checkpoint); returns the import's stats.
+
+    A dry run does all the work inside one transaction and rolls it back, leaving no trace.
+    """
+    checkpoints = ImportCheckpoint.__table__
+    started = time.perf_counter()
+    renderer = ProcessPoolExecutor(render_workers) if render_workers > 1 else nullcontext()
+    with renderer, db.engine.connect() as connection, app.test_request_context():
+        outer = connection.begin()
+        if restart and not dry_run:
+            connection.execute(checkpoints.delete().where(checkpoints.c.source == source))
+        checkpoint = connection.execute(db.select(checkpoints).where(checkpoints.c.source == source)).first()
+        if checkpoint is None:
+            position = 0
+            first_post_id = (connection.execute(db.select(db.func.max(Post.id))).scalar() or 0) + 1
+            connection.execute(checkpoints.insert().values(source=source, position=0, first_post_id=first_post_id,
+                                                           updated_at=datetime.utcnow()))
+        else:
+            position, first_post_id = checkpoint.position, checkpoint.first_post_id
+            progress(f"Resuming after {position} records")
+        if not dry_run:
+            outer.commit()
+
+        media = copy_media_in(media_dir, workers, dry_run) if media_dir else {}
+        if media_dir:
+            progress(f"✓ {len(media)} media files {'found' if dry_run else 'stored'}")
+        if not dry_run:
+            connection.begin()
+        render = partial(renderer.map, chunksize=max(1, batch_size // (render_workers * 4))) if render_workers > 1 else map
+        importer = Importer(connection, first_post_id, media, render, progress)
+        if not dry_run:
+            connection.commit()
+
+        def flush(batch, consumed):
+            transaction = connection.begin_nested() if dry_run else connection.begin()
+            with transaction:
+                importer.import_batch(batch)
+                connection.execute(checkpoints.update().where(checkpoints.c.source == source).values(
+                    position=consumed, updated_at=datetime.utcnow()))
+            stats = importer.stats
+            rate = (consumed - position) / (time.perf_counter() - started)
+            progress(f"  {consumed} records: {stats['posts']} posts, {stats['comments']} comments ({rate:.0f} records/s)")
+
+        batch, consumed = [], position
+        for index, record in enumerate(records):
+            if index < position:
+                continue
+            batch.append(record)
+            consumed = index + 1
+            if len(batch) == batch_size:
+                flush(batch, consumed)
+                batch = []
+        if batch:
+            flush(batch, consumed)
+
+        if dry_run:
+            outer.rollback()
+        else:
+            with connection.begin():
+                connection.execute(checkpoints.delete().where(checkpoints.c.source == source))
+    if not dry_run:
+        # Running workers drop their cached listings, and their navigation if categories were added
+        if importer.stats['categories']:
+            chrome_cache.invalidate()
+        purge_page_cache('posts')
+        db.session.commit()
+    return importer.stats
+
+
+# Export
+
+def export_posts(connection):
+    """Post records in id order, read in chunks"""
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            db.select(Post.id, Post.slug, Post.title, Post.content, Post.excerpt, Post.published, Post.created_at,
+                      Post.updated_at, Post.cover_image, Category.name.label('category'))
+            .outerjoin(Category, Post.category_id == Category.id)
+            .where(Post.id > last_id).order_by(Post.id).limit(EXPORT_CHUNK)).all()
+        if not rows:
+            return
+        tags = {}
+        for post_id, name in connection.execute(db.select(post_tags.c.post_id, Tag.name).join(Tag, Tag.id == post_tags.c.tag_id)
+                                                .where(post_tags.c.post_id.in_([row.id for row in rows])).order_by(Tag.name)):
+            tags.setdefault(post_id, []).append(name)
+        for row in rows:
+            yield {'type': 'post', 'slug': row.slug, 'title': row.title, 'content': row.content, 'excerpt': row.excerpt,
+                   'published': bool(row.published), 'created_at': format_date(row.created_at),
+                   'updated_at': format_date(row.updated_at), 'category': row.category, 'tags': tags.get(row.id, []),
+                   'cover_image': row.cover_image}
+        last_id = rows[-1].id
+
+def export_comments(connection):
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            db.select(Comment.id, Post.slug, Comment.name, Comment.email, Comment.content, Comment.approved, Comment.created_at)
+            .join(Post, Post.id == Comment.post_id).where(Comment.id > last_id).order_by(Comment.id).limit(EXPORT_CHUNK)).all()
+        if not rows:
+            return
+        for row in rows:
+            yield {'type': 'comment', 'post': row.slug, 'name': row.name, 'email': row.email, 'content': row.content,
+                   'approved': bool(row.approved), 'created_at': format_date(row.created_at)}
+        last_id = rows[-1].id
+
+def front_matter(record):
+    lines = ['---']
+    for name, field in FRONT_MATTER_FIELDS:
+        value = record.get(field)
+        if value not in (None, '', []):
+            lines.append(f'{name}: {json.dumps(value, ensure_ascii=False)}')
+    lines += ['---', record['content'], '']
+    return '\n'.join(lines)
+
+def run_export(format, destination, media=True, workers=MEDIA_WORKERS, progress=print):
+    """Write every post and comment to ``destination``; returns (posts, comments, media files)"""
+    if format == 'markdown':
+        os.makedirs(os.path.join(destination, 'posts'), exist_ok=True)
+        comments_path, media_dir = os.path.join(destination, 'comments.ndjson'), os.path.join(destination, 'media')
+    else:
+        comments_path, media_dir = destination, destination + '.media'
+    media_keys = set()
+    posts = comments = 0
+    with db.engine.connect() as connection, open(comments_path, 'w', encoding='utf-8') as out:
+        for record in export_posts(connection):
+            if format == 'markdown':
+                with open(os.path.join(destination, 'posts', record['slug'] + '.md'), 'w', encoding='utf-8') as f:
+                    f.write(front_matter(record))
+            else:
+                out.write(json.dumps(record, ensure_ascii=False) + '\n')
+            if media:
+                media_keys |= ({record['cover_image']} if record['cover_image'] else set()) | referenced_uploads(record['content'])
+            posts += 1
+            if posts % 10000 == 0:
+                progress(f"  {posts} posts")
+        for record in export_comments(connection):
+            out.write(json.dumps(record, ensure_ascii=False) + '\n')
+            comments += 1
+    copied = copy_media_out(sorted(media_keys), media_dir, workers) if media_keys else 0
+    return posts, comments, copied
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    export = commands.add_parser('export', help='write every post and comment')
+    export.add_argument('format', choices=('ndjson', 'markdown'))
+    export.add_argument('destination', help='file (ndjson) or directory (markdown) to write')
+    export.add_argument('--no-media', action='store_true', help='leave the images out')
+    export.add_argument('--workers', type=int, default=MEDIA_WORKERS, help=f'parallel image copies (default: {MEDIA_WORKERS})')
+    load = commands.add_parser('import', help='add posts and comments')
+    load.add_argument('format', choices=tuple(READERS))
+    load.add_argument('source', help='file (ndjson, wxr) or directory (markdown) to read')
+    load.add_argument('--media', help='directory of images the content refers to (default: next to the source)')
+    load.add_argument('--batch-size', type=int, default=BATCH_SIZE, help=f'records per transaction (default: {BATCH_SIZE})')
+    load.add_argument('--workers', type=int, default=MEDIA_WORKERS, help=f'parallel image copies (default: {MEDIA_WORKERS})')
+    load.add_argument('--render-workers', type=int, default=RENDER_WORKERS,
+                      help=f'processes rendering Markdown (default: one per CPU, {RENDER_WORKERS})')
+    load.add_argument('--dry-run', action='store_true', help='check and count everything, then roll it back')
+    load.add_argument('--restart', action='store_true', help='ignore the checkpoint of an interrupted import')
+    return parser.parse_args()
+
+def default_media_dir(format, source):
+    directory = {'ndjson': source + '.media', 'markdown': os.path.join(source, 'media')}.get(format)
+    return directory if directory and os.path.isdir(directory) else None
+
+def main():
+    args = parse_args()
+    with app.app_context():
+        upgrade()
+        started = time.perf_counter()
+        if args.command == 'export':
+            posts, comments, media = run_export(args.format, args.destination, not args.no_media, args.workers)
+            print(f"✓ Exported {posts} posts, {comments} comments and {media} media files in {time.perf_counter() - started:.0f}s")
+            return
+        source = os.path.abspath(args.source)
+        media_dir = args.media or default_media_dir(args.format, source)
+        stats = run_import(READERS[args.format](source), f'{args.format}:{source}'[:500], media_dir, args.batch_size,
+                           args.workers, args.dry_run, args.restart, args.render_workers)
+        print(f"{'Dry run: would import' if args.dry_run else '✓ Imported'} {stats['posts']} posts "
+              f"({stats['skipped_posts']} skipped as existing or duplicate) and {stats['comments']} comments "
+              f"({stats['skipped_comments']} skipped), adding {stats['categories']} categories and {stats['tags']} tags, "
+              f"in {time.perf_counter() - started:.0f}s")
+        if media_dir and not args.dry_run:
+            print("Run python process_images.py to render variants of the imported images")
+
+if __name__ == '__main__':
+    try:
+        main()
+    except (OSError, ValueError, ElementTree.ParseError) as exc:
+        sys.exit(f"✗ {exc}")